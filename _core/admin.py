@@ -5,12 +5,14 @@ from django.contrib import admin
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
-from django.db.models import Count, Q, Avg, Sum
+from django.db.models import Count, Q, Avg, Sum, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 
 from a_family.models import User, Family
-from a_tasks.models import Task, TaskRecurrence
+from a_tasks.history_utils import get_completed_task_count
+from a_tasks.models import Task, TaskHistory, TaskRecurrence
 from a_rewards.models import Reward
 from a_subscription.models import Subscription
 
@@ -61,8 +63,10 @@ class AdminDashboardView(TemplateView):
         avg_family_size = families_with_sizes.aggregate(Avg('size'))['size__avg'] or 0
 
         # ========== TASK STATISTICS ==========
-        total_tasks = Task.objects.count()
-        completed_tasks = Task.objects.filter(completed=True).count()
+        # Finished tasks are moved to TaskHistory by daily maintenance, so count both
+        archived_tasks = TaskHistory.objects.count()
+        total_tasks = Task.objects.count() + archived_tasks
+        completed_tasks = Task.objects.filter(completed=True).count() + archived_tasks
         completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         
         # Tasks by priority
@@ -77,8 +81,8 @@ class AdminDashboardView(TemplateView):
         tasks_created_30d = Task.objects.filter(created_at__gte=days_30_ago).count()
         
         # Tasks completed in time periods
-        tasks_completed_7d = Task.objects.filter(completed=True, completed_at__gte=days_7_ago).count()
-        tasks_completed_30d = Task.objects.filter(completed=True, completed_at__gte=days_30_ago).count()
+        tasks_completed_7d = get_completed_task_count(days_7_ago)
+        tasks_completed_30d = get_completed_task_count(days_30_ago)
         
         # Average tasks per family
         families_with_task_counts = Family.objects.annotate(
@@ -124,8 +128,14 @@ class AdminDashboardView(TemplateView):
 
         # ========== ENGAGEMENT METRICS ==========
         # Most active families (by task completion)
+        archived_per_family = TaskHistory.objects.filter(family=OuterRef('pk')).order_by().values(
+            'family'
+        ).annotate(count=Count('id')).values('count')
         most_active_families = Family.objects.annotate(
-            completed_task_count=Count('tasks', filter=Q(tasks__completed=True))
+            live_completed=Count('tasks', filter=Q(tasks__completed=True)),
+            archived_completed=Coalesce(Subquery(archived_per_family), 0),
+        ).annotate(
+            completed_task_count=F('live_completed') + F('archived_completed')
         ).order_by('-completed_task_count')[:10]
         
         # Average points per user
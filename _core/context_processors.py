@@ -3,7 +3,8 @@ Context processors to provide common data to all templates
 """
 from django.conf import settings
 
-from a_subscription.utils import get_family_subscription, has_shopping_list_access
+from a_family.utils import FamilyContext, get_request_family
+from a_subscription.utils import has_shopping_list_access
 
 
 def debug_context(request):
@@ -23,15 +24,12 @@ def subscription_context(request):
         }
     
     # Get user's family
-    family = None
-    if hasattr(request.user, "families"):
-        family = request.user.families.first()
-    if family is None:
-        from a_family.models import Family
-        family = Family.objects.filter(owner=request.user).first()
+    # Resolved once per request by a_family.middleware.FamilyContextMiddleware
+    family = get_request_family(request)
+    family_context = getattr(request, 'family_context', None) or FamilyContext(request.user, family)
     
     # Get subscription tier
-    tier = get_family_subscription(family) if family else 'FREE'
+    tier = family_context.tier
     
     # Check shopping list access (for all users if subscription allows it)
     shopping_access = False
@@ -42,5 +40,6 @@ def subscription_context(request):
         'has_shopping_list_access': shopping_access,
         'user_subscription_tier': tier,
         'user_family': family,
+        'family_role': family_context.role,
     }
 
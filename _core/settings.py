@@ -117,6 +117,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'a_family.middleware.EmailVerificationMiddleware',  # Check email verification
+    'a_family.middleware.FamilyContextMiddleware',  # request.family / request.family_context
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -219,6 +220,50 @@ else:
         }
     }
 
+# Nightly maintenance processes rows in primary-key batches (a_tasks.batch_utils)
+MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '1000'))
+MAINTENANCE_BATCH_SLEEP = float(os.getenv('MAINTENANCE_BATCH_SLEEP', '0.05'))  # seconds between batches
+
+# SubscriptionUsage periods older than this are rolled up into yearly totals and deleted
+SUBSCRIPTION_USAGE_RETENTION_DAYS = int(os.getenv('SUBSCRIPTION_USAGE_RETENTION_DAYS', '400'))
+
+# Cache shared by all gunicorn workers and the scheduler. Family rosters and landing pages
+# are invalidated by whichever process changes them, so production with more than one
+# worker (WEB_CONCURRENCY > 1) must set REDIS_URL; without it each process keeps its own
+# LocMemCache and only sees its own invalidations.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Family rosters (a_family.roster_utils) are cached per family and invalidated on change.
+# Points are always read live; without a shared cache keep membership changes from
+# other workers stale for at most a short time.
+FAMILY_ROSTER_CACHE_SECONDS = int(os.getenv('FAMILY_ROSTER_CACHE_SECONDS', '300' if REDIS_URL else '30'))
+
+# Seconds between runs of the deferred family/account deletion worker (a_family.deletion_utils)
+DELETION_POLL_SECONDS = int(os.getenv('DELETION_POLL_SECONDS', '60'))
+
+# Landing pages (a_landing.cache_utils): seconds the rendered HTML is cached (0 disables,
+# the default with DEBUG) and the Cache-Control max-age sent to browsers and CDNs
+LANDING_PAGE_CACHE_SECONDS = int(os.getenv('LANDING_PAGE_CACHE_SECONDS', '0' if DEBUG else '3600'))
+LANDING_PAGE_MAX_AGE = int(os.getenv('LANDING_PAGE_MAX_AGE', '300'))
+
+# Serve landing pages prerendered by `manage.py prerender_landing` with WhiteNoise
+LANDING_PRERENDER = os.getenv('LANDING_PRERENDER', 'False').lower() == 'true'
+LANDING_PRERENDER_DIR = BASE_DIR / 'prerendered'
+
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -284,6 +329,10 @@ else:
 # WhiteNoise settings
 WHITENOISE_USE_FINDERS = True  # Allow WhiteNoise to find static files during development
 WHITENOISE_AUTOREFRESH = DEBUG  # Auto-refresh in development
+if LANDING_PRERENDER:
+    # Prerendered landing pages are served from the site root, e.g. / -> index.html
+    WHITENOISE_ROOT = LANDING_PRERENDER_DIR
+    WHITENOISE_INDEX_FILE = True
 
 # Media files (User uploads)
 # https://docs.djangoproject.com/en/5.2/topics/files/
@@ -320,6 +369,23 @@ STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', None)
 # If not set, URLs will be built from request (useful for local development)
 STRIPE_BASE_URL = os.getenv('STRIPE_BASE_URL', None)
 
+# Optional override for the Stripe API host, e.g. http://localhost:12111 for stripe-mock
+# or another local stand-in. Leave unset to talk to api.stripe.com.
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', None)
+
+# Stripe gateway (a_subscription.stripe_gateway): timeouts in seconds, retries,
+# per-process rate limit (requests per second) and circuit breaker.
+STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', '3'))
+STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', '10'))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', '2'))
+STRIPE_RATE_LIMIT = float(os.getenv('STRIPE_RATE_LIMIT', '20'))
+STRIPE_BREAKER_THRESHOLD = int(os.getenv('STRIPE_BREAKER_THRESHOLD', '5'))
+STRIPE_BREAKER_RESET_SECONDS = float(os.getenv('STRIPE_BREAKER_RESET_SECONDS', '30'))
+STRIPE_MAX_WORKERS = int(os.getenv('STRIPE_MAX_WORKERS', '8'))
+
+# Seconds between runs of the Stripe webhook inbox worker (a_subscription.events)
+STRIPE_EVENT_POLL_SECONDS = int(os.getenv('STRIPE_EVENT_POLL_SECONDS', '10'))
+
 
 # Stripe Price IDs
 # In production, these should be set via environment variables (production price IDs)
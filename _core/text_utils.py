@@ -0,0 +1,32 @@
+"""
+Text helpers shared by the apps.
+"""
+
+# Bullet prefixes that are stripped from pasted lines ("- Nõud", "• Leib", "* Tolm")
+BULLET_PREFIXES = ('- ', '• ', '* ')
+
+
+def split_pasted_lines(text):
+    """
+    Split pasted text into non-empty lines, stripping list bullets.
+    Accepts a string or an iterable of strings (JSON API).
+
+    Used by bulk task quick-add and bulk shopping list input.
+    """
+    if not text:
+        return []
+    if isinstance(text, str):
+        raw_lines = text.splitlines()
+    else:
+        raw_lines = [str(line) for line in text]
+
+    lines = []
+    for raw_line in raw_lines:
+        line = raw_line.strip()
+        for prefix in BULLET_PREFIXES:
+            if line.startswith(prefix):
+                line = line[len(prefix):].strip()
+                break
+        if line:
+            lines.append(line)
+    return lines
@@ -14,7 +14,10 @@ from django.urls import reverse
 from django.utils import timezone
 
 # Local application imports
+from a_family.deletion_utils import request_family_deletion, request_user_deletion
 from a_family.models import Family, User
+from a_subscription import stripe_gateway
+from a_subscription.customer_utils import forget_customer, get_or_create_customer_id
 from a_subscription.models import Subscription
 from a_subscription.utils import get_family_subscription, get_tier_from_price_id
 
@@ -63,14 +66,14 @@ def _sanitize_error_message(error_msg):
     return f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {django_settings.SUPPORT_EMAIL}"
 
 
-from a_family.utils import get_family_for_user as _get_family_for_user
+from a_family.utils import get_request_family
 
 
 @login_required
 def settings_base(request):
     """Main settings page with sidebar navigation"""
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
 
     # Set default role for owner if not set
     if family and family.owner_id == user.id and not user.role:
@@ -108,7 +111,7 @@ def settings_base(request):
 def general_settings(request):
     """General account settings"""
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
 
     # Set default role for owner if not set
     if family and family.owner_id == user.id and not user.role:
@@ -323,7 +326,7 @@ def general_settings(request):
 def notification_settings(request):
     """Notification preferences settings"""
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
 
     # Redirect users without email - they can't receive notifications
     if not user.email:
@@ -381,7 +384,7 @@ def notification_settings(request):
 def subscription_settings(request):
     """Subscription management settings - only for family owners"""
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
 
     # Only family owner can manage subscription - check access and redirect if not owner
     can_manage_subscription = False
@@ -431,7 +434,7 @@ def subscription_settings(request):
                 messages.error(request, _sanitize_error_message(str(e)))
                 return redirect(f"{reverse('a_account:settings')}?section=subscriptions")
             
-            stripe.api_key = django_settings.STRIPE_SECRET_KEY
+            stripe_gateway.configure()
             
             try:
                 # Build return URL - use STRIPE_BASE_URL if set, otherwise use request
@@ -455,7 +458,7 @@ def subscription_settings(request):
                 if hasattr(django_settings, 'STRIPE_CUSTOMER_PORTAL_ID') and django_settings.STRIPE_CUSTOMER_PORTAL_ID:
                     portal_params['configuration'] = django_settings.STRIPE_CUSTOMER_PORTAL_ID
                 
-                portal_session = stripe.billing_portal.Session.create(**portal_params)
+                portal_session = stripe_gateway.call(stripe.billing_portal.Session.create, **portal_params)
                 
                 return redirect(portal_session.url)
                 
@@ -475,7 +478,7 @@ def subscription_settings(request):
                             'return_url': return_url,
                             'locale': 'et',
                         }
-                        portal_session = stripe.billing_portal.Session.create(**portal_params_no_config)
+                        portal_session = stripe_gateway.call(stripe.billing_portal.Session.create, **portal_params_no_config)
                         return redirect(portal_session.url)
                     except Exception as retry_error:
                         logger.error(f"Stripe portal error (retry failed): {str(retry_error)}", exc_info=True)
@@ -524,7 +527,7 @@ def subscription_settings(request):
                 messages.error(request, _sanitize_error_message(str(e)))
                 return redirect(f"{reverse('a_account:settings')}?section=subscriptions")
             
-            stripe.api_key = django_settings.STRIPE_SECRET_KEY
+            stripe_gateway.configure()
             
             try:
                 # Check if billing_portal exists before accessing it
@@ -557,7 +560,7 @@ def subscription_settings(request):
                     portal_params['configuration'] = config_id
                 
                 # Create billing portal session
-                portal_session = stripe.billing_portal.Session.create(**portal_params)
+                portal_session = stripe_gateway.call(stripe.billing_portal.Session.create, **portal_params)
                 
                 return redirect(portal_session.url)
                 
@@ -580,7 +583,7 @@ def subscription_settings(request):
                             'return_url': return_url,
                             'locale': 'et',
                         }
-                        portal_session = stripe.billing_portal.Session.create(**portal_params_no_config)
+                        portal_session = stripe_gateway.call(stripe.billing_portal.Session.create, **portal_params_no_config)
                         return redirect(portal_session.url)
                     except Exception as retry_error:
                         logger.error(f"Stripe portal error (retry failed): {str(retry_error)}", exc_info=True)
@@ -609,7 +612,7 @@ def subscription_settings(request):
                 messages.error(request, _sanitize_error_message(str(e)))
                 return redirect(f"{reverse('a_account:settings')}?section=subscriptions")
             
-            stripe.api_key = django_settings.STRIPE_SECRET_KEY
+            stripe_gateway.configure()
             
             try:
                 # Get existing subscription
@@ -624,48 +627,26 @@ def subscription_settings(request):
                     messages.error(request, "Tellimuste haldamiseks peab olema e-posti aadress.")
                     return redirect(f"{reverse('a_account:settings')}?section=subscriptions")
                 
-                customer_id = existing_subscription.stripe_customer_id if existing_subscription else None
-                
-                if not customer_id:
-                    # Try to find existing customer by email
-                    try:
-                        customers = stripe.Customer.list(email=user.email, limit=1)
-                        if customers.data:
-                            customer_id = customers.data[0].id
-                            logger.info(f"Found existing Stripe customer {customer_id} for email {user.email}")
-                        else:
-                            # Create new customer
-                            customer = stripe.Customer.create(
-                                email=user.email,
-                                metadata={'user_id': str(user.id), 'family_id': str(family.id)}
-                            )
-                            customer_id = customer.id
-                            logger.info(f"Created new Stripe customer {customer_id} for user {user.id}")
-                    except Exception as e:
-                        error_msg = str(e)
-                        logger.error(f"Error finding/creating customer: {error_msg}", exc_info=True)
-                        messages.error(request, _sanitize_error_message(str(e)))
-                        return redirect(f"{reverse('a_account:settings')}?section=subscriptions")
-                else:
-                    try:
-                        customer = stripe.Customer.retrieve(customer_id)
-                    except Exception:
-                        # Customer doesn't exist, create new one
-                        customer = stripe.Customer.create(
-                            email=user.email,
-                            metadata={'user_id': str(user.id), 'family_id': str(family.id)}
-                        )
-                        customer_id = customer.id
-                        logger.info(f"Recreated Stripe customer {customer_id} for user {user.id}")
+                # Customer id from the local mapping; Stripe is only asked for accounts without one
+                try:
+                    customer_id = get_or_create_customer_id(user, family)
+                except Exception as e:
+                    error_msg = str(e)
+                    logger.error(f"Error finding/creating customer: {error_msg}", exc_info=True)
+                    messages.error(request, _sanitize_error_message(str(e)))
+                    return redirect(f"{reverse('a_account:settings')}?section=subscriptions")
                 
                 # If user has an active subscription, update it directly with proration
                 if existing_subscription and existing_subscription.stripe_subscription_id and existing_subscription.is_active():
                     try:
-                        # Retrieve the Stripe subscription
-                        stripe_subscription = stripe.Subscription.retrieve(existing_subscription.stripe_subscription_id)
-                        
-                        # Get current price ID and billing period from Stripe subscription
-                        current_price_id = stripe_subscription['items']['data'][0]['price']['id']
+                        # Current item and price come from the local snapshot (kept fresh by webhooks);
+                        # only rows synced before the snapshot existed need a Subscription.retrieve
+                        subscription_item_id = existing_subscription.stripe_item_id
+                        current_price_id = existing_subscription.stripe_price_id
+                        if not subscription_item_id or not current_price_id:
+                            stripe_subscription = stripe_gateway.call(stripe.Subscription.retrieve, existing_subscription.stripe_subscription_id)
+                            subscription_item_id = stripe_subscription['items']['data'][0]['id']
+                            current_price_id = stripe_subscription['items']['data'][0]['price']['id']
                         current_billing_period = _get_billing_period_from_price_id(current_price_id)
                         
                         # Validate billing period change if switching
@@ -674,9 +655,6 @@ def subscription_settings(request):
                             # This is allowed - Stripe will handle proration correctly
                             logger.info(f"User {user.id} changing billing period from {current_billing_period} to {billing_period}")
                         
-                        # Get the current subscription item ID
-                        subscription_item_id = stripe_subscription['items']['data'][0]['id']
-                        
                         # Verify the new price ID is valid
                         new_price_tier = get_tier_from_price_id(price_id)
                         if not new_price_tier or new_price_tier != tier:
@@ -686,7 +664,8 @@ def subscription_settings(request):
                         
                         # Update subscription with new price (prorated)
                         # Stripe will automatically handle proration when changing between monthly/yearly
-                        updated_subscription = stripe.Subscription.modify(
+                        updated_subscription = stripe_gateway.call(
+                            stripe.Subscription.modify,
                             existing_subscription.stripe_subscription_id,
                             items=[{
                                 'id': subscription_item_id,
@@ -702,8 +681,8 @@ def subscription_settings(request):
                         
                         # Update local subscription record using helper function
                         # This ensures immediate tier changes and proper downgrade handling
-                        from a_subscription.views import _update_subscription_from_stripe
-                        _update_subscription_from_stripe(existing_subscription, updated_subscription)
+                        from a_subscription.stripe_mapping import update_subscription_from_stripe
+                        update_subscription_from_stripe(existing_subscription, updated_subscription)
                         logger.info(
                             f"Updated subscription {existing_subscription.id} after plan change: "
                             f"tier={existing_subscription.tier}, status={existing_subscription.status}"
@@ -775,7 +754,16 @@ def subscription_settings(request):
                 else:
                     checkout_params['allow_promotion_codes'] = True
                 
-                checkout_session = stripe.checkout.Session.create(**checkout_params)
+                try:
+                    checkout_session = stripe_gateway.call(stripe.checkout.Session.create, **checkout_params)
+                except stripe.InvalidRequestError as e:
+                    if 'No such customer' not in str(e):
+                        raise
+                    # Mapped customer was deleted in Stripe: create a new one and retry once
+                    logger.warning(f"Stripe customer {customer_id} no longer exists, creating a new one for user {user.id}")
+                    forget_customer(customer_id)
+                    checkout_params['customer'] = get_or_create_customer_id(user, family)
+                    checkout_session = stripe_gateway.call(stripe.checkout.Session.create, **checkout_params)
                 
                 return redirect(checkout_session.url)
                 
@@ -818,6 +806,8 @@ def subscription_settings(request):
                 'tier': tier,
                 'display_tier': display_tier,
                 'subscription': subscription,
+                # From the locally cached Stripe snapshot, no Stripe call while rendering
+                'billing_period': _get_billing_period_from_price_id(subscription.stripe_price_id) if subscription else None,
             }
         except Exception as e:
             logger.error(f"Error loading subscription data: {str(e)}", exc_info=True)
@@ -858,9 +848,9 @@ def delete_account(request):
     if delete_children_choice not in ('delete', 'keep'):
         delete_children_choice = 'delete'
 
-    # Get family before deleting user
-    family = _get_family_for_user(user)
-    is_family_owner = family and family.owner == user if family else False
+    # Every family the user owns goes with the account, not only the selected one
+    owned_families = list(Family.objects.filter(owner=user, deletion_requested_at__isnull=True))
+    is_family_owner = bool(owned_families)
     
     # Check for active subscription if user is owner
     if is_family_owner:
@@ -873,52 +863,17 @@ def delete_account(request):
             messages.error(request, "Enne konto kustutamist pead tühistama aktiivse tellimuse. Palun mine tellimuste seadistustesse ja tühista tellimus.")
             return redirect(f"{reverse('a_account:settings')}?section=subscriptions")
     
-    # Handle family owner deletion
-    if family and is_family_owner:
-        child_accounts = list(family.members.filter(role=User.ROLE_CHILD))
-        if delete_children_choice == 'delete':
-            for child in child_accounts:
-                try:
-                    from allauth.account.models import EmailAddress
-                    EmailAddress.objects.filter(user=child).delete()
-                except Exception:
-                    pass
-                child.delete()
-        else:
-            for child in child_accounts:
-                family.members.remove(child)
-        
-        # Delete subscriptions
-        try:
-            subscriptions = Subscription.objects.filter(owner=user)
-            for subscription in subscriptions:
-                subscription.delete()
-        except Exception:
-            pass
-        
-        # Remove all members from family
-        family.members.clear()
-        
-        # Delete the family (this will CASCADE delete tasks)
-        family.delete()
-    elif family:
-        # Remove user from family if they're a member
-            family.members.remove(user)
+    # Handle family owner deletion; the families' data is purged in the background
+    for family in owned_families:
+        request_family_deletion(family, delete_children=delete_children_choice == 'delete')
     
-    # Delete EmailAddress records
-    try:
-        from allauth.account.models import EmailAddress
-        EmailAddress.objects.filter(user=user).delete()
-    except Exception:
-        pass
+    # Deactivate the account and drop memberships; purged in the background
+    request_user_deletion([user.id])
     
-    # Logout user before deleting
+    # Log out the deactivated user
     from django.contrib.auth import logout
     logout(request)
     
-    # Delete user account
-    user.delete()
-    
     messages.success(request, "Konto kustutatud edukalt.")
     return redirect('a_landing:landing_index')
 
@@ -13,6 +13,10 @@ urlpatterns = [
     # Tasks
     path('tasks/', views.get_tasks, name='tasks'),
     path('tasks/create/', views.create_task, name='create_task'),
+    path('tasks/bulk-create/', views.bulk_create_tasks, name='bulk_create_tasks'),
+    path('tasks/import/', views.import_data, name='import_data'),
+    path('tasks/bulk-approve/', views.bulk_approve_tasks, name='bulk_approve_tasks'),
+    path('tasks/bulk-reject/', views.bulk_reject_tasks, name='bulk_reject_tasks'),
     path('tasks/<int:task_id>/', views.update_task, name='update_task'),
     path('tasks/<int:task_id>/start/', views.start_task, name='start_task'),
     path('tasks/<int:task_id>/cancel/', views.cancel_task, name='cancel_task'),
@@ -29,13 +33,19 @@ urlpatterns = [
     # Family
     path('family/', views.get_family, name='family'),
     path('family/join/', views.join_family, name='join_family'),
+    path('families/', views.get_families, name='families'),
+    path('families/select/', views.select_family_view, name='select_family'),
     
     # Dashboard
     path('dashboard/', views.get_dashboard, name='dashboard'),
     
+    # Subscription
+    path('limits/', views.get_limits, name='limits'),
+    
     # Shopping List
     path('shopping/', views.get_shopping_list, name='shopping'),
     path('shopping/create/', views.create_shopping_item, name='create_shopping_item'),
+    path('shopping/bulk-create/', views.bulk_create_shopping_items, name='bulk_create_shopping_items'),
     path('shopping/<int:item_id>/', views.update_shopping_item, name='update_shopping_item'),
     path('shopping/<int:item_id>/delete/', views.delete_shopping_item, name='delete_shopping_item'),
 ]
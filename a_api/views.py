@@ -5,15 +5,30 @@ from django.contrib.auth import authenticate
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.utils import timezone
 from django.db import transaction
+from django.db.models import F
 
+from _core.text_utils import split_pasted_lines
 from a_family.models import User, Family
-from a_family.utils import get_family_for_user
+from a_family.roster_utils import get_family_roster, get_roster_member
+from a_family.utils import get_family_for_user, get_request_family, get_user_families, select_family
+from a_tasks import state_utils as task_state
 from a_tasks.models import Task
 from a_rewards.models import Reward
+from a_rewards.utils import (
+    CLAIM_ALREADY_CLAIMED,
+    CLAIM_INSUFFICIENT_POINTS,
+    CLAIM_NOT_FOUND,
+    claim_reward as _claim_reward,
+)
 from a_shopping.models import ShoppingListItem
-from a_subscription.utils import check_subscription_limit, increment_usage, has_shopping_list_access
+from a_subscription.utils import (
+    check_recurring_task_limit,
+    check_subscription_limit,
+    get_tier_limits,
+    has_shopping_list_access,
+    reserve_quota,
+)
 
 
 def _get_user_from_request(request):
@@ -27,6 +42,20 @@ def _json_response(data, status=200):
     """Helper to return JSON response"""
     return JsonResponse(data, status=status, safe=False)
 
+
+def _serialize_family(family):
+    """Family payload with owner and members, built from the cached roster"""
+    roster = get_family_roster(family)
+    owner = get_roster_member(roster, family.owner_id)
+    return {
+        'id': str(family.id),
+        'name': family.name,
+        'join_code': family.join_code,
+        'owner': owner.as_dict() if owner else None,
+        'members': [member.as_dict() for member in roster],
+        'created_at': family.created_at.isoformat(),
+    }
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def login(request):
@@ -54,40 +83,7 @@ def login(request):
         
         family_data = None
         if family:
-            members = list(family.members.all())
-            if family.owner not in members:
-                members.append(family.owner)
-            
-            members_data = []
-            for member in members:
-                members_data.append({
-                    'id': member.id,
-                    'username': member.username,
-                    'email': member.email,
-                    'first_name': member.first_name,
-                    'last_name': member.last_name,
-                    'role': member.role,
-                    'points': member.points,
-                    'display_name': member.get_display_name(),
-                })
-            
-            family_data = {
-                'id': str(family.id),
-                'name': family.name,
-                'join_code': family.join_code,
-                'owner': {
-                    'id': family.owner.id,
-                    'username': family.owner.username,
-                    'email': family.owner.email,
-                    'first_name': family.owner.first_name,
-                    'last_name': family.owner.last_name,
-                    'role': family.owner.role,
-                    'points': family.owner.points,
-                    'display_name': family.owner.get_display_name(),
-                },
-                'members': members_data,
-                'created_at': family.created_at.isoformat(),
-            }
+            family_data = _serialize_family(family)
         
         return _json_response({
             'user': {
@@ -124,44 +120,11 @@ def get_user(request):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     
     family_data = None
     if family:
-        members = list(family.members.all())
-        if family.owner not in members:
-            members.append(family.owner)
-        
-        members_data = []
-        for member in members:
-            members_data.append({
-                'id': member.id,
-                'username': member.username,
-                'email': member.email,
-                'first_name': member.first_name,
-                'last_name': member.last_name,
-                'role': member.role,
-                'points': member.points,
-                'display_name': member.get_display_name(),
-            })
-        
-        family_data = {
-            'id': str(family.id),
-            'name': family.name,
-            'join_code': family.join_code,
-            'owner': {
-                'id': family.owner.id,
-                'username': family.owner.username,
-                'email': family.owner.email,
-                'first_name': family.owner.first_name,
-                'last_name': family.owner.last_name,
-                'role': family.owner.role,
-                'points': family.owner.points,
-                'display_name': family.owner.get_display_name(),
-            },
-            'members': members_data,
-            'created_at': family.created_at.isoformat(),
-        }
+        family_data = _serialize_family(family)
     
     return _json_response({
         'user': {
@@ -227,40 +190,7 @@ def register(request):
             
             family_data = None
             if family:
-                members = list(family.members.all())
-                if family.owner not in members:
-                    members.append(family.owner)
-                
-                members_data = []
-                for member in members:
-                    members_data.append({
-                        'id': member.id,
-                        'username': member.username,
-                        'email': member.email,
-                        'first_name': member.first_name,
-                        'last_name': member.last_name,
-                        'role': member.role,
-                        'points': member.points,
-                        'display_name': member.get_display_name(),
-                    })
-                
-                family_data = {
-                    'id': str(family.id),
-                    'name': family.name,
-                    'join_code': family.join_code,
-                    'owner': {
-                        'id': family.owner.id,
-                        'username': family.owner.username,
-                        'email': family.owner.email,
-                        'first_name': family.owner.first_name,
-                        'last_name': family.owner.last_name,
-                        'role': family.owner.role,
-                        'points': family.owner.points,
-                        'display_name': family.owner.get_display_name(),
-                    },
-                    'members': members_data,
-                    'created_at': family.created_at.isoformat(),
-                }
+                family_data = _serialize_family(family)
             return _json_response({
                 'user': {
                     'id': user.id,
@@ -287,7 +217,7 @@ def get_tasks(request):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -328,6 +258,7 @@ def get_tasks(request):
             'created_at': task.created_at.isoformat(),
             'updated_at': task.updated_at.isoformat(),
             'is_in_progress': task.is_in_progress,
+            'version': task.version,
         })
     
     return _json_response(tasks_data)
@@ -344,7 +275,7 @@ def create_task(request):
     if user.role != User.ROLE_PARENT:
         return _json_response({'error': 'Only parents can create tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -360,14 +291,6 @@ def create_task(request):
         if not name:
             return _json_response({'error': 'Task name required'}, status=400)
         
-        # Check subscription limit
-        can_create, current_count, limit, tier = check_subscription_limit(family, 'tasks', 1)
-        if not can_create:
-            return _json_response({
-                'error': f'Task limit reached ({current_count}/{limit})',
-                'limit_reached': True,
-            }, status=403)
-        
         assigned_to = None
         if assigned_to_id:
             assigned_to = family.members.filter(id=assigned_to_id).first()
@@ -380,6 +303,14 @@ def create_task(request):
             due_date = parse_date(due_date_str)
         
         with transaction.atomic():
+            # Reserve quota first; rolled back together with the task on error
+            granted, current_count, limit, tier = reserve_quota(family, 'tasks', 1)
+            if not granted:
+                return _json_response({
+                    'error': f'Task limit reached ({current_count}/{limit})',
+                    'limit_reached': True,
+                }, status=403)
+            
             task = Task.objects.create(
                 name=name,
                 description=description,
@@ -391,8 +322,6 @@ def create_task(request):
                 points=points,
             )
             
-            increment_usage(family, 'tasks', 1)
-            
             return _json_response({
                 'id': task.id,
                 'name': task.name,
@@ -418,6 +347,104 @@ def create_task(request):
         return _json_response({'error': str(e)}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def bulk_create_tasks(request):
+    """Create many tasks from quick-add lines in one request"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
+    
+    if user.role != User.ROLE_PARENT:
+        return _json_response({'error': 'Only parents can create tasks'}, status=403)
+    
+    family = get_request_family(request)
+    if not family:
+        return _json_response({'error': 'No family found'}, status=404)
+    
+    try:
+        from a_tasks.bulk_utils import MAX_BULK_LINES, bulk_create_tasks as _bulk_create_tasks
+        
+        data = json.loads(request.body)
+        # Accept either a list of lines or one pasted text blob
+        lines = split_pasted_lines(data.get('lines') or data.get('text', ''))
+        
+        if not lines:
+            return _json_response({'error': 'At least one task line required'}, status=400)
+        
+        if len(lines) > MAX_BULK_LINES:
+            return _json_response({'error': f'At most {MAX_BULK_LINES} lines per request'}, status=400)
+        
+        result = _bulk_create_tasks(family, user, lines)
+        limit_error = result['limit_error']
+        if limit_error:
+            label = 'Task' if limit_error['resource'] == 'tasks' else 'Recurring task'
+            return _json_response({
+                'error': f"{label} limit reached ({limit_error['current']}/{limit_error['limit']})",
+                'limit_reached': True,
+            }, status=403)
+        
+        tasks_data = []
+        for task in result['created']:
+            tasks_data.append({
+                'id': task.id,
+                'name': task.name,
+                'assigned_to': {
+                    'id': task.assigned_to.id,
+                    'display_name': task.assigned_to.get_display_name(),
+                } if task.assigned_to else None,
+                'due_date': task.due_date.isoformat() if task.due_date else None,
+                'priority': task.priority,
+                'points': task.points,
+                'created_at': task.created_at.isoformat(),
+            })
+        
+        return _json_response({
+            'created': tasks_data,
+            'skipped': [{'line': line, 'reason': reason} for line, reason in result['skipped']],
+        }, status=201 if tasks_data else 400)
+    except json.JSONDecodeError:
+        return _json_response({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return _json_response({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def import_data(request):
+    """Import tasks, recurring tasks and rewards from an uploaded CSV/JSON/NDJSON file"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
+    
+    if user.role != User.ROLE_PARENT:
+        return _json_response({'error': 'Only parents can import data'}, status=403)
+    
+    family = get_request_family(request)
+    if not family:
+        return _json_response({'error': 'No family found'}, status=404)
+    
+    uploaded_file = request.FILES.get('file')
+    if not uploaded_file:
+        return _json_response({'error': 'File required'}, status=400)
+    
+    from a_tasks.import_utils import import_family_data, iter_import_rows
+    
+    try:
+        result = import_family_data(family, user, iter_import_rows(uploaded_file))
+    except Exception as e:
+        return _json_response({'error': str(e)}, status=500)
+    
+    created = result['tasks_created'] + result['rewards_created']
+    return _json_response({
+        'rows': result['rows'],
+        'tasks_created': result['tasks_created'],
+        'recurrences_created': result['recurrences_created'],
+        'rewards_created': result['rewards_created'],
+        'errors': [{'row': row, 'error': message} for row, message in result['errors']],
+    }, status=201 if created else 400)
+
+
 @csrf_exempt
 @require_http_methods(["PUT"])
 def update_task(request, task_id):
@@ -429,7 +456,7 @@ def update_task(request, task_id):
     if user.role != User.ROLE_PARENT:
         return _json_response({'error': 'Only parents can update tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -465,10 +492,16 @@ def update_task(request, task_id):
         if 'points' in data:
             task.points = int(data['points'])
         
-        task.save()
+        # Edits invalidate in-flight state transitions based on the old values.
+        # Only the editable fields are written, so a transition committed since
+        # the task was read (completed/approved/...) is not overwritten.
+        task.version = F('version') + 1
+        task.save(update_fields=['name', 'description', 'assigned_to', 'due_date', 'priority', 'points', 'version', 'updated_at'])
+        task.refresh_from_db(fields=['version'])
         
         return _json_response({
             'id': task.id,
+            'version': task.version,
             'name': task.name,
             'description': task.description,
             'assigned_to': {
@@ -485,6 +518,31 @@ def update_task(request, task_id):
         return _json_response({'error': str(e)}, status=500)
 
 
+def _get_expected_version(request):
+    """Optional task version sent by the client (JSON body or ?version=) for optimistic concurrency"""
+    raw_version = request.GET.get('version')
+    if raw_version is None and request.body:
+        try:
+            raw_version = json.loads(request.body).get('version')
+        except (json.JSONDecodeError, AttributeError):
+            raw_version = None
+    try:
+        return int(raw_version) if raw_version is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _transition_response(result, task, success_message):
+    """Map a task state machine result to a JSON response"""
+    if result == task_state.RESULT_OK:
+        return _json_response({'message': success_message, 'version': task.version})
+    error, status = task_state.RESULT_API_ERRORS.get(result, ('Task could not be updated', 400))
+    data = {'error': error, 'code': result}
+    if task is not None:
+        data['version'] = task.version
+    return _json_response(data, status=status)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def start_task(request, task_id):
@@ -496,29 +554,13 @@ def start_task(request, task_id):
     if user.role != User.ROLE_CHILD:
         return _json_response({'error': 'Only children can start tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
     try:
-        task = Task.objects.filter(family=family, id=task_id).first()
-        if not task:
-            return _json_response({'error': 'Task not found'}, status=404)
-        
-        if task.completed:
-            return _json_response({'error': 'Task already completed'}, status=400)
-        
-        if task.is_in_progress:
-            return _json_response({'error': 'Task already in progress'}, status=400)
-        
-        if task.assigned_to and task.assigned_to_id != user.id:
-            return _json_response({'error': 'Task assigned to another user'}, status=403)
-        
-        task.assigned_to = user
-        task.started_at = timezone.now()
-        task.save(update_fields=['assigned_to', 'started_at'])
-        
-        return _json_response({'message': 'Task started successfully'})
+        result, task = task_state.start_task(family, task_id, user, expected_version=_get_expected_version(request))
+        return _transition_response(result, task, 'Task started successfully')
     except Exception as e:
         return _json_response({'error': str(e)}, status=500)
 
@@ -534,26 +576,13 @@ def cancel_task(request, task_id):
     if user.role != User.ROLE_CHILD:
         return _json_response({'error': 'Only children can cancel tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
     try:
-        task = Task.objects.filter(family=family, id=task_id).first()
-        if not task:
-            return _json_response({'error': 'Task not found'}, status=404)
-        
-        if task.completed:
-            return _json_response({'error': 'Task already completed'}, status=400)
-        
-        if not task.is_in_progress or task.assigned_to_id != user.id:
-            return _json_response({'error': 'You can only cancel tasks you started'}, status=403)
-        
-        task.assigned_to = None
-        task.started_at = None
-        task.save(update_fields=['assigned_to', 'started_at'])
-        
-        return _json_response({'message': 'Task cancelled successfully'})
+        result, task = task_state.cancel_task(family, task_id, user, expected_version=_get_expected_version(request))
+        return _transition_response(result, task, 'Task cancelled successfully')
     except Exception as e:
         return _json_response({'error': str(e)}, status=500)
 
@@ -569,30 +598,13 @@ def complete_task(request, task_id):
     if user.role != User.ROLE_CHILD:
         return _json_response({'error': 'Only children can complete tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
     try:
-        task = Task.objects.filter(family=family, id=task_id).first()
-        if not task:
-            return _json_response({'error': 'Task not found'}, status=404)
-        
-        if task.completed:
-            return _json_response({'error': 'Task already completed'}, status=400)
-        
-        if not task.is_in_progress or task.assigned_to_id != user.id:
-            return _json_response({'error': 'You can only complete tasks you started'}, status=403)
-        
-        task.completed = True
-        task.completed_by = user
-        task.completed_at = timezone.now()
-        task.approved = False
-        task.approved_by = None
-        task.approved_at = None
-        task.save()
-        
-        return _json_response({'message': 'Task completed successfully'})
+        result, task = task_state.complete_task(family, task_id, user, expected_version=_get_expected_version(request))
+        return _transition_response(result, task, 'Task completed successfully')
     except Exception as e:
         return _json_response({'error': str(e)}, status=500)
 
@@ -608,35 +620,13 @@ def approve_task(request, task_id):
     if user.role != User.ROLE_PARENT:
         return _json_response({'error': 'Only parents can approve tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
     try:
-        task = Task.objects.filter(family=family, id=task_id).first()
-        if not task:
-            return _json_response({'error': 'Task not found'}, status=404)
-        
-        if not task.completed:
-            return _json_response({'error': 'Task is not completed'}, status=400)
-        
-        if task.approved:
-            return _json_response({'error': 'Task already approved'}, status=400)
-        
-        assignee = task.assigned_to or task.completed_by
-        if not assignee:
-            return _json_response({'error': 'Task has no assignee'}, status=400)
-        
-        with transaction.atomic():
-            task.approved = True
-            task.approved_by = user
-            task.approved_at = timezone.now()
-            task.save()
-            
-            assignee.points += task.points
-            assignee.save(update_fields=['points'])
-            
-            return _json_response({'message': 'Task approved successfully'})
+        result, task = task_state.approve_task(family, task_id, user, expected_version=_get_expected_version(request))
+        return _transition_response(result, task, 'Task approved successfully')
     except Exception as e:
         return _json_response({'error': str(e)}, status=500)
 
@@ -652,33 +642,110 @@ def unapprove_task(request, task_id):
     if user.role != User.ROLE_PARENT:
         return _json_response({'error': 'Only parents can unapprove tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
     try:
-        task = Task.objects.filter(family=family, id=task_id).first()
-        if not task:
-            return _json_response({'error': 'Task not found'}, status=404)
+        result, task = task_state.unapprove_task(family, task_id, user, expected_version=_get_expected_version(request))
+        return _transition_response(result, task, 'Task unapproved successfully')
+    except Exception as e:
+        return _json_response({'error': str(e)}, status=500)
+
+
+def _parse_task_ids(data):
+    """Read a list of integer task ids from a JSON body, ignoring invalid entries"""
+    task_ids = []
+    for raw_id in data.get('task_ids') or []:
+        try:
+            task_ids.append(int(raw_id))
+        except (TypeError, ValueError):
+            continue
+    return task_ids
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def bulk_approve_tasks(request):
+    """Approve many completed tasks in one request"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
+    
+    if user.role != User.ROLE_PARENT:
+        return _json_response({'error': 'Only parents can approve tasks'}, status=403)
+    
+    family = get_request_family(request)
+    if not family:
+        return _json_response({'error': 'No family found'}, status=404)
+    
+    try:
+        data = json.loads(request.body)
+        task_ids = _parse_task_ids(data)
+        if not task_ids:
+            return _json_response({'error': 'task_ids required'}, status=400)
         
-        if not task.approved:
-            return _json_response({'error': 'Task is not approved'}, status=400)
+        if len(task_ids) > task_state.MAX_BULK_TASKS:
+            return _json_response({'error': f'At most {task_state.MAX_BULK_TASKS} tasks per request'}, status=400)
         
-        assignee = task.assigned_to or task.completed_by
-        if not assignee:
-            return _json_response({'error': 'Task has no assignee'}, status=400)
+        approved_by_assignee, skipped_ids = task_state.bulk_approve_tasks(family, task_ids, user)
         
-        with transaction.atomic():
-            # Remove points from assignee
-            assignee.points = max(0, assignee.points - task.points)
-            assignee.save(update_fields=['points'])
-            
-            task.approved = False
-            task.approved_by = None
-            task.approved_at = None
-            task.save()
-            
-            return _json_response({'message': 'Task unapproved successfully'})
+        # One summary notification per child
+        from a_family.emails import send_tasks_approved_notification
+        for assignee, tasks in approved_by_assignee.items():
+            try:
+                send_tasks_approved_notification(request, assignee, tasks)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to send tasks approved notification: {e}", exc_info=True)
+        
+        approved_tasks = [task for tasks in approved_by_assignee.values() for task in tasks]
+        return _json_response({
+            'approved': [{'id': task.id, 'version': task.version, 'points': task.points} for task in approved_tasks],
+            'points_by_user': {
+                str(assignee.id): sum(task.points for task in tasks)
+                for assignee, tasks in approved_by_assignee.items()
+            },
+            'skipped': skipped_ids,
+        })
+    except json.JSONDecodeError:
+        return _json_response({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return _json_response({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def bulk_reject_tasks(request):
+    """Send many completed tasks back to the open list in one request"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
+    
+    if user.role != User.ROLE_PARENT:
+        return _json_response({'error': 'Only parents can reject tasks'}, status=403)
+    
+    family = get_request_family(request)
+    if not family:
+        return _json_response({'error': 'No family found'}, status=404)
+    
+    try:
+        data = json.loads(request.body)
+        task_ids = _parse_task_ids(data)
+        if not task_ids:
+            return _json_response({'error': 'task_ids required'}, status=400)
+        
+        if len(task_ids) > task_state.MAX_BULK_TASKS:
+            return _json_response({'error': f'At most {task_state.MAX_BULK_TASKS} tasks per request'}, status=400)
+        
+        rejected_tasks, skipped_ids = task_state.bulk_reject_tasks(family, task_ids, user)
+        return _json_response({
+            'rejected': [{'id': task.id, 'version': task.version} for task in rejected_tasks],
+            'skipped': skipped_ids,
+        })
+    except json.JSONDecodeError:
+        return _json_response({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
         return _json_response({'error': str(e)}, status=500)
 
@@ -694,7 +761,7 @@ def delete_task(request, task_id):
     if user.role != User.ROLE_PARENT:
         return _json_response({'error': 'Only parents can delete tasks'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -703,7 +770,9 @@ def delete_task(request, task_id):
         if not task:
             return _json_response({'error': 'Task not found'}, status=404)
         
-        task.delete()
+        # A cascaded recurrence decrements the family's counter in the same transaction
+        with transaction.atomic():
+            task.delete()
         return _json_response({'message': 'Task deleted successfully'})
     except Exception as e:
         return _json_response({'error': str(e)}, status=500)
@@ -716,7 +785,7 @@ def get_rewards(request):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -759,7 +828,7 @@ def create_reward(request):
     if user.role != User.ROLE_PARENT:
         return _json_response({'error': 'Only parents can create rewards'}, status=403)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -772,15 +841,15 @@ def create_reward(request):
         if not name:
             return _json_response({'error': 'Reward name required'}, status=400)
         
-        # Check subscription limit
-        can_create, current_count, limit, tier = check_subscription_limit(family, 'rewards', 1)
-        if not can_create:
-            return _json_response({
-                'error': f'Reward limit reached ({current_count}/{limit})',
-                'limit_reached': True,
-            }, status=403)
-        
         with transaction.atomic():
+            # Reserve quota first; rolled back together with the reward on error
+            granted, current_count, limit, tier = reserve_quota(family, 'rewards', 1)
+            if not granted:
+                return _json_response({
+                    'error': f'Reward limit reached ({current_count}/{limit})',
+                    'limit_reached': True,
+                }, status=403)
+            
             reward = Reward.objects.create(
                 name=name,
                 description=description,
@@ -789,8 +858,6 @@ def create_reward(request):
                 created_by=user,
             )
             
-            increment_usage(family, 'rewards', 1)
-            
             return _json_response({
                 'id': reward.id,
                 'name': reward.name,
@@ -817,7 +884,7 @@ def claim_reward(request, reward_id):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -826,22 +893,16 @@ def claim_reward(request, reward_id):
         if not reward:
             return _json_response({'error': 'Reward not found'}, status=404)
         
-        if reward.claimed:
+        # Compare-and-set claim shared with the web view (a_rewards.utils)
+        status, _ = _claim_reward(reward, user, family)
+        if status == CLAIM_ALREADY_CLAIMED:
             return _json_response({'error': 'Reward already claimed'}, status=400)
-        
-        if user.points < reward.points:
+        if status == CLAIM_INSUFFICIENT_POINTS:
             return _json_response({'error': 'Insufficient points'}, status=400)
+        if status == CLAIM_NOT_FOUND:
+            return _json_response({'error': 'Reward not found'}, status=404)
         
-        with transaction.atomic():
-            reward.claimed = True
-            reward.claimed_by = user
-            reward.claimed_at = timezone.now()
-            reward.save()
-            
-            user.points -= reward.points
-            user.save(update_fields=['points'])
-            
-            return _json_response({'message': 'Reward claimed successfully'})
+        return _json_response({'message': 'Reward claimed successfully'})
     except Exception as e:
         return _json_response({'error': str(e)}, status=500)
 
@@ -853,46 +914,54 @@ def get_family(request):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
-    members = list(family.members.all())
-    if family.owner not in members:
-        members.append(family.owner)
-    
-    members_data = []
-    for member in members:
-        members_data.append({
-            'id': member.id,
-            'username': member.username,
-            'email': member.email,
-            'first_name': member.first_name,
-            'last_name': member.last_name,
-            'role': member.role,
-            'points': member.points,
-            'display_name': member.get_display_name(),
-        })
+    return _json_response(_serialize_family(family))
+
+
+@require_http_methods(["GET"])
+def get_families(request):
+    """List the families the user can switch between"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
     
+    current = get_request_family(request)
     return _json_response({
-        'id': str(family.id),
-        'name': family.name,
-        'join_code': family.join_code,
-        'owner': {
-            'id': family.owner.id,
-            'username': family.owner.username,
-            'email': family.owner.email,
-            'first_name': family.owner.first_name,
-            'last_name': family.owner.last_name,
-            'role': family.owner.role,
-            'points': family.owner.points,
-            'display_name': family.owner.get_display_name(),
-        },
-        'members': members_data,
-        'created_at': family.created_at.isoformat(),
+        'current_id': str(current.id) if current else None,
+        'role': request.family_context.role if hasattr(request, 'family_context') else None,
+        'families': [
+            {
+                'id': str(family.id),
+                'name': family.name,
+                'is_owner': family.owner_id == user.id,
+            }
+            for family in get_user_families(user)
+        ],
     })
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def select_family_view(request):
+    """Switch the family used by this session"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
+    
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return _json_response({'error': 'Invalid JSON'}, status=400)
+    
+    family = select_family(request, data.get('family_id'))
+    if not family:
+        return _json_response({'error': 'Family not found'}, status=404)
+    return _json_response(_serialize_family(family))
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def join_family(request):
@@ -908,54 +977,23 @@ def join_family(request):
         if not join_code:
             return _json_response({'error': 'Join code required'}, status=400)
         
-        family = Family.objects.get(join_code=join_code)
-        
-        if family.owner == user or user in family.members.all():
-            return _json_response({'error': 'Already a member of this family'}, status=400)
-        
-        can_add, current_count, limit, tier = family.can_add_member(user.role)
-        if not can_add:
-            return _json_response({
-                'error': f'Family {user.get_role_display()}-limit reached ({current_count}/{limit})',
-            }, status=403)
-        
         with transaction.atomic():
-            family.members.add(user)
+            # Lock the family row so concurrent joins cannot exceed the member limit
+            family = Family.objects.select_for_update().get(join_code=join_code, deletion_requested_at__isnull=True)
             
-            members = list(family.members.all())
-            if family.owner not in members:
-                members.append(family.owner)
+            if family.owner_id == user.id or family.members.filter(pk=user.pk).exists():
+                return _json_response({'error': 'Already a member of this family'}, status=400)
             
-            members_data = []
-            for member in members:
-                members_data.append({
-                    'id': member.id,
-                    'username': member.username,
-                    'email': member.email,
-                    'first_name': member.first_name,
-                    'last_name': member.last_name,
-                    'role': member.role,
-                    'points': member.points,
-                    'display_name': member.get_display_name(),
-                })
+            can_add, current_count, limit, tier = family.can_add_member(user.role)
+            if not can_add:
+                return _json_response({
+                    'error': f'Family {user.get_role_display()}-limit reached ({current_count}/{limit})',
+                }, status=403)
             
-            return _json_response({
-                'id': str(family.id),
-                'name': family.name,
-                'join_code': family.join_code,
-                'owner': {
-                    'id': family.owner.id,
-                    'username': family.owner.username,
-                    'email': family.owner.email,
-                    'first_name': family.owner.first_name,
-                    'last_name': family.owner.last_name,
-                    'role': family.owner.role,
-                    'points': family.owner.points,
-                    'display_name': family.owner.get_display_name(),
-                },
-                'members': members_data,
-                'created_at': family.created_at.isoformat(),
-            })
+            family.members.add(user)
+            select_family(request, family.pk)
+            
+            return _json_response(_serialize_family(family))
     except Family.DoesNotExist:
         return _json_response({'error': 'Invalid join code'}, status=404)
     except json.JSONDecodeError:
@@ -971,7 +1009,7 @@ def get_dashboard(request):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -1005,6 +1043,42 @@ def get_dashboard(request):
     })
 
 
+@require_http_methods(["GET"])
+def get_limits(request):
+    """Get the family's subscription tier, limits and current usage"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
+    
+    family = get_request_family(request)
+    if not family:
+        return _json_response({'error': 'No family found'}, status=404)
+    
+    can_create_task, tasks_used, tasks_limit, tier = check_subscription_limit(family, 'tasks', 1)
+    can_create_reward, rewards_used, rewards_limit, _ = check_subscription_limit(family, 'rewards', 1)
+    can_create_recurring, recurring_active, recurring_limit, _ = check_recurring_task_limit(family)
+    
+    return _json_response({
+        'tier': tier,
+        'tasks': {
+            'used': tasks_used,
+            'limit': tasks_limit,
+            'can_create': can_create_task,
+        },
+        'rewards': {
+            'used': rewards_used,
+            'limit': rewards_limit,
+            'can_create': can_create_reward,
+        },
+        'recurring_tasks': {
+            'active': recurring_active,
+            'limit': recurring_limit,
+            'can_create': can_create_recurring,
+        },
+        'shopping_list_enabled': get_tier_limits(tier)['shopping_list_enabled'],
+    })
+
+
 @require_http_methods(["GET"])
 def get_shopping_list(request):
     """Get shopping list items"""
@@ -1012,7 +1086,7 @@ def get_shopping_list(request):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -1046,7 +1120,7 @@ def create_shopping_item(request):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -1082,6 +1156,60 @@ def create_shopping_item(request):
         return _json_response({'error': str(e)}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def bulk_create_shopping_items(request):
+    """Create many shopping list items in one request"""
+    user = _get_user_from_request(request)
+    if not user:
+        return _json_response({'error': 'Authentication required'}, status=401)
+    
+    family = get_request_family(request)
+    if not family:
+        return _json_response({'error': 'No family found'}, status=404)
+    
+    if not has_shopping_list_access(family):
+        return _json_response({'error': 'Shopping list access requires STARTER or PRO subscription'}, status=403)
+    
+    try:
+        from a_family.emails import send_shopping_items_added_notification
+        from a_shopping.utils import MAX_BULK_ITEMS, bulk_add_items
+        
+        data = json.loads(request.body)
+        # Accept either a list of names or one pasted text blob
+        names = split_pasted_lines(data.get('names') or data.get('text', ''))
+        
+        if not names:
+            return _json_response({'error': 'At least one item name required'}, status=400)
+        
+        if len(names) > MAX_BULK_ITEMS:
+            return _json_response({'error': f'At most {MAX_BULK_ITEMS} items per request'}, status=400)
+        
+        items, skipped = bulk_add_items(family, user, names)
+        
+        if items:
+            try:
+                send_shopping_items_added_notification(request, items)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to send shopping items added notification: {e}", exc_info=True)
+        
+        return _json_response({
+            'created': [{
+                'id': item.id,
+                'name': item.name,
+                'in_cart': item.in_cart,
+                'created_at': item.created_at.isoformat(),
+            } for item in items],
+            'skipped': skipped,
+        }, status=201 if items else 400)
+    except json.JSONDecodeError:
+        return _json_response({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        return _json_response({'error': str(e)}, status=500)
+
+
 @csrf_exempt
 @require_http_methods(["PUT"])
 def update_shopping_item(request, item_id):
@@ -1090,7 +1218,7 @@ def update_shopping_item(request, item_id):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -1130,7 +1258,7 @@ def delete_shopping_item(request, item_id):
     if not user:
         return _json_response({'error': 'Authentication required'}, status=401)
     
-    family = get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         return _json_response({'error': 'No family found'}, status=404)
     
@@ -29,13 +29,15 @@ from a_tasks.models import Task
 logger = logging.getLogger(__name__)
 
 
-from a_family.utils import get_family_for_user as _get_family_for_user
+from a_family.points_utils import get_points_earned
+from a_family.roster_utils import get_family_roster
+from a_family.utils import get_request_family
 
 
 @login_required
 def dashboard(request):
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
 
     # Redirect to onboarding if user doesn't have a family
     if not family:
@@ -123,12 +125,8 @@ def dashboard(request):
         stats["points_earned"] = child_users.aggregate(total=Sum("points"))["total"] or 0
 
         month_ago = timezone.now() - timezone.timedelta(days=30)
-        recent_task_points = (
-            Task.objects.filter(family=family, approved=True, approved_at__gte=month_ago)
-            .aggregate(total=Sum("points"))
-            .get("total")
-        )
-        stats["points_change"] = recent_task_points or 0
+        # Ledger range aggregate: still correct after completed tasks are cleaned up
+        stats["points_change"] = get_points_earned(month_ago, family=family)
 
         rewards_qs = Reward.objects.filter(family=family)
         stats["rewards_available"] = rewards_qs.filter(claimed=False).count()
@@ -138,9 +136,7 @@ def dashboard(request):
         stats["shopping_items"] = shopping_qs.count()
         stats["shopping_needed"] = shopping_qs.filter(in_cart=False).count()
 
-        members = list(family.members.all())
-        if family.owner_id not in [member.id for member in members]:
-            members.append(family.owner)
+        members = get_family_roster(family)
 
         # Optimize queries: Use aggregation to avoid N+1 queries
         from django.db.models import Count, Q
@@ -190,10 +186,7 @@ def dashboard(request):
         if is_parent:
             pending_approvals_count = tasks_qs.filter(completed=True, approved=False).count()
             due_today_count = tasks_qs.filter(completed=False, due_date=today).count()
-            weekly_points = tasks_qs.filter(
-                approved=True,
-                approved_at__gte=now - timezone.timedelta(days=7)
-            ).aggregate(total=Sum("points"))["total"] or 0
+            weekly_points = get_points_earned(now - timezone.timedelta(days=7), family=family)
             claimable_now = rewards_qs.filter(claimed=False, points__lte=child_users.aggregate(total=Sum("points"))["total"] or 0).count()
             parent_stat_cards = [
                 {
@@ -259,11 +252,7 @@ def dashboard(request):
                 if reward.points > user.points:
                     next_reward = reward
                     break
-            weekly_points = tasks_qs.filter(
-                completed_by=user,
-                approved=True,
-                approved_at__gte=timezone.now() - timezone.timedelta(days=7)
-            ).aggregate(total=Sum("points"))["total"] or 0
+            weekly_points = get_points_earned(now - timezone.timedelta(days=7), user=user)
             rewards_available = []
             for reward in rewards_qs:
                 rewards_available.append({
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib import messages
 
-from .models import Family, User, EmailTemplate
+from .models import Family, User, EmailTemplate, PointsTransaction, PointsBalanceSnapshot
 from .emails import send_bulk_email
 
 
@@ -20,13 +20,38 @@ class UserAdmin(BaseUserAdmin):
 
 @admin.register(Family)
 class FamilyAdmin(admin.ModelAdmin):
-    list_display = ('name', 'owner', 'id', 'created_at', 'updated_at')
+    list_display = ('name', 'owner', 'id', 'active_recurrences', 'created_at', 'updated_at')
     list_filter = ('created_at',)
     search_fields = ('name', 'owner__username', 'owner__email')
     filter_horizontal = ('members',)
     readonly_fields = ('id', 'created_at', 'updated_at')
 
 
+@admin.register(PointsTransaction)
+class PointsTransactionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'amount', 'reason', 'family', 'task', 'reward', 'created_by', 'created_at')
+    list_filter = ('reason', 'created_at')
+    search_fields = ('user__username', 'user__email', 'description')
+    raw_id_fields = ('user', 'family', 'task', 'reward', 'created_by')
+    date_hierarchy = 'created_at'
+
+    def has_change_permission(self, request, obj=None):
+        # Ledger is append-only
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PointsBalanceSnapshot)
+class PointsBalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('user', 'balance', 'last_transaction_id', 'taken_at')
+    list_filter = ('taken_at',)
+    search_fields = ('user__username', 'user__email')
+    raw_id_fields = ('user',)
+    readonly_fields = ('user', 'balance', 'last_transaction_id', 'taken_at')
+
+
 @admin.register(EmailTemplate)
 class EmailTemplateAdmin(admin.ModelAdmin):
     list_display = ('name', 'subject', 'is_active', 'updated_at', 'created_at')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AFamilyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'a_family'
+
+    def ready(self):
+        """Import signals when the app is ready"""
+        import a_family.signals  # noqa
@@ -0,0 +1,178 @@
+"""
+Deferred deletion of families and user accounts.
+
+Deleting a family with years of tasks, history and ledger rows through
+Model.delete() makes Django's collector load every related row inside the
+request. Instead the views only mark the family or user as pending deletion
+(deletion_requested_at) and detach it, which is a handful of small UPDATEs.
+purge_pending_deletions(), run by the scheduler and the purge_deletions
+command, then removes the data table by table in primary-key batches
+(a_tasks.batch_utils) so memory use and lock times stay bounded.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from a_tasks.batch_utils import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SLEEP, batch_delete, batch_update
+from .models import Family, PointsBalanceSnapshot, PointsTransaction, User
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_email_addresses(user_ids):
+    try:
+        from allauth.account.models import EmailAddress
+    except ImportError:
+        return
+    EmailAddress.objects.filter(user_id__in=user_ids).delete()
+
+
+def request_user_deletion(user_ids):
+    """
+    Deactivate users and queue them for purging.
+
+    Inactive users can no longer log in and existing sessions stop
+    authenticating. Memberships and e-mail addresses are removed right away.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    with transaction.atomic():
+        User.objects.filter(pk__in=user_ids).update(
+            is_active=False,
+            active_family=None,
+            deletion_requested_at=timezone.now(),
+        )
+        for user in User.objects.filter(pk__in=user_ids).only('pk'):
+            # Through the m2m manager so rosters and active families are updated
+            user.families.clear()
+        _delete_email_addresses(user_ids)
+
+
+def request_family_deletion(family, delete_children=True):
+    """
+    Hide a family from all its users and queue it for purging.
+
+    Args:
+        family: Family instance
+        delete_children: also queue the family's child accounts for deletion;
+            if False they are only removed from the family
+
+    Returns:
+        list: ids of child accounts queued for deletion
+    """
+    with transaction.atomic():
+        child_ids = list(family.members.filter(role=User.ROLE_CHILD).values_list('id', flat=True))
+
+        # Mark first so the active-family fallback in members.clear() skips this family
+        family.deletion_requested_at = timezone.now()
+        family.save(update_fields=['deletion_requested_at', 'updated_at'])
+        family.members.clear()
+        User.objects.filter(active_family=family).update(active_family=None)
+
+        if not delete_children:
+            child_ids = []
+        request_user_deletion(child_ids)
+
+    logger.info(f"Family {family.id} queued for deletion ({len(child_ids)} child account(s))")
+    return child_ids
+
+
+def purge_family(family_id, batch_size=DEFAULT_BATCH_SIZE, sleep_seconds=DEFAULT_BATCH_SLEEP):
+    """
+    Delete a family and everything that belongs to it in bounded batches.
+    Leaf tables go first, so the final Family delete has nothing left to collect.
+    """
+    from a_rewards.models import Reward
+    from a_shopping.models import ShoppingListItem
+    from a_subscription.models import SubscriptionUsage, SubscriptionUsageYearly
+    from a_tasks.models import Task, TaskHistory, TaskRecurrence
+
+    def delete(queryset, raw=False):
+        return batch_delete(queryset, batch_size, sleep_seconds, raw=raw)
+
+    # The family's recurrence counter goes away with it, so no signals are needed
+    delete(TaskRecurrence.objects.filter(task__family_id=family_id), raw=True)
+    # Ledger rows keep their history: task/reward/family references become NULL
+    delete(Task.objects.filter(family_id=family_id))
+    delete(Reward.objects.filter(family_id=family_id))
+    delete(TaskHistory.objects.filter(family_id=family_id), raw=True)
+    delete(ShoppingListItem.objects.filter(family_id=family_id), raw=True)
+    delete(SubscriptionUsage.objects.filter(family_id=family_id), raw=True)
+    delete(SubscriptionUsageYearly.objects.filter(family_id=family_id), raw=True)
+    batch_update(PointsTransaction.objects.filter(family_id=family_id), {'family': None}, batch_size, sleep_seconds)
+
+    with transaction.atomic():
+        User.objects.filter(active_family_id=family_id).update(active_family=None)
+        Family.members.through.objects.filter(family_id=family_id).delete()
+        Family.objects.filter(pk=family_id).delete()
+
+
+def purge_user(user_id, batch_size=DEFAULT_BATCH_SIZE, sleep_seconds=DEFAULT_BATCH_SLEEP):
+    """
+    Delete a user account and the rows that cascade from it in bounded batches.
+    Families the user owns are purged first.
+    """
+    from a_rewards.models import Reward
+    from a_shopping.models import ShoppingListItem
+    from a_tasks.models import Task
+
+    for family_id in Family.objects.filter(owner_id=user_id).values_list('id', flat=True):
+        purge_family(family_id, batch_size, sleep_seconds)
+
+    def delete(queryset, raw=False):
+        return batch_delete(queryset, batch_size, sleep_seconds, raw=raw)
+
+    # Tasks and rewards the user created in other families cascade like User.delete() would
+    delete(Task.objects.filter(created_by_id=user_id))
+    delete(Reward.objects.filter(created_by_id=user_id))
+    delete(ShoppingListItem.objects.filter(added_by_id=user_id), raw=True)
+    delete(PointsTransaction.objects.filter(user_id=user_id), raw=True)
+    delete(PointsBalanceSnapshot.objects.filter(user_id=user_id), raw=True)
+
+    # What is left (subscription, sessions, e-mail, SET_NULL references) is small
+    with transaction.atomic():
+        User.objects.filter(pk=user_id).delete()
+
+
+def purge_pending_deletions(batch_size=DEFAULT_BATCH_SIZE, sleep_seconds=DEFAULT_BATCH_SLEEP, limit=None):
+    """
+    Purge families and users marked for deletion, oldest first.
+
+    Args:
+        limit: purge at most this many families and this many users per call
+
+    Returns:
+        tuple: (families purged, users purged)
+    """
+    family_ids = Family.objects.filter(deletion_requested_at__isnull=False).order_by(
+        'deletion_requested_at'
+    ).values_list('id', flat=True)
+    user_ids = User.objects.filter(deletion_requested_at__isnull=False).order_by(
+        'deletion_requested_at'
+    ).values_list('id', flat=True)
+    if limit:
+        family_ids = family_ids[:limit]
+        user_ids = user_ids[:limit]
+
+    families = 0
+    for family_id in list(family_ids):
+        try:
+            purge_family(family_id, batch_size, sleep_seconds)
+            families += 1
+        except Exception as e:
+            # Left marked; the next run retries from where this one stopped
+            logger.error(f"Error purging family {family_id}: {e}", exc_info=True)
+
+    users = 0
+    for user_id in list(user_ids):
+        try:
+            purge_user(user_id, batch_size, sleep_seconds)
+            users += 1
+        except Exception as e:
+            logger.error(f"Error purging user {user_id}: {e}", exc_info=True)
+
+    if families or users:
+        logger.info(f"Purged {families} family(ies) and {users} user account(s)")
+    return families, users
@@ -9,6 +9,7 @@ from django.urls import reverse
 from django.utils.html import strip_tags
 
 from a_family.models import User
+from a_family.roster_utils import get_family_roster
 
 
 logger = logging.getLogger(__name__)
@@ -134,19 +135,11 @@ def _get_users_to_notify(family, preference_key):
     Returns:
         List of email addresses to notify
     """
-    recipients = []
-    all_members = list(family.members.all()) + [family.owner]
-    
-    for user in all_members:
-        if not user.email:
-            continue
-        
-        # Check notification preferences (default to True if not set)
-        prefs = user.notification_preferences or {}
-        if prefs.get(preference_key, True):  # Default to True if not set
-            recipients.append(user.email)
-    
-    return recipients
+    return [
+        member.email
+        for member in get_family_roster(family)
+        if member.email and member.wants(preference_key)
+    ]
 
 
 def send_task_completed_notification(request, task):
@@ -158,21 +151,11 @@ def send_task_completed_notification(request, task):
         return
     
     # Get only parents (owners) in the family who have email and task_updates enabled
-    recipients = []
-    all_members = list(task.family.members.all()) + [task.family.owner]
-    
-    for user in all_members:
-        # Only notify parents
-        if user.role != User.ROLE_PARENT:
-            continue
-        
-        if not user.email:
-            continue
-        
-        # Check notification preferences (default to True if not set)
-        prefs = user.notification_preferences or {}
-        if prefs.get('task_updates', True):  # Default to True if not set
-            recipients.append(user.email)
+    recipients = [
+        member.email
+        for member in get_family_roster(task.family)
+        if member.role == User.ROLE_PARENT and member.email and member.wants('task_updates')
+    ]
     
     if not recipients:
         return
@@ -233,6 +216,45 @@ def send_task_approved_notification(request, task):
     )
 
 
+def send_tasks_approved_notification(request, assignee, tasks):
+    """
+    Send one summary email when several tasks of the same child are approved at once.
+    Notifies the assignee if they have task_updates enabled.
+    """
+    if not tasks:
+        return
+    if len(tasks) == 1:
+        send_task_approved_notification(request, tasks[0])
+        return
+    if not assignee or not assignee.email:
+        return
+    
+    prefs = assignee.notification_preferences or {}
+    if not prefs.get('task_updates', True):  # Default to True
+        return
+    
+    approved_by = tasks[0].approved_by
+    context = {
+        'tasks': tasks,
+        'task_count': len(tasks),
+        'total_points': sum(task.points for task in tasks),
+        'family': tasks[0].family,
+        'assignee': assignee,
+        'approved_by': approved_by,
+        'approved_by_name': approved_by.get_display_name() if approved_by else 'Keegi',
+        'dashboard_url': request.build_absolute_uri(reverse('a_dashboard:dashboard')),
+        'tasks_url': request.build_absolute_uri(reverse('a_tasks:index')),
+        'logo_url': _get_logo_url(request),
+    }
+    
+    _send_branded_email(
+        subject=f"Kinnitatud {len(tasks)} ülesannet",
+        template_name='email/tasks_approved.html',
+        context=context,
+        recipients=[assignee.email],
+    )
+
+
 # Removed send_reward_created_notification - we only notify when rewards are claimed/taken
 
 
@@ -302,6 +324,47 @@ def send_shopping_item_added_notification(request, item):
     )
 
 
+def send_shopping_items_added_notification(request, items):
+    """
+    Send a single notification email for many shopping list items added at once.
+    Notifies all family members who have shopping_updates enabled.
+    """
+    if not items:
+        return
+    if len(items) == 1:
+        send_shopping_item_added_notification(request, items[0])
+        return
+    
+    first_item = items[0]
+    if not first_item.family:
+        return
+    
+    recipients = _get_users_to_notify(first_item.family, 'shopping_updates')
+    if not recipients:
+        return
+    
+    dashboard_url = request.build_absolute_uri(reverse('a_dashboard:dashboard'))
+    shopping_url = request.build_absolute_uri(reverse('a_shopping:index'))
+    
+    context = {
+        'items': items,
+        'item_count': len(items),
+        'family': first_item.family,
+        'added_by': first_item.added_by,
+        'added_by_name': first_item.added_by.get_display_name() if first_item.added_by else 'Keegi',
+        'dashboard_url': dashboard_url,
+        'shopping_url': shopping_url,
+        'logo_url': _get_logo_url(request),
+    }
+    
+    _send_branded_email(
+        subject=f"Ostunimekirja lisatud {len(items)} eset",
+        template_name='email/shopping_items_added.html',
+        context=context,
+        recipients=recipients,
+    )
+
+
 def send_welcome_email(request, user):
     """
     Send welcome email to new users after signup.
@@ -244,7 +244,7 @@ class JoinFamilyForm(forms.Form):
             raise ValidationError('Perekonna kood on kohustuslik.')
         if len(join_code) != 8:
             raise ValidationError('Perekonna kood peab olema täpselt 8 märki.')
-        if not Family.objects.filter(join_code=join_code).exists():
+        if not Family.objects.filter(join_code=join_code, deletion_requested_at__isnull=True).exists():
             raise ValidationError('Vale pere kood. Palun kontrolli ja proovi uuesti.')
         return join_code
 
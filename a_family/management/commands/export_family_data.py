@@ -0,0 +1,42 @@
+"""
+Export all data of one family as a ZIP of NDJSON files (data portability requests).
+Rows are streamed to the file in chunks, so any family size runs in constant memory.
+"""
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from a_family.export_utils import EXPORT_CHUNK_SIZE, export_filename, iter_family_export
+from a_family.models import Family
+
+
+class Command(BaseCommand):
+    help = 'Exports all data of a family to a ZIP archive of NDJSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('family_id', type=str, help='Family UUID')
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Path of the ZIP file (default: perekas-<family id>-<date>.zip)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help=f'Rows fetched per database round trip (default: {EXPORT_CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            family = Family.objects.get(pk=options['family_id'])
+        except (Family.DoesNotExist, ValidationError):
+            raise CommandError(f"Family {options['family_id']} not found")
+
+        path = options['output'] or export_filename(family)
+        written = 0
+        with open(path, 'wb') as output:
+            for chunk in iter_family_export(family, chunk_size=max(options['chunk_size'], 1)):
+                output.write(chunk)
+                written += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Exported family "{family.name}" to {path} ({written} bytes)'))
@@ -0,0 +1,34 @@
+"""
+Purge families and user accounts marked for deletion.
+The scheduler runs the same worker every minute; use this command to purge
+manually, e.g. when the scheduler is not running.
+"""
+from django.core.management.base import BaseCommand
+
+from a_family.deletion_utils import purge_pending_deletions
+from a_tasks.batch_utils import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SLEEP
+
+
+class Command(BaseCommand):
+    help = 'Purges families and user accounts that are pending deletion'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows deleted per statement (default: {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=DEFAULT_BATCH_SLEEP,
+            help=f'Seconds to sleep between batches (default: {DEFAULT_BATCH_SLEEP})',
+        )
+
+    def handle(self, *args, **options):
+        families, users = purge_pending_deletions(
+            batch_size=max(options['batch_size'], 1),
+            sleep_seconds=max(options['sleep'], 0),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Purged {families} family(ies) and {users} user account(s)"))
@@ -1,5 +1,6 @@
 """
-Middleware to check email verification and redirect users who haven't verified their email.
+Middleware to check email verification and redirect users who haven't verified their email,
+and to resolve the family a request works in.
 """
 from django.shortcuts import redirect
 from allauth.account.models import EmailAddress
@@ -58,3 +59,24 @@ class EmailVerificationMiddleware:
         
         response = self.get_response(request)
         return response
+
+
+class FamilyContextMiddleware:
+    """
+    Resolve the current family once per request.
+
+    Sets request.family (Family or None) and request.family_context
+    (a_family.utils.FamilyContext with the tier and the user's role in the
+    family). The family comes from the session selection made with
+    a_family.utils.select_family, falling back to User.active_family.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .utils import FamilyContext, resolve_request_family
+
+        request.family = resolve_request_family(request)
+        request.family_context = FamilyContext(request.user, request.family)
+        return self.get_response(request)
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_opening_balances(apps, schema_editor):
+    """Record existing balances as opening ledger entries so ledger sums match User.points."""
+    User = apps.get_model('a_family', 'User')
+    PointsTransaction = apps.get_model('a_family', 'PointsTransaction')
+
+    batch = []
+    for user_id, points in User.objects.filter(points__gt=0).values_list('id', 'points').iterator(chunk_size=1000):
+        batch.append(PointsTransaction(
+            user_id=user_id,
+            amount=points,
+            reason='opening_balance',
+            description='Saldo enne punktiregistri kasutuselevõttu',
+        ))
+        if len(batch) >= 1000:
+            PointsTransaction.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PointsTransaction.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_family', '0008_add_email_template'),
+        ('a_rewards', '0001_initial'),
+        ('a_tasks', '0005_add_business_daily_and_every_other_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.PositiveIntegerField()),
+                ('last_transaction_id', models.BigIntegerField(help_text='Highest PointsTransaction id included in this snapshot')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'points balance snapshot',
+                'verbose_name_plural': 'points balance snapshots',
+                'db_table': 'family_pointsbalancesnapshot',
+                'ordering': ['-taken_at'],
+                'indexes': [models.Index(fields=['user', 'taken_at'], name='family_poin_user_id_2b1cd4_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PointsTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(help_text='Positive when points are added, negative when removed')),
+                ('reason', models.CharField(choices=[('opening_balance', 'Algsaldo'), ('task_approved', 'Ülesanne kinnitatud'), ('task_unapproved', 'Ülesande kinnitamine tühistatud'), ('task_reopened', 'Ülesanne avatud uuesti'), ('reward_claimed', 'Preemia lunastatud'), ('reward_unclaimed', 'Preemia lunastamine tühistatud'), ('adjustment', 'Korrektsioon')], db_index=True, max_length=20)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_transactions_created', to=settings.AUTH_USER_MODEL)),
+                ('family', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_transactions', to='a_family.family')),
+                ('reward', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_transactions', to='a_rewards.reward')),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_transactions', to='a_tasks.task')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'points transaction',
+                'verbose_name_plural': 'points transactions',
+                'db_table': 'family_pointstransaction',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='family_poin_user_id_b10e5d_idx'), models.Index(fields=['family', 'created_at'], name='family_poin_family__1e4e7d_idx')],
+            },
+        ),
+        migrations.RunPython(create_opening_balances, migrations.RunPython.noop),
+    ]
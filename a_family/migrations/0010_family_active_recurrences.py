@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_recurrences(apps, schema_editor):
+    """Fill the counter from the existing recurrences."""
+    Family = apps.get_model('a_family', 'Family')
+    TaskRecurrence = apps.get_model('a_tasks', 'TaskRecurrence')
+
+    counts = TaskRecurrence.objects.values('task__family_id').annotate(total=Count('id'))
+    for row in counts.iterator(chunk_size=1000):
+        Family.objects.filter(pk=row['task__family_id']).update(active_recurrences=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_family', '0009_points_ledger'),
+        ('a_tasks', '0007_task_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='family',
+            name='active_recurrences',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_recurrences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_family', '0010_family_active_recurrences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='family',
+            name='current_period_end',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='family',
+            name='current_period_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
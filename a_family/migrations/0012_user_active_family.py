@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_active_families(apps, schema_editor):
+    """Store the family get_family_for_user used to resolve: newest membership, else owned family."""
+    User = apps.get_model('a_family', 'User')
+    Family = apps.get_model('a_family', 'Family')
+    Membership = Family.members.through
+
+    active = {}
+    memberships = Membership.objects.order_by('-family__created_at').values_list('user_id', 'family_id')
+    for user_id, family_id in memberships.iterator(chunk_size=2000):
+        active.setdefault(user_id, family_id)
+    owned = Family.objects.order_by('-created_at').values_list('owner_id', 'id')
+    for owner_id, family_id in owned.iterator(chunk_size=2000):
+        active.setdefault(owner_id, family_id)
+
+    batch = []
+    for user_id, family_id in active.items():
+        batch.append(User(id=user_id, active_family_id=family_id))
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ['active_family'])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ['active_family'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_family', '0011_family_usage_period'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='active_family',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='a_family.family'),
+        ),
+        migrations.RunPython(set_active_families, migrations.RunPython.noop),
+    ]
@@ -3,7 +3,8 @@ import secrets
 import string
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -21,6 +22,16 @@ class User(AbstractUser):
     points = models.PositiveIntegerField(default=0)
     birthdate = models.DateField(null=True, blank=True, db_index=True)
     notification_preferences = models.JSONField(default=dict, blank=True, null=True)
+    # Family shown to this user; kept in step with memberships by a_family.signals
+    active_family = models.ForeignKey(
+        'Family',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    # Set when the account is deleted; a_family.deletion_utils purges it in the background
+    deletion_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -62,24 +73,43 @@ class Family(models.Model):
     name = models.CharField(max_length=255, db_index=True)
     members = models.ManyToManyField('User', related_name='families')
     join_code = models.CharField(max_length=8, unique=True, db_index=True, blank=True)
+    # Number of TaskRecurrence rows for this family's tasks, kept in step by a_tasks.signals
+    active_recurrences = models.PositiveIntegerField(default=0)
+    # Current subscription usage period, rolled forward by daily maintenance (a_subscription.utils)
+    current_period_start = models.DateTimeField(null=True, blank=True)
+    current_period_end = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Set when the family is deleted; a_family.deletion_utils purges it in the background
+    deletion_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Inserts retried with a fresh join code after a unique-index collision
+    JOIN_CODE_ATTEMPTS = 5
+
     def save(self, *args, **kwargs):
-        if not self.join_code:
+        if self.join_code:
+            super().save(*args, **kwargs)
+            return
+
+        # Optimistic: insert with a random code and let the unique index reject
+        # the (very rare, 36^8 codes) duplicate instead of checking first
+        for attempt in range(self.JOIN_CODE_ATTEMPTS):
             self.join_code = self._generate_join_code()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt + 1 == self.JOIN_CODE_ATTEMPTS or not Family.objects.filter(join_code=self.join_code).exists():
+                    # Out of attempts, or the error was not a join code collision
+                    self.join_code = ''
+                    raise
 
     @staticmethod
     def _generate_join_code():
-        """Generate a unique 8 character alphanumeric code"""
-        while True:
-            # Generate 8 character code (mix of digits and uppercase letters)
-            code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
-            # Check if code already exists
-            if not Family.objects.filter(join_code=code).exists():
-                return code
+        """Generate a random 8 character code (uppercase letters and digits)"""
+        return ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
 
     class Meta:
         db_table = 'family_family'
@@ -139,3 +169,104 @@ class EmailTemplate(models.Model):
 
     def __str__(self):
         return f"{self.name} - {self.subject[:50]}"
+
+
+class PointsTransaction(models.Model):
+    """
+    Append-only ledger of changes to User.points.
+    Every balance change is written here by a_family.points_utils, so period
+    totals (points this week/month) are cheap range aggregates over (user, created_at).
+    """
+    REASON_OPENING_BALANCE = 'opening_balance'
+    REASON_TASK_APPROVED = 'task_approved'
+    REASON_TASK_UNAPPROVED = 'task_unapproved'
+    REASON_TASK_REOPENED = 'task_reopened'
+    REASON_REWARD_CLAIMED = 'reward_claimed'
+    REASON_REWARD_UNCLAIMED = 'reward_unclaimed'
+    REASON_ADJUSTMENT = 'adjustment'
+    REASON_CHOICES = [
+        (REASON_OPENING_BALANCE, 'Algsaldo'),
+        (REASON_TASK_APPROVED, 'Ülesanne kinnitatud'),
+        (REASON_TASK_UNAPPROVED, 'Ülesande kinnitamine tühistatud'),
+        (REASON_TASK_REOPENED, 'Ülesanne avatud uuesti'),
+        (REASON_REWARD_CLAIMED, 'Preemia lunastatud'),
+        (REASON_REWARD_UNCLAIMED, 'Preemia lunastamine tühistatud'),
+        (REASON_ADJUSTMENT, 'Korrektsioon'),
+    ]
+    # Reasons that count as points earned from tasks (net of corrections)
+    EARNING_REASONS = [REASON_TASK_APPROVED, REASON_TASK_UNAPPROVED, REASON_TASK_REOPENED]
+
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='points_transactions')
+    family = models.ForeignKey(
+        'Family',
+        on_delete=models.SET_NULL,
+        related_name='points_transactions',
+        null=True,
+        blank=True,
+    )
+    amount = models.IntegerField(help_text='Positive when points are added, negative when removed')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, db_index=True)
+    task = models.ForeignKey(
+        'a_tasks.Task',
+        on_delete=models.SET_NULL,
+        related_name='points_transactions',
+        null=True,
+        blank=True,
+    )
+    reward = models.ForeignKey(
+        'a_rewards.Reward',
+        on_delete=models.SET_NULL,
+        related_name='points_transactions',
+        null=True,
+        blank=True,
+    )
+    description = models.CharField(max_length=255, blank=True)
+    created_by = models.ForeignKey(
+        'User',
+        on_delete=models.SET_NULL,
+        related_name='points_transactions_created',
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'family_pointstransaction'
+        verbose_name = 'points transaction'
+        verbose_name_plural = 'points transactions'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['family', 'created_at']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError('PointsTransaction is append-only; record a new transaction instead.')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.amount:+d} ({self.get_reason_display()})'
+
+
+class PointsBalanceSnapshot(models.Model):
+    """
+    Periodic snapshot of a user's points balance, taken by daily maintenance.
+    Balance at any time = latest snapshot before it + ledger amounts after the snapshot.
+    """
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='points_snapshots')
+    balance = models.PositiveIntegerField()
+    last_transaction_id = models.BigIntegerField(help_text='Highest PointsTransaction id included in this snapshot')
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'family_pointsbalancesnapshot'
+        verbose_name = 'points balance snapshot'
+        verbose_name_plural = 'points balance snapshots'
+        ordering = ['-taken_at']
+        indexes = [
+            models.Index(fields=['user', 'taken_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.balance} @ {self.taken_at:%Y-%m-%d %H:%M}'
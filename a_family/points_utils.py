@@ -0,0 +1,231 @@
+"""
+Utility functions for changing user points balances.
+
+All balance changes go through this module: User.points is updated with a
+single conditional UPDATE (F() expression, no read-modify-write) and an
+append-only PointsTransaction row is written in the same transaction.
+Family rosters read balances live, so no cache invalidation is needed here.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import PointsBalanceSnapshot, PointsTransaction, User
+
+logger = logging.getLogger(__name__)
+
+# Snapshots only cover ledger rows at least this old. Ids are allocated at
+# insert but become visible at commit, so a newer id can be visible while a
+# lower one is still uncommitted; those would fall behind the next window.
+SNAPSHOT_GRACE_PERIOD = timedelta(minutes=10)
+
+
+def _record_transaction(user, amount, reason, family=None, task=None, reward=None, created_by=None, description=''):
+    return PointsTransaction.objects.create(
+        user_id=user.pk,
+        family=family,
+        amount=amount,
+        reason=reason,
+        task=task,
+        reward=reward,
+        created_by=created_by,
+        description=description[:255],
+    )
+
+
+def _refresh_points(user):
+    """Reload points on the passed instance so callers see the new balance."""
+    user.points = User.objects.filter(pk=user.pk).values_list('points', flat=True).first() or 0
+
+
+def add_points(user, amount, reason, family=None, task=None, reward=None, created_by=None, description=''):
+    """
+    Add points to a user's balance.
+
+    Args:
+        user: User receiving the points
+        amount: positive number of points
+        reason: one of PointsTransaction.REASON_*
+
+    Returns:
+        PointsTransaction or None if amount is not positive
+    """
+    if not amount or amount <= 0:
+        return None
+
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(points=F('points') + amount)
+        entry = _record_transaction(user, amount, reason, family, task, reward, created_by, description)
+    _refresh_points(user)
+    return entry
+
+
+def add_points_batch(entries, reason, family=None, created_by=None):
+    """
+    Add points for many ledger entries at once (e.g. bulk task approval).
+
+    Entries are grouped per user so each balance gets a single F() UPDATE,
+    while the ledger keeps one row per entry.
+
+    Args:
+        entries: list of (user_id, amount, task) tuples; task may be None
+        reason: one of PointsTransaction.REASON_*
+
+    Returns:
+        dict: {user_id: total points added}
+    """
+    totals = {}
+    ledger_rows = []
+    for user_id, amount, task in entries:
+        if not amount or amount <= 0:
+            continue
+        totals[user_id] = totals.get(user_id, 0) + amount
+        ledger_rows.append(PointsTransaction(
+            user_id=user_id,
+            family=family,
+            amount=amount,
+            reason=reason,
+            task=task,
+            created_by=created_by,
+        ))
+
+    if not ledger_rows:
+        return {}
+
+    with transaction.atomic():
+        for user_id, total in totals.items():
+            User.objects.filter(pk=user_id).update(points=F('points') + total)
+        PointsTransaction.objects.bulk_create(ledger_rows)
+    return totals
+
+
+def deduct_points(user, amount, reason, family=None, task=None, reward=None, created_by=None, description='',
+                  allow_partial=True):
+    """
+    Remove points from a user's balance without ever going below zero.
+
+    The deduction is a conditional UPDATE (points >= amount), so concurrent
+    requests cannot overdraw the balance.
+
+    Args:
+        allow_partial: if True and the user has fewer points than amount, the
+            balance is clamped to zero (used when undoing task approvals).
+            If False, nothing is deducted (used for reward claims).
+
+    Returns:
+        int: number of points actually deducted (0 if nothing was deducted)
+    """
+    if not amount or amount <= 0:
+        return 0
+
+    with transaction.atomic():
+        updated = User.objects.filter(pk=user.pk, points__gte=amount).update(points=F('points') - amount)
+        if updated:
+            deducted = amount
+        elif allow_partial:
+            # Lock the row so the clamped amount recorded in the ledger is exact
+            current = User.objects.select_for_update().filter(pk=user.pk).values_list('points', flat=True).first() or 0
+            deducted = min(current, amount)
+            if deducted:
+                User.objects.filter(pk=user.pk).update(points=Greatest(F('points') - deducted, 0))
+        else:
+            deducted = 0
+
+        if deducted:
+            _record_transaction(user, -deducted, reason, family, task, reward, created_by, description)
+
+    _refresh_points(user)
+    return deducted
+
+
+def get_points_earned(since, until=None, user=None, family=None):
+    """
+    Sum points earned from tasks in a time range (range aggregate over the ledger).
+
+    Args:
+        since: start datetime (inclusive)
+        until: end datetime (exclusive), defaults to now
+        user: optional User to filter by
+        family: optional Family to filter by
+
+    Returns:
+        int: net points earned in the range (never negative)
+    """
+    queryset = PointsTransaction.objects.filter(
+        reason__in=PointsTransaction.EARNING_REASONS,
+        created_at__gte=since,
+    )
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=until)
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    if family is not None:
+        queryset = queryset.filter(family=family)
+
+    total = queryset.aggregate(total=Sum('amount'))['total'] or 0
+    return max(total, 0)
+
+
+def snapshot_points_balances(batch_size=1000):
+    """
+    Store a balance snapshot for every user whose balance changed since the last snapshot.
+    Run from daily maintenance.
+
+    The balance is derived from the ledger (previous snapshot + amounts up to
+    the latest transaction id) rather than read from User.points, so a
+    transaction committed while this runs cannot be counted twice. The cut is
+    the newest id older than SNAPSHOT_GRACE_PERIOD, so every lower id has
+    committed by then; newer rows go into the next snapshot.
+
+    Returns:
+        int: number of snapshots created
+    """
+    last_snapshot_txn = PointsBalanceSnapshot.objects.aggregate(last=Max('last_transaction_id'))['last'] or 0
+    settled_before = timezone.now() - SNAPSHOT_GRACE_PERIOD
+    latest_txn = PointsTransaction.objects.filter(
+        created_at__lte=settled_before,
+    ).aggregate(last=Max('id'))['last'] or 0
+    if latest_txn <= last_snapshot_txn:
+        return 0
+
+    changed_user_ids = PointsTransaction.objects.filter(
+        id__gt=last_snapshot_txn,
+        id__lte=latest_txn,
+    ).values_list('user_id', flat=True).distinct()
+
+    now = timezone.now()
+    created = 0
+    batch = []
+    previous = PointsBalanceSnapshot.objects.filter(user=OuterRef('pk')).order_by('-last_transaction_id')
+    ledger_since_previous = PointsTransaction.objects.filter(
+        user=OuterRef('pk'),
+        id__gt=OuterRef('previous_txn'),
+        id__lte=latest_txn,
+    ).order_by().values('user').annotate(total=Sum('amount')).values('total')
+    users = User.objects.filter(id__in=changed_user_ids).annotate(
+        previous_balance=Coalesce(Subquery(previous.values('balance')[:1]), 0),
+        previous_txn=Coalesce(Subquery(previous.values('last_transaction_id')[:1]), 0),
+    ).annotate(
+        delta=Coalesce(Subquery(ledger_since_previous), 0),
+    ).values_list('id', 'previous_balance', 'delta')
+    for user_id, previous_balance, delta in users.iterator(chunk_size=batch_size):
+        batch.append(PointsBalanceSnapshot(
+            user_id=user_id,
+            balance=max(previous_balance + delta, 0),
+            last_transaction_id=latest_txn,
+            taken_at=now,
+        ))
+        if len(batch) >= batch_size:
+            PointsBalanceSnapshot.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        PointsBalanceSnapshot.objects.bulk_create(batch)
+        created += len(batch)
+
+    logger.info(f"Created {created} points balance snapshots (up to transaction {latest_txn})")
+    return created
@@ -0,0 +1,134 @@
+"""
+Family roster: the members of a family plus its owner as compact records.
+
+Many views, emails and the quick-add parser need "everyone in the family".
+Instead of loading full User rows (with the notification JSON) and calling
+get_display_name() each time, get_family_roster() loads the needed columns
+once, builds a tuple of RosterMember records and keeps it in the Django
+cache. a_family.signals invalidate the entry whenever a membership or
+profile changes.
+
+Points balances change on every approval and claim, so they are not taken
+from the cache: each read loads them live with one primary-key query. With
+the default per-process LocMemCache an invalidation only reaches the worker
+that made it; set REDIS_URL (see CACHES in settings) so all workers share
+the cache.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Family, User
+
+ROSTER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'role', 'points', 'notification_preferences',
+)
+
+# Changing any of these User fields makes cached rosters stale (points are read live)
+ROSTER_USER_FIELDS = frozenset(ROSTER_FIELDS) - {'points'}
+
+ROLE_LABELS = dict(User.ROLE_CHOICES)
+
+
+class RosterMember:
+    """Read-only snapshot of one family user, duck-typed like User where consumers need it"""
+
+    __slots__ = ROSTER_FIELDS + ('display_name',)
+
+    def __init__(self, user):
+        for field in ROSTER_FIELDS:
+            setattr(self, field, getattr(user, field))
+        self.display_name = user.get_display_name()
+
+    def __eq__(self, other):
+        return isinstance(other, (RosterMember, User)) and self.id == other.pk
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_display_name(self):
+        return self.display_name
+
+    def get_role_display(self):
+        return ROLE_LABELS.get(self.role, self.role)
+
+    def wants(self, preference_key):
+        """Notification preference, enabled unless explicitly turned off"""
+        return (self.notification_preferences or {}).get(preference_key, True)
+
+    def as_dict(self):
+        """Member payload used by the JSON API"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'role': self.role,
+            'points': self.points,
+            'display_name': self.display_name,
+        }
+
+
+def _cache_key(family_id):
+    return f'family_roster:{family_id}'
+
+
+def get_family_roster(family):
+    """
+    All family users (members + owner) without duplicates, ordered by id.
+
+    Returns:
+        tuple of RosterMember
+    """
+    key = _cache_key(family.pk)
+    roster = cache.get(key)
+    if roster is not None:
+        # The cached copy's balances may be stale
+        points = dict(User.objects.filter(pk__in=[member.id for member in roster]).values_list('id', 'points'))
+        for member in roster:
+            member.points = points.get(member.id, 0)
+        return roster
+
+    member_ids = Family.members.through.objects.filter(family_id=family.pk).values('user_id')
+    users = User.objects.filter(Q(pk__in=member_ids) | Q(pk=family.owner_id)).only(*ROSTER_FIELDS).order_by('id')
+    roster = tuple(RosterMember(user) for user in users)
+    cache.set(key, roster, settings.FAMILY_ROSTER_CACHE_SECONDS)
+    return roster
+
+
+def get_roster_member(roster, user_id):
+    """Find a user in a roster by id, or None"""
+    for member in roster:
+        if member.id == user_id:
+            return member
+    return None
+
+
+def invalidate_family_rosters(family_ids):
+    """
+    Drop cached rosters now and again after commit, so a concurrent request
+    cannot re-cache rows that were read before this transaction committed.
+    """
+    keys = [_cache_key(family_id) for family_id in family_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_user_rosters(user_ids):
+    """Drop the cached rosters of every family these users belong to or own"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    family_ids = set(
+        Family.members.through.objects.filter(user_id__in=user_ids).values_list('family_id', flat=True)
+    )
+    family_ids.update(Family.objects.filter(owner_id__in=user_ids).values_list('id', flat=True))
+    invalidate_family_rosters(family_ids)
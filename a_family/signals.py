@@ -0,0 +1,74 @@
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Family, User
+from .roster_utils import ROSTER_USER_FIELDS, invalidate_family_rosters, invalidate_user_rosters
+
+
+@receiver(post_save, sender=Family)
+def set_owner_active_family(sender, instance, created, raw=False, **kwargs):
+    """A new family becomes the owner's active family if they had none"""
+    if created and not raw:
+        User.objects.filter(pk=instance.owner_id, active_family__isnull=True).update(active_family=instance)
+    elif not created:
+        # The owner may have changed
+        invalidate_family_rosters([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def invalidate_rosters_on_user_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Profile changes make the user's cached family rosters stale"""
+    if created or raw:
+        return
+    if update_fields is not None and not ROSTER_USER_FIELDS.intersection(update_fields):
+        # e.g. last_login on every login
+        return
+    invalidate_user_rosters([instance.pk])
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_rosters_on_user_delete(sender, instance, **kwargs):
+    """Memberships are gone after delete, so invalidate before"""
+    invalidate_user_rosters([instance.pk])
+
+
+@receiver(m2m_changed, sender=Family.members.through)
+def track_active_family(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep User.active_family and cached family rosters in step with memberships.
+    Joining makes the family active; leaving (remove/clear) falls back to
+    another family the user belongs to or owns.
+    """
+    from .utils import refresh_active_family
+
+    # Cached rosters of every affected family
+    if reverse:
+        if action in ('post_add', 'post_remove') and pk_set:
+            invalidate_family_rosters(pk_set)
+        elif action == 'pre_clear':
+            # The user's families can only be read before they are cleared
+            invalidate_user_rosters([instance.pk])
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_family_rosters([instance.pk])
+
+    if action == 'post_add' and pk_set:
+        if reverse:
+            # user.families.add(...)
+            family = Family.objects.filter(pk__in=pk_set).order_by('-created_at').first()
+            User.objects.filter(pk=instance.pk).update(active_family=family)
+        else:
+            User.objects.filter(pk__in=pk_set).update(active_family=instance)
+    elif action == 'post_remove' and pk_set:
+        if reverse:
+            affected = User.objects.filter(pk=instance.pk, active_family_id__in=pk_set)
+        else:
+            affected = User.objects.filter(pk__in=pk_set, active_family=instance)
+        for user in affected:
+            refresh_active_family(user)
+    elif action == 'post_clear':
+        if reverse:
+            affected = User.objects.filter(pk=instance.pk)
+        else:
+            affected = User.objects.filter(active_family=instance)
+        for user in affected:
+            refresh_active_family(user)
@@ -105,6 +105,17 @@ class FamilyModelTest(TestCase):
         self.assertEqual(family.name, 'Test Family')
         self.assertEqual(family.owner, self.parent)
     
+    def test_join_code_collision_retries(self):
+        """A duplicate join code is retried with a new code instead of failing"""
+        from unittest import mock
+
+        first = Family.objects.create(name='First', owner=self.parent)
+        codes = iter([first.join_code, 'NEWCODE1'])
+        with mock.patch.object(Family, '_generate_join_code', side_effect=lambda: next(codes)):
+            second = Family.objects.create(name='Second', owner=self.parent)
+        self.assertEqual(second.join_code, 'NEWCODE1')
+        self.assertEqual(Family.objects.count(), 2)
+    
     def test_family_members(self):
         """Test adding members to family"""
         family = Family.objects.create(
@@ -135,3 +146,500 @@ class FamilyModelTest(TestCase):
             owner=self.parent
         )
         self.assertEqual(str(family), 'Test Family')
+
+
+class PointsLedgerTest(TestCase):
+    """Test points ledger utilities"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.child)
+
+    def test_add_and_deduct_points_write_ledger(self):
+        """Test balance changes are mirrored in the ledger"""
+        from django.db.models import Sum
+        from .models import PointsTransaction
+        from .points_utils import add_points, deduct_points
+
+        add_points(self.child, 50, PointsTransaction.REASON_TASK_APPROVED, family=self.family)
+        self.assertEqual(self.child.points, 50)
+
+        deducted = deduct_points(self.child, 30, PointsTransaction.REASON_REWARD_CLAIMED, family=self.family)
+        self.assertEqual(deducted, 30)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 20)
+
+        ledger_total = self.child.points_transactions.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(ledger_total, self.child.points)
+
+    def test_deduct_points_never_overdraws(self):
+        """Test strict deductions fail and partial deductions clamp to zero"""
+        from .models import PointsTransaction
+        from .points_utils import add_points, deduct_points
+
+        add_points(self.child, 10, PointsTransaction.REASON_TASK_APPROVED)
+
+        self.assertEqual(
+            deduct_points(self.child, 20, PointsTransaction.REASON_REWARD_CLAIMED, allow_partial=False),
+            0
+        )
+        self.assertEqual(self.child.points, 10)
+
+        self.assertEqual(deduct_points(self.child, 20, PointsTransaction.REASON_TASK_UNAPPROVED), 10)
+        self.assertEqual(self.child.points, 0)
+        self.assertEqual(self.child.points_transactions.count(), 2)
+
+    def test_points_earned_and_snapshots(self):
+        """Test period totals and balance snapshots"""
+        from django.utils import timezone
+        from .models import PointsBalanceSnapshot, PointsTransaction
+        from .points_utils import (
+            SNAPSHOT_GRACE_PERIOD, add_points, deduct_points, get_points_earned, snapshot_points_balances,
+        )
+
+        week_ago = timezone.now() - timezone.timedelta(days=7)
+        add_points(self.child, 40, PointsTransaction.REASON_TASK_APPROVED, family=self.family)
+        deduct_points(self.child, 15, PointsTransaction.REASON_REWARD_CLAIMED, family=self.family)
+
+        # Reward claims are spending, not earning
+        self.assertEqual(get_points_earned(week_ago, family=self.family), 40)
+        self.assertEqual(get_points_earned(week_ago, user=self.parent), 0)
+
+        # Rows inside the grace period may still have lower ids uncommitted
+        self.assertEqual(snapshot_points_balances(), 0)
+        settled = timezone.now() - SNAPSHOT_GRACE_PERIOD
+        PointsTransaction.objects.update(created_at=settled)
+        self.assertEqual(snapshot_points_balances(), 1)
+        snapshot = PointsBalanceSnapshot.objects.get(user=self.child)
+        self.assertEqual(snapshot.balance, 25)
+        # Nothing changed since the last snapshot
+        self.assertEqual(snapshot_points_balances(), 0)
+
+        # Later snapshots build on the previous one plus the ledger, not on User.points
+        add_points(self.child, 10, PointsTransaction.REASON_TASK_APPROVED, family=self.family)
+        User.objects.filter(pk=self.child.pk).update(points=999)
+        PointsTransaction.objects.update(created_at=settled)
+        self.assertEqual(snapshot_points_balances(), 1)
+        latest = PointsBalanceSnapshot.objects.filter(user=self.child).order_by('-last_transaction_id').first()
+        self.assertEqual(latest.balance, 35)
+
+    def test_ledger_is_append_only(self):
+        """Test existing ledger entries cannot be modified"""
+        from .models import PointsTransaction
+        from .points_utils import add_points
+
+        entry = add_points(self.child, 5, PointsTransaction.REASON_ADJUSTMENT)
+        entry.amount = 500
+        with self.assertRaises(ValueError):
+            entry.save()
+
+
+class ActiveFamilyTest(TestCase):
+    """Test the denormalized User.active_family pointer"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+
+    def test_owner_gets_new_family(self):
+        """Creating a family points its owner at it"""
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.active_family_id, self.family.id)
+
+    def test_join_and_leave(self):
+        """Joining sets the pointer, leaving clears it"""
+        self.family.members.add(self.child)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.active_family_id, self.family.id)
+
+        self.family.members.remove(self.child)
+        self.child.refresh_from_db()
+        self.assertIsNone(self.child.active_family_id)
+
+    def test_leave_falls_back_to_other_family(self):
+        """Leaving the active family falls back to another membership"""
+        other = Family.objects.create(name='Other Family', owner=self.parent)
+        other.members.add(self.child)
+        self.family.members.add(self.child)
+        self.family.members.clear()
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.active_family_id, other.id)
+
+    def test_family_delete_clears_pointer(self):
+        """Deleting a family nulls the pointer; the next lookup resolves again"""
+        from .utils import get_family_for_user
+
+        self.family.delete()
+        self.parent.refresh_from_db()
+        self.assertIsNone(self.parent.active_family_id)
+        self.assertIsNone(get_family_for_user(self.parent))
+
+    def test_repeat_lookups_are_cached(self):
+        """get_family_for_user costs one query per user instance"""
+        from .utils import get_family_for_user
+
+        user = User.objects.get(pk=self.parent.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_family_for_user(user), self.family)
+            self.assertEqual(get_family_for_user(user), self.family)
+
+    def test_missing_pointer_is_backfilled(self):
+        """Users without a stored pointer get it on first lookup"""
+        from .utils import get_family_for_user
+
+        self.family.members.add(self.child)
+        User.objects.filter(pk=self.child.pk).update(active_family=None)
+        child = User.objects.get(pk=self.child.pk)
+        self.assertEqual(get_family_for_user(child), self.family)
+        child.refresh_from_db()
+        self.assertEqual(child.active_family_id, self.family.id)
+
+
+class FamilyRosterTest(TestCase):
+    """Test the cached family roster"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT,
+            first_name='Mari',
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD,
+            first_name='Juku',
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.parent, self.child)
+
+    def test_roster_is_cached(self):
+        """Members and owner are listed once and the second read hits the cache"""
+        from .roster_utils import get_family_roster
+
+        roster = get_family_roster(self.family)
+        self.assertEqual([member.id for member in roster], [self.parent.id, self.child.id])
+        self.assertEqual(roster[1].get_display_name(), 'Juku')
+        self.assertEqual(roster[1].get_role_display(), 'Laps')
+        # Only the live points lookup
+        with self.assertNumQueries(1):
+            get_family_roster(self.family)
+
+    def test_owner_outside_members(self):
+        """The owner is included even if not a member"""
+        from .roster_utils import get_family_roster
+
+        self.family.members.remove(self.parent)
+        roster = get_family_roster(self.family)
+        self.assertEqual({member.id for member in roster}, {self.parent.id, self.child.id})
+
+    def test_invalidated_on_changes(self):
+        """Membership, profile and points changes are visible in the next read"""
+        from .points_utils import add_points
+        from .roster_utils import get_family_roster
+        from .models import PointsTransaction
+
+        get_family_roster(self.family)
+        add_points(self.child, 10, PointsTransaction.REASON_ADJUSTMENT)
+        self.assertEqual(get_family_roster(self.family)[1].points, 10)
+        # Balances are read live, even when another worker changed them
+        User.objects.filter(pk=self.child.pk).update(points=42)
+        self.assertEqual(get_family_roster(self.family)[1].points, 42)
+
+        self.child.first_name = 'Jaan'
+        self.child.save()
+        self.assertEqual(get_family_roster(self.family)[1].display_name, 'Jaan')
+
+        self.family.members.remove(self.child)
+        self.assertEqual([member.id for member in get_family_roster(self.family)], [self.parent.id])
+
+    def test_notification_recipients(self):
+        """Email recipients come from the roster and respect preferences"""
+        from .emails import _get_users_to_notify
+
+        self.child.notification_preferences = {'task_updates': False}
+        self.child.save()
+        self.assertEqual(_get_users_to_notify(self.family, 'task_updates'), ['parent@test.com'])
+
+
+class DeferredDeletionTest(TestCase):
+    """Test pending-deletion marking and the batched purge"""
+
+    def setUp(self):
+        """Set up test data"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from a_rewards.models import Reward
+        from a_tasks.models import Task, TaskRecurrence
+
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.parent, self.child)
+        task = Task.objects.create(name='Nõud', family=self.family, created_by=self.parent, assigned_to=self.child)
+        TaskRecurrence.objects.create(
+            task=task,
+            frequency=TaskRecurrence.FREQUENCY_DAILY,
+            next_occurrence=timezone.now() + timedelta(days=1)
+        )
+        Reward.objects.create(name='Kino', points=50, family=self.family, created_by=self.parent)
+
+    def test_family_deletion_is_deferred(self):
+        """The family disappears for its users at once and is purged later"""
+        from a_tasks.models import Task, TaskRecurrence
+        from .deletion_utils import purge_pending_deletions, request_family_deletion
+        from .utils import get_family_for_user
+
+        request_family_deletion(self.family)
+
+        owner = User.objects.get(pk=self.parent.pk)
+        self.assertIsNone(get_family_for_user(owner))
+        self.child.refresh_from_db()
+        self.assertFalse(self.child.is_active)
+        self.assertTrue(Task.objects.filter(family=self.family).exists())
+
+        self.assertEqual(purge_pending_deletions(batch_size=1, sleep_seconds=0), (1, 1))
+        self.assertFalse(Family.objects.filter(pk=self.family.pk).exists())
+        self.assertFalse(User.objects.filter(pk=self.child.pk).exists())
+        self.assertFalse(Task.objects.exists())
+        self.assertFalse(TaskRecurrence.objects.exists())
+        self.assertTrue(User.objects.filter(pk=self.parent.pk).exists())
+
+    def test_keep_children(self):
+        """Children kept on family deletion stay active"""
+        from .deletion_utils import request_family_deletion
+
+        request_family_deletion(self.family, delete_children=False)
+        self.child.refresh_from_db()
+        self.assertTrue(self.child.is_active)
+        self.assertIsNone(self.child.deletion_requested_at)
+
+    def test_account_deletion_view(self):
+        """Deleting the owner's account queues the account and the family"""
+        from django.urls import reverse
+        from .deletion_utils import purge_pending_deletions
+
+        self.client.force_login(self.parent)
+        response = self.client.post(reverse('a_account:delete_account'), {'delete_children': 'keep'})
+        self.assertEqual(response.status_code, 302)
+        self.parent.refresh_from_db()
+        self.assertFalse(self.parent.is_active)
+        self.assertIsNotNone(self.parent.deletion_requested_at)
+
+        purge_pending_deletions(sleep_seconds=0)
+        self.assertFalse(User.objects.filter(pk=self.parent.pk).exists())
+        self.assertFalse(Family.objects.filter(pk=self.family.pk).exists())
+        self.assertTrue(User.objects.filter(pk=self.child.pk, is_active=True).exists())
+
+
+class FamilyExportTest(TestCase):
+    """Test the streaming family data export"""
+
+    def setUp(self):
+        """Set up test data"""
+        from a_tasks.models import Task
+
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.parent, self.child)
+        for i in range(3):
+            Task.objects.create(name=f'Ülesanne {i}', family=self.family, created_by=self.parent)
+
+    def _read_archive(self, chunks):
+        import io
+        import json
+        import zipfile
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        return {
+            name: [json.loads(line) for line in archive.read(name).decode('utf-8').splitlines()]
+            for name in archive.namelist() if name.endswith('.ndjson')
+        }
+
+    def test_archive_contents(self):
+        """Every table is one NDJSON entry; users carry no password hash"""
+        from .export_utils import iter_family_export
+
+        entries = self._read_archive(iter_family_export(self.family, chunk_size=2))
+        self.assertEqual([task['name'] for task in entries['tasks.ndjson']], ['Ülesanne 0', 'Ülesanne 1', 'Ülesanne 2'])
+        self.assertEqual({user['id'] for user in entries['users.ndjson']}, {self.parent.id, self.child.id})
+        self.assertNotIn('password', entries['users.ndjson'][0])
+        self.assertEqual(entries['rewards.ndjson'], [])
+
+    def test_download_is_parent_only(self):
+        """Parents get a streamed ZIP, children are redirected"""
+        from django.urls import reverse
+
+        self.client.force_login(self.child)
+        response = self.client.get(reverse('a_family:export_data'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.parent)
+        response = self.client.get(reverse('a_family:export_data'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(len(self._read_archive(response.streaming_content)['tasks.ndjson']), 3)
+
+
+class FamilyContextTest(TestCase):
+    """Test per-session family selection (FamilyContextMiddleware)"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.home = Family.objects.create(name='Kodu', owner=self.parent)
+        self.home.members.add(self.parent)
+        self.other_owner = User.objects.create_user(
+            username='grandma',
+            email='grandma@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.other = Family.objects.create(name='Vanaema pere', owner=self.other_owner)
+        self.other.members.add(self.other_owner)
+        self.other.members.add(self.parent)
+        self.client.force_login(self.parent)
+
+    def _current_family_id(self):
+        from django.urls import reverse
+
+        return self.client.get(reverse('a_api:family')).json()['id']
+
+    def test_switch_family(self):
+        """Switching changes the family seen by the following requests"""
+        from django.urls import reverse
+
+        self.client.post(reverse('a_family:switch_family'), {'family_id': str(self.home.id)})
+        self.assertEqual(self._current_family_id(), str(self.home.id))
+
+        response = self.client.post(reverse('a_family:switch_family'), {'family_id': str(self.other.id)})
+        self.assertRedirects(response, reverse('a_dashboard:dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self._current_family_id(), str(self.other.id))
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.active_family_id, self.other.id)
+
+        families = self.client.get(reverse('a_api:families')).json()
+        self.assertEqual(families['current_id'], str(self.other.id))
+        self.assertEqual(families['role'], User.ROLE_PARENT)
+        self.assertEqual([family['name'] for family in families['families']], ['Kodu', 'Vanaema pere'])
+
+    def test_foreign_family_rejected(self):
+        """Families the user does not belong to cannot be selected"""
+        import json
+        from django.urls import reverse
+
+        stranger = User.objects.create_user(username='stranger', password='testpass123', role=User.ROLE_PARENT)
+        foreign = Family.objects.create(name='Võõras pere', owner=stranger)
+        before = self._current_family_id()
+
+        self.client.post(reverse('a_family:switch_family'), {'family_id': str(foreign.id)})
+        self.client.post(reverse('a_family:switch_family'), {'family_id': 'not-a-uuid'})
+        response = self.client.post(
+            reverse('a_api:select_family'), json.dumps({'family_id': str(foreign.id)}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self._current_family_id(), before)
+
+    def test_stale_selection_falls_back(self):
+        """Leaving the selected family falls back to the remaining one"""
+        from django.urls import reverse
+
+        self.client.post(reverse('a_family:switch_family'), {'family_id': str(self.other.id)})
+        self.other.members.remove(self.parent)
+        self.assertEqual(self._current_family_id(), str(self.home.id))
+
+    def test_family_resolved_once_per_request(self):
+        """Views reuse request.family instead of looking the family up again"""
+        from django.test import RequestFactory
+        from .utils import get_request_family
+        from .middleware import FamilyContextMiddleware
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=self.parent.pk)
+        request.session = {}
+        seen = []
+        middleware = FamilyContextMiddleware(lambda req: seen.append(get_request_family(req)))
+        with self.assertNumQueries(1):
+            middleware(request)
+            get_request_family(request)
+        # Joined last, so it is the active family
+        self.assertEqual(seen, [self.other])
+
+    def test_add_family_only_by_joining(self):
+        """Owners cannot create a second family (and a fresh quota) via ?add=1, only join one"""
+        from django.urls import reverse
+        from a_subscription.models import Subscription
+
+        url = reverse('a_family:onboarding') + '?add=1'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['can_create_family'])
+
+        self.client.post(url, {'action': 'create', 'name': 'Teine pere'})
+        self.assertEqual(Family.objects.filter(owner=self.parent).count(), 1)
+
+        friend = User.objects.create_user(username='friend', password='testpass123', role=User.ROLE_PARENT)
+        friends = Family.objects.create(name='Sõprade pere', owner=friend)
+        friends.members.add(friend)
+        # A second parent seat needs a paid plan on the joined family
+        Subscription.objects.create(owner=friend, tier=Subscription.TIER_PRO, status=Subscription.STATUS_ACTIVE)
+        response = self.client.post(url, {'action': 'join', 'join_code': friends.join_code})
+        self.assertRedirects(response, reverse('a_dashboard:dashboard'), fetch_redirect_response=False)
+        self.assertTrue(friends.members.filter(pk=self.parent.pk).exists())
@@ -11,6 +11,8 @@ urlpatterns = [
     path('manage-child/<int:child_id>/', views.manage_child_account, name='manage_child_account'),
     path('delete-child-account/', views.delete_child_account, name='delete_child_account'),
     path('delete-family/', views.delete_family, name='delete_family'),
+    path('export/', views.export_data, name='export_data'),
+    path('switch/', views.switch_family, name='switch_family'),
     path('', views.index, name='index'),
 ]
 
@@ -1,37 +1,178 @@
 """
 Utility functions for family-related operations.
 """
-from .models import Family
+from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
+
+from .models import Family, User
 
 
 def get_family_for_user(user):
     """
-    Get the first family for a user (as owner or member).
-    
-    Checks in this order:
-    1. Families where user is a member (via ManyToMany relationship)
-    2. Families where user is the owner
-    
+    Get the family shown to a user (as owner or member).
+
+    Reads the denormalized User.active_family pointer, which a_family.signals
+    keeps in step with memberships. On request.user Django caches the
+    related object, so repeated calls in one request cost one query at most.
+    Users without a stored pointer fall back to refresh_active_family().
+
     Args:
         user: User instance
-        
+
     Returns:
         Family instance or None if user has no associated family
     """
     if not user or not user.is_authenticated:
         return None
-    
+
+    if user.active_family_id:
+        return user.active_family
+    return refresh_active_family(user)
+
+
+def resolve_family_for_user(user):
+    """
+    Look up a user's family from memberships and ownership.
+
+    Checks in this order:
+    1. Families where user is a member (via ManyToMany relationship)
+    2. Families where user is the owner
+    Families pending deletion are skipped.
+    """
+    # user.families is the reverse relation from Family.members ManyToManyField
+    family = user.families.filter(deletion_requested_at__isnull=True).first()
+    if family is None:
+        family = Family.objects.filter(owner=user, deletion_requested_at__isnull=True).first()
+    return family
+
+
+def refresh_active_family(user):
+    """
+    Recompute and store user.active_family.
+
+    Returns:
+        Family instance or None
+    """
+    family = resolve_family_for_user(user)
+    if family is not None or user.active_family_id is not None:
+        User.objects.filter(pk=user.pk).update(active_family=family)
+    user.active_family = family
+    return family
+
+
+# Session key holding the family a user picked with select_family()
+SESSION_FAMILY_KEY = 'family_id'
+
+
+def _user_families(user):
+    """Families the user belongs to or owns, excluding families pending deletion"""
+    from django.db.models import Q
+
+    return Family.objects.filter(
+        Q(owner=user) | Q(pk__in=Family.members.through.objects.filter(user_id=user.pk).values('family_id')),
+        deletion_requested_at__isnull=True,
+    )
+
+
+def get_user_families(user):
+    """All families a user can switch between, ordered by name"""
+    if not user or not user.is_authenticated:
+        return []
+    return list(_user_families(user).order_by('name'))
+
+
+def select_family(request, family_id):
+    """
+    Make family_id the family shown to request.user in this session.
+
+    The choice is also stored as User.active_family, so new sessions and
+    API clients start in the same family.
+
+    Returns:
+        Family instance or None if the user does not belong to that family
+    """
+    user = request.user
     try:
-        # Try to get family where user is a member first (more common)
-        # user.families is the reverse relation from Family.members ManyToManyField
-        family = user.families.first()
-        
-        if family is None:
-            # If not a member, check if user is owner
-            family = Family.objects.filter(owner=user).first()
-        
-        return family
-    except Exception:
-        # Fallback: try owner lookup if reverse relation fails
-        return Family.objects.filter(owner=user).first()
+        family = _user_families(user).filter(pk=family_id).first()
+    except (ValueError, ValidationError):
+        # Not a UUID
+        return None
+    if family is None:
+        return None
+    request.session[SESSION_FAMILY_KEY] = str(family.pk)
+    if user.active_family_id != family.pk:
+        User.objects.filter(pk=user.pk).update(active_family=family)
+        user.active_family = family
+    request.family = family
+    request.family_context = FamilyContext(user, family)
+    return family
+
+
+def resolve_request_family(request):
+    """
+    Family for this request: the one selected in the session, else the
+    user's active family.
+
+    When the session choice equals User.active_family (the usual case,
+    since select_family stores both) this is the cached FK lookup of
+    get_family_for_user; only a choice made in another session costs a
+    membership check.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return None
+
+    session = getattr(request, 'session', None)
+    family_id = session.get(SESSION_FAMILY_KEY) if session is not None else None
+    if family_id and family_id != str(user.active_family_id):
+        family = _user_families(user).filter(pk=family_id).first()
+        if family is not None:
+            return family
+        # Left or deleted since it was selected
+        session.pop(SESSION_FAMILY_KEY, None)
+    return get_family_for_user(user)
+
+
+def get_request_family(request):
+    """
+    The family of the current request.
+
+    Uses request.family set by FamilyContextMiddleware, so views share the
+    single lookup made per request.
+    """
+    if not hasattr(request, 'family'):
+        request.family = resolve_request_family(request)
+    return request.family
+
+
+class FamilyContext:
+    """
+    Per-request family information (request.family_context).
+    The subscription tier is looked up on first use and then cached.
+    """
+
+    ROLE_OWNER = 'owner'
+
+    def __init__(self, user, family):
+        self.user = user
+        self.family = family
+
+    @property
+    def is_owner(self):
+        return self.family is not None and self.family.owner_id == self.user.pk
+
+    @property
+    def role(self):
+        """Role in this family: 'owner', 'parent' or 'child' (None without a family)"""
+        if self.family is None:
+            return None
+        return self.ROLE_OWNER if self.is_owner else self.user.role
+
+    @cached_property
+    def tier(self):
+        from a_subscription.models import Subscription
+        from a_subscription.utils import get_family_subscription
 
+        if self.family is None:
+            return Subscription.TIER_FREE
+        return get_family_subscription(self.family)
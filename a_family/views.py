@@ -5,6 +5,7 @@ import logging
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.shortcuts import redirect, render
 
 # Third-party imports
@@ -12,10 +13,12 @@ from allauth.account.adapter import get_adapter
 from allauth.account.models import EmailAddress
 
 # Local application imports
+from .deletion_utils import request_family_deletion, request_user_deletion
 from .emails import send_family_created_email, send_family_member_joined_email, send_admin_family_created_notification
+from .export_utils import export_filename, iter_family_export
 from .forms import CreateFamilyForm, JoinFamilyForm
 from .models import Family, User
-from .utils import get_family_for_user as _get_family_for_user
+from .utils import get_request_family, get_user_families, select_family
 
 
 @login_required
@@ -45,9 +48,9 @@ def onboarding(request):
             pass
     
     try:
-        # If user already has a family, redirect to dashboard
-        family = _get_family_for_user(user)
-        if family:
+        # If user already has a family, redirect to dashboard (unless adding another one)
+        family = get_request_family(request)
+        if family and request.GET.get('add') != '1':
             return redirect('a_dashboard:dashboard')
     except Exception as e:
         # Log error but allow user to continue to onboarding page
@@ -62,10 +65,17 @@ def onboarding(request):
     join_form = JoinFamilyForm()
     error_message = None
     
+    # One owned family per account: the monthly quota is counted per family, so extra
+    # families would multiply the owner's limits. Other families can only be joined.
+    owns_family = Family.objects.filter(owner=user, deletion_requested_at__isnull=True).exists()
+    can_create_family = is_parent and not owns_family
+    
     if request.method == 'POST':
         action = request.POST.get('action')
         
-        if action == 'create' and is_parent:
+        if action == 'create' and is_parent and owns_family:
+            messages.error(request, 'Sul on juba oma pere. Teiste peredega saad liituda nende kutsekoodiga.')
+        elif action == 'create' and is_parent:
             create_form = CreateFamilyForm(request.POST)
             if create_form.is_valid():
                 family_name = create_form.cleaned_data['name']
@@ -75,6 +85,7 @@ def onboarding(request):
                         owner=user,
                     )
                     family.members.add(user)
+                    select_family(request, family.pk)
                     messages.success(request, f'Pere "{family_name}" loodud edukalt!')
                 except Exception as e:
                     import logging
@@ -106,10 +117,10 @@ def onboarding(request):
                     
                     with transaction.atomic():
                         # Use select_for_update to prevent race conditions
-                        family = Family.objects.select_for_update().get(join_code=join_code)
+                        family = Family.objects.select_for_update().get(join_code=join_code, deletion_requested_at__isnull=True)
                         
                         # Check if user is already a member
-                        if family.owner == user or user in family.members.all():
+                        if family.owner_id == user.id or family.members.filter(pk=user.pk).exists():
                             messages.info(request, 'Sa oled selle pere liige juba.')
                             return redirect('a_dashboard:dashboard')
                         
@@ -123,6 +134,7 @@ def onboarding(request):
                             )
                         else:
                             family.members.add(user)
+                            select_family(request, family.pk)
                             messages.success(request, f'Liitusid perega "{family.name}"!')
                             try:
                                 send_family_member_joined_email(request, family, user)
@@ -144,6 +156,7 @@ def onboarding(request):
     context = {
         'is_parent': is_parent,
         'is_child': is_child,
+        'can_create_family': can_create_family,
         'create_form': create_form,
         'join_form': join_form,
         'error_message': error_message,
@@ -156,7 +169,7 @@ def onboarding(request):
 def index(request):
     """Family page - shows family info and invite code"""
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
     
     # Redirect to onboarding if user doesn't have a family
     if not family:
@@ -182,15 +195,30 @@ def index(request):
         'is_parent': is_parent,
         'is_owner': is_owner,
         'today': date.today(),
+        'user_families': get_user_families(user),
     }
     return render(request, 'a_family/index.html', context)
 
 
+@login_required
+def switch_family(request):
+    """Switch the family shown in this session"""
+    if request.method != 'POST':
+        return redirect('a_family:index')
+
+    family = select_family(request, request.POST.get('family_id'))
+    if family is None:
+        messages.error(request, 'Sa ei kuulu sellesse peresse.')
+    else:
+        messages.success(request, f'Aktiivne pere: {family.name}')
+    return redirect('a_dashboard:dashboard')
+
+
 @login_required
 def remove_member(request, user_id):
     """Remove a member from the family"""
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
     
     # Check if user is the owner
     if not family or family.owner != user:
@@ -352,7 +380,7 @@ def delete_family(request):
         return redirect(f"{reverse('a_account:settings')}?section=general")
     
     # Get the family
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         messages.error(request, 'Sa ei kuulu ühelegi peresse.')
         return redirect(f"{reverse('a_account:settings')}?section=general")
@@ -368,33 +396,35 @@ def delete_family(request):
     if delete_children_choice not in ('delete', 'keep'):
         delete_children_choice = 'delete'
 
-    child_accounts = list(family.members.filter(role=User.ROLE_CHILD))
-    if delete_children_choice == 'delete':
-        for child in child_accounts:
-            try:
-                from allauth.account.models import EmailAddress
-                EmailAddress.objects.filter(user=child).delete()
-            except Exception:
-                pass
-            child.delete()
-    else:
-        for child in child_accounts:
-            family.members.remove(child)
-
-    # Remove remaining members from the family to break associations
-    family.members.clear()
-    
-    # Note: Tasks have CASCADE delete on family FK (family=models.ForeignKey(Family, on_delete=models.CASCADE))
-    # So they'll be deleted automatically when the family is deleted
-    # Shopping items, rewards, etc. are tied to users, not families, so they stay
-    
-    # Delete the family (this will CASCADE delete tasks)
-    family.delete()
+    # Tasks, rewards, history etc. are purged in the background (a_family.deletion_utils)
+    request_family_deletion(family, delete_children=delete_children_choice == 'delete')
     
     messages.success(request, f'Pere "{family_name}" kustutatud edukalt.')
     return redirect('a_dashboard:dashboard')
 
 
+@login_required
+def export_data(request):
+    """Download all family data as a ZIP of NDJSON files - only for parents"""
+    user = request.user
+
+    if user.role != User.ROLE_PARENT:
+        messages.error(request, 'Pere andmeid saavad alla laadida ainult lapsevanemad.')
+        return redirect('a_dashboard:dashboard')
+
+    family = get_request_family(request)
+    if not family:
+        messages.error(request, 'Sa ei kuulu ühelegi peresse.')
+        return redirect('a_family:onboarding')
+
+    logging.getLogger(__name__).info(f"User {user.id} exported data of family {family.id}")
+    # The archive is built while it is sent (a_family.export_utils)
+    response = StreamingHttpResponse(iter_family_export(family), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(family)}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
 @login_required
 def delete_child_account(request):
     """Delete child account - only for parents"""
@@ -421,7 +451,7 @@ def delete_child_account(request):
         return redirect('a_family:index')
     
     # Get the family
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         messages.error(request, 'Sa ei kuulu ühelegi peresse.')
         return redirect('a_family:onboarding')
@@ -445,18 +475,8 @@ def delete_child_account(request):
     
     child_name = child.get_display_name()
     
-    # Remove child from family
-    family.members.remove(child)
-    
-    # Delete EmailAddress records
-    try:
-        from allauth.account.models import EmailAddress
-        EmailAddress.objects.filter(user=child).delete()
-    except Exception:
-        pass
-    
-    # Delete child account
-    child.delete()
+    # Deactivate now, purge in the background (a_family.deletion_utils)
+    request_user_deletion([child.id])
     
     messages.success(request, f'{child_name} konto kustutatud edukalt.')
     return redirect('a_family:index')
@@ -473,7 +493,7 @@ def manage_child_account(request, child_id):
         return redirect('a_dashboard:dashboard')
     
     # Get the family
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
     if not family:
         messages.error(request, 'Sa ei kuulu ühelegi peresse.')
         return redirect('a_family:onboarding')
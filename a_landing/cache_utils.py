@@ -0,0 +1,85 @@
+"""
+Caching for the static marketing pages of a_landing.
+
+The landing pages do not depend on the visitor, so cache_landing_page()
+keeps the rendered HTML in the Django cache and answers repeat hits without
+rendering templates or running context processors. Responses carry an ETag
+and Cache-Control (public for anonymous visitors), so browsers revalidate
+with a 304 and CDNs can serve ad traffic without reaching Django at all.
+
+For the cheapest path, `manage.py prerender_landing` writes the same pages
+to LANDING_PRERENDER_DIR, which WhiteNoise serves before the rest of the
+middleware stack when LANDING_PRERENDER is enabled.
+"""
+import hashlib
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+# Pages prerendered to static files: (url name, file path inside LANDING_PRERENDER_DIR)
+PRERENDERED_PAGES = (
+    ('a_landing:landing_index', 'index.html'),
+    ('a_landing:privacy_policy', 'privacy-policy/index.html'),
+    ('a_landing:terms_of_service', 'terms-of-service/index.html'),
+)
+
+
+@lru_cache(maxsize=None)
+def get_asset_version():
+    """
+    Version for the ?v= query on styles.css: a hash of the file, so it only
+    changes when the stylesheet does and is the same in every worker.
+    """
+    path = finders.find('styles.css')
+    if not path:
+        return ''
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()[:12]
+
+
+def _cache_key(request, authenticated):
+    # Query strings (utm_* from ads) do not change the page
+    variant = 'user' if authenticated else 'anon'
+    return f"landing_page:{request.path}:{translation.get_language()}:{variant}"
+
+
+def cache_landing_page(view):
+    """
+    Cache a landing view's HTML per path, language and auth state.
+
+    Only successful GET/HEAD responses are cached; LANDING_PAGE_CACHE_SECONDS=0
+    turns caching off (the default with DEBUG).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not settings.LANDING_PAGE_CACHE_SECONDS:
+            return view(request, *args, **kwargs)
+
+        authenticated = request.user.is_authenticated
+        key = _cache_key(request, authenticated)
+        cached = cache.get(key)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            content = response.content
+            cached = (content, response['Content-Type'], f'"{hashlib.md5(content).hexdigest()}"')
+            cache.set(key, cached, settings.LANDING_PAGE_CACHE_SECONDS)
+
+        content, content_type, etag = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        if authenticated:
+            patch_cache_control(response, private=True, max_age=settings.LANDING_PAGE_MAX_AGE)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.LANDING_PAGE_MAX_AGE)
+        # 304 Not Modified when the browser already has this version
+        return get_conditional_response(request, etag=etag, response=response)
+
+    return wrapper
+
@@ -0,0 +1,57 @@
+"""
+Management command to prerender the landing pages to static HTML files.
+
+The files are written to LANDING_PRERENDER_DIR; with LANDING_PRERENDER=True
+WhiteNoise serves them (/ -> index.html, /privacy-policy/ -> privacy-policy/index.html)
+before any other middleware runs. Run it after collectstatic on every deploy,
+since WhiteNoise only picks up files that exist when the process starts.
+
+Usage:
+    python manage.py prerender_landing
+    python manage.py prerender_landing --force  # Also when LANDING_PRERENDER is off
+"""
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from a_landing.cache_utils import PRERENDERED_PAGES
+
+
+class Command(BaseCommand):
+    help = 'Prerender the landing pages to static HTML files served by WhiteNoise'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Prerender even when LANDING_PRERENDER is disabled',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.LANDING_PRERENDER and not options['force']:
+            self.stdout.write('LANDING_PRERENDER is disabled, nothing to do.')
+            return
+
+        output_dir = settings.LANDING_PRERENDER_DIR
+        factory = RequestFactory()
+        written = 0
+        for url_name, file_path in PRERENDERED_PAGES:
+            path = reverse(url_name)
+            request = factory.get(path, SERVER_NAME='perekas.ee')
+            request.user = AnonymousUser()
+            view = resolve(path).func
+            # Render directly, bypassing the page cache
+            response = getattr(view, '__wrapped__', view)(request)
+            if response.status_code != 200:
+                self.stdout.write(self.style.ERROR(f"{path}: HTTP {response.status_code}, skipped"))
+                continue
+
+            target = output_dir / file_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(response.content)
+            written += 1
+            self.stdout.write(f"  {path} -> {target}")
+
+        self.stdout.write(self.style.SUCCESS(f"Prerendered {written} landing page(s)"))
@@ -1,3 +1,56 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+
+@override_settings(LANDING_PAGE_CACHE_SECONDS=60, LANDING_PAGE_MAX_AGE=300)
+class LandingPageCacheTest(TestCase):
+    """Test full-page caching of the landing pages"""
+
+    def setUp(self):
+        """Start every test with an empty page cache"""
+        cache.clear()
+
+    def test_cached_response_headers(self):
+        """Anonymous responses are public, carry an ETag and revalidate with 304"""
+        response = self.client.get(reverse('a_landing:landing_index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=300', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.client.get(reverse('a_landing:landing_index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_repeat_hit_skips_rendering(self):
+        """A second hit is served from the cache without rendering the template"""
+        from unittest import mock
+
+        url = reverse('a_landing:privacy_policy')
+        first = self.client.get(url)
+        with mock.patch('a_landing.views.render') as render:
+            second = self.client.get(f'{url}?utm_source=ads')
+        render.assert_not_called()
+        self.assertEqual(first.content, second.content)
+
+    def test_auth_state_variants(self):
+        """Logged-in users get their own, private cache entry"""
+        from a_family.models import User
+
+        self.client.get(reverse('a_landing:terms_of_service'))
+        user = User.objects.create_user(username='parent', password='testpass123', role=User.ROLE_PARENT)
+        self.client.force_login(user)
+        response = self.client.get(reverse('a_landing:terms_of_service'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_prerender_command(self):
+        """prerender_landing writes one HTML file per page"""
+        import io
+        import tempfile
+        from pathlib import Path
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(LANDING_PRERENDER_DIR=Path(tmp)):
+            call_command('prerender_landing', '--force', stdout=io.StringIO())
+            self.assertTrue((Path(tmp) / 'index.html').exists())
+            self.assertTrue((Path(tmp) / 'privacy-policy' / 'index.html').exists())
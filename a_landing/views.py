@@ -1,9 +1,9 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.conf import settings
-from time import time
 import logging
 
+from .cache_utils import cache_landing_page, get_asset_version
 from .forms import ReviewForm
 from .models import ReviewFormSubmission
 from a_family.emails import _send_branded_email, _get_logo_url
@@ -12,8 +12,9 @@ logger = logging.getLogger(__name__)
 
 
 # Create your views here.
+@cache_landing_page
 def index(request):
-    return render(request, 'a_landing/index.html', {'timestamp': int(time())})
+    return render(request, 'a_landing/index.html', {'asset_version': get_asset_version()})
 
 
 def features(request):
@@ -31,10 +32,12 @@ def plans(request):
     return redirect('a_landing:landing_index')
 
 
+@cache_landing_page
 def privacy_policy(request):
     return render(request, 'a_landing/privacy_policy.html')
 
 
+@cache_landing_page
 def terms_of_service(request):
     return render(request, 'a_landing/terms_of_service.html')
 
@@ -106,5 +109,5 @@ def review_form(request):
     
     return render(request, 'a_landing/review_form.html', {
         'form': form,
-        'timestamp': int(time()),
+        'asset_version': get_asset_version(),
     })
\ No newline at end of file
@@ -74,3 +74,76 @@ class RewardModelTest(TestCase):
             created_by=self.parent
         )
         self.assertEqual(str(reward), 'Test Reward')
+
+
+class RewardClaimUtilsTest(TestCase):
+    """Test compare-and-set reward claiming"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD,
+            points=60
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.child)
+        self.reward = Reward.objects.create(
+            name='Kino',
+            points=50,
+            family=self.family,
+            created_by=self.parent
+        )
+
+    def test_claim_deducts_points_once(self):
+        """Test a reward can only be claimed once"""
+        from .utils import CLAIM_ALREADY_CLAIMED, CLAIM_OK, claim_reward
+
+        status, cost = claim_reward(self.reward, self.child, self.family)
+        self.assertEqual(status, CLAIM_OK)
+        self.assertEqual(cost, 50)
+        self.assertEqual(self.child.points, 10)
+
+        # A second (stale) request for the same reward must not deduct again
+        stale_reward = Reward.objects.get(id=self.reward.id)
+        stale_reward.claimed = False
+        status, _ = claim_reward(stale_reward, self.child, self.family)
+        self.assertEqual(status, CLAIM_ALREADY_CLAIMED)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 10)
+
+    def test_claim_with_insufficient_points_is_rolled_back(self):
+        """Test failed point deduction leaves the reward unclaimed"""
+        from .utils import CLAIM_INSUFFICIENT_POINTS, claim_reward
+
+        User.objects.filter(id=self.child.id).update(points=20)
+        status, _ = claim_reward(self.reward, self.child, self.family)
+        self.assertEqual(status, CLAIM_INSUFFICIENT_POINTS)
+
+        self.reward.refresh_from_db()
+        self.assertFalse(self.reward.claimed)
+        self.assertIsNone(self.reward.claimed_by)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 20)
+
+    def test_unclaim_refunds_points(self):
+        """Test unclaiming returns the points to the child"""
+        from .utils import CLAIM_NOT_CLAIMED, CLAIM_OK, claim_reward, unclaim_reward
+
+        claim_reward(self.reward, self.child, self.family)
+        status, points = unclaim_reward(self.reward, self.family, unclaimed_by=self.parent)
+        self.assertEqual(status, CLAIM_OK)
+        self.assertEqual(points, 50)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 60)
+
+        status, _ = unclaim_reward(self.reward, self.family)
+        self.assertEqual(status, CLAIM_NOT_CLAIMED)
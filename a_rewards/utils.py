@@ -0,0 +1,103 @@
+"""
+Utility functions for claiming rewards.
+
+Claims are compare-and-set updates instead of row locks:
+    UPDATE reward SET claimed=true WHERE id=? AND claimed=false
+    UPDATE user SET points=points-? WHERE id=? AND points>=?
+Both run in one short transaction; if either matches no row the claim is rolled back.
+Used by both the web view (a_rewards.views) and the JSON API (a_api.views).
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from a_family.models import PointsTransaction, User
+from a_family.points_utils import add_points, deduct_points
+
+from .models import Reward
+
+
+CLAIM_OK = 'ok'
+CLAIM_NOT_FOUND = 'not_found'
+CLAIM_ALREADY_CLAIMED = 'already_claimed'
+CLAIM_NOT_CLAIMED = 'not_claimed'
+CLAIM_INSUFFICIENT_POINTS = 'insufficient_points'
+
+
+def claim_reward(reward, user, family):
+    """
+    Claim a reward for a user.
+
+    Args:
+        reward: Reward instance (may be stale, only its id is trusted)
+        user: User claiming the reward (points are refreshed on the instance)
+        family: Family the reward must belong to
+
+    Returns:
+        tuple: (status: str, points: int) - status is one of the CLAIM_* constants,
+               points is the reward cost at the time of the claim
+    """
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        claimed = Reward.objects.filter(id=reward.id, family=family, claimed=False).update(
+            claimed=True,
+            claimed_by=user,
+            claimed_at=claimed_at,
+        )
+        if not claimed:
+            exists = Reward.objects.filter(id=reward.id, family=family).exists()
+            return (CLAIM_ALREADY_CLAIMED if exists else CLAIM_NOT_FOUND), reward.points
+
+        # The row is ours now, so this read sees the cost that applies to this claim
+        points = Reward.objects.filter(id=reward.id).values_list('points', flat=True).first() or 0
+        if points:
+            deducted = deduct_points(
+                user, points, PointsTransaction.REASON_REWARD_CLAIMED,
+                family=family, reward=reward, created_by=user, allow_partial=False,
+            )
+            if not deducted:
+                transaction.set_rollback(True)
+                return CLAIM_INSUFFICIENT_POINTS, points
+
+    reward.claimed = True
+    reward.claimed_by = user
+    reward.claimed_at = claimed_at
+    reward.points = points
+    return CLAIM_OK, points
+
+
+def unclaim_reward(reward, family, unclaimed_by=None):
+    """
+    Undo a reward claim and refund the points to the child who claimed it.
+
+    Returns:
+        tuple: (status: str, points: int) - status is one of the CLAIM_* constants
+    """
+    with transaction.atomic():
+        row = Reward.objects.filter(id=reward.id, family=family).values_list(
+            'claimed', 'claimed_by_id', 'points'
+        ).first()
+        if not row:
+            return CLAIM_NOT_FOUND, reward.points
+        claimed, claimed_by_id, points = row
+        if not claimed:
+            return CLAIM_NOT_CLAIMED, points
+
+        # Only the request that flips claimed=True -> False refunds the points
+        released = Reward.objects.filter(id=reward.id, claimed=True, claimed_by_id=claimed_by_id).update(
+            claimed=False,
+            claimed_by=None,
+            claimed_at=None,
+        )
+        if not released:
+            return CLAIM_NOT_CLAIMED, points
+
+        if claimed_by_id and points:
+            add_points(
+                User(pk=claimed_by_id), points, PointsTransaction.REASON_REWARD_UNCLAIMED,
+                family=family, reward=reward, created_by=unclaimed_by,
+            )
+
+    reward.claimed = False
+    reward.claimed_by = None
+    reward.claimed_at = None
+    return CLAIM_OK, points
@@ -7,15 +7,21 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.db import transaction
 from django.shortcuts import redirect, render
-from django.utils import timezone
 
 # Local application imports
 from a_family.models import Family, User
 from a_family.emails import send_reward_claimed_notification
-from a_family.utils import get_family_for_user as _get_family_for_user
-from a_subscription.utils import check_subscription_limit, increment_usage
+from a_family.utils import get_request_family
+from a_subscription.utils import reserve_quota
 
 from .models import Reward
+from .utils import (
+    CLAIM_ALREADY_CLAIMED,
+    CLAIM_INSUFFICIENT_POINTS,
+    CLAIM_OK,
+    claim_reward,
+    unclaim_reward,
+)
 
 
 def _ensure_user_role(user, default_role=User.ROLE_CHILD):
@@ -29,7 +35,7 @@ def _ensure_user_role(user, default_role=User.ROLE_CHILD):
 @login_required
 def index(request):
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
 
     # Redirect to onboarding if user doesn't have a family
     if not family:
@@ -60,24 +66,24 @@ def index(request):
             points_raw = request.POST.get("points", "0")
 
             if name:
-                # Check subscription limit before creating
-                can_create, current_count, limit, tier = check_subscription_limit(family, 'rewards', 1)
-                if not can_create:
-                    messages.error(
-                        request,
-                        f"Oled jõudnud oma kuise preemiapiirini ({limit} preemiat). "
-                        f"Oled sel kuul loonud {current_count} preemiat. "
-                        f"Palun uuenda tellimust, et lisada rohkem preemiaid."
-                    )
-                    return redirect("a_rewards:index")
-
                 try:
                     points_value = max(0, int(points_raw))
                 except (TypeError, ValueError):
                     points_value = 0
 
-                # Use transaction to ensure reward creation and usage increment are atomic
+                # Use transaction to ensure the quota reservation and reward creation are atomic
                 with transaction.atomic():
+                    # Reserve quota before creating (one conditional UPDATE, no check-then-act race)
+                    granted, current_count, limit, tier = reserve_quota(family, 'rewards', 1)
+                    if not granted:
+                        messages.error(
+                            request,
+                            f"Oled jõudnud oma kuise preemiapiirini ({limit} preemiat). "
+                            f"Oled sel kuul loonud {current_count} preemiat. "
+                            f"Palun uuenda tellimust, et lisada rohkem preemiaid."
+                        )
+                        return redirect("a_rewards:index")
+
                     reward = Reward.objects.create(
                         name=name,
                         description=description,
@@ -85,8 +91,6 @@ def index(request):
                         family=family,
                         created_by=user,
                     )
-                    # Increment usage counter (within same transaction)
-                    increment_usage(family, 'rewards', 1)
                 # Don't send notification when reward is created, only when claimed
 
         elif action == "update" and is_parent:
@@ -114,21 +118,12 @@ def index(request):
             elif not reward.claimed_by:
                 messages.error(request, "Preemial pole määratud lunastajat.")
             else:
-                # Use transaction to ensure atomicity
                 try:
-                    with transaction.atomic():
-                        # Refresh from DB with row-level locking
-                        reward_refreshed = Reward.objects.select_for_update().get(id=reward.id)
-                        if reward_refreshed.claimed_by:
-                            claimed_by = User.objects.select_for_update().get(id=reward_refreshed.claimed_by.id)
-                            claimed_by.points += reward_refreshed.points
-                            claimed_by.save(update_fields=["points"])
-                        
-                        reward_refreshed.claimed = False
-                        reward_refreshed.claimed_by = None
-                        reward_refreshed.claimed_at = None
-                        reward_refreshed.save(update_fields=["claimed", "claimed_by", "claimed_at"])
-                        messages.success(request, f"Preemia '{reward_refreshed.name}' lunastamine tühistatud.")
+                    status, _ = unclaim_reward(reward, family, unclaimed_by=user)
+                    if status == CLAIM_OK:
+                        messages.success(request, f"Preemia '{reward.name}' lunastamine tühistatud.")
+                    else:
+                        messages.warning(request, "See preemia pole lunastatud.")
                 except Exception as e:
                     messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
 
@@ -139,45 +134,29 @@ def index(request):
             elif reward.claimed:
                 messages.warning(request, "See preemia on juba lunastatud.")
             else:
-                # Use transaction to prevent race conditions
+                # Compare-and-set claim: no row locks are held across round trips
                 try:
-                    with transaction.atomic():
-                        # Refresh user and reward from DB with row-level locking
-                        user_refreshed = User.objects.select_for_update().get(id=user.id)
-                        reward_refreshed = Reward.objects.select_for_update().get(id=reward.id)
+                    status, cost = claim_reward(reward, user, family)
+                    if status == CLAIM_ALREADY_CLAIMED:
+                        messages.warning(request, "See preemia on juba lunastatud.")
+                    elif status == CLAIM_INSUFFICIENT_POINTS:
+                        messages.error(
+                            request,
+                            f"Sul pole piisavalt punkte. Vajad {cost} punkti, "
+                            f"aga sul on ainult {user.points} punkti."
+                        )
+                    elif status != CLAIM_OK:
+                        messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
+                    else:
+                        messages.success(request, f"Preemia '{reward.name}' lunastatud!")
                         
-                        # Double-check conditions after locking
-                        if reward_refreshed.claimed:
-                            messages.warning(request, "See preemia on juba lunastatud.")
-                        elif user_refreshed.points < reward_refreshed.points:
-                            messages.error(
-                                request,
-                                f"Sul pole piisavalt punkte. Vajad {reward_refreshed.points} punkti, "
-                                f"aga sul on ainult {user_refreshed.points} punkti."
-                            )
-                        else:
-                            # Claim the reward
-                            reward_refreshed.claimed = True
-                            reward_refreshed.claimed_by = user_refreshed
-                            reward_refreshed.claimed_at = timezone.now()
-                            reward_refreshed.save(update_fields=["claimed", "claimed_by", "claimed_at"])
-
-                            # Deduct points
-                            user_refreshed.points = max(0, user_refreshed.points - reward_refreshed.points)
-                            user_refreshed.save(update_fields=["points"])
-                            messages.success(request, f"Preemia '{reward_refreshed.name}' lunastatud!")
-                            
-                            # Send notification email
-                            try:
-                                send_reward_claimed_notification(request, reward_refreshed)
-                            except Exception as e:
-                                import logging
-                                logger = logging.getLogger(__name__)
-                                logger.warning(f"Failed to send reward claimed notification: {e}", exc_info=True)
-                except User.DoesNotExist:
-                    messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-                except Reward.DoesNotExist:
-                    messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
+                        # Send notification email
+                        try:
+                            send_reward_claimed_notification(request, reward)
+                        except Exception as e:
+                            import logging
+                            logger = logging.getLogger(__name__)
+                            logger.warning(f"Failed to send reward claimed notification: {e}", exc_info=True)
                 except Exception as e:
                     messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
 
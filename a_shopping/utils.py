@@ -0,0 +1,38 @@
+"""
+Utility functions for shopping list operations.
+"""
+from django.db import transaction
+
+from .models import ShoppingListItem
+
+
+# Upper bound for lines accepted in one bulk request
+MAX_BULK_ITEMS = 100
+
+MAX_ITEM_NAME_LENGTH = 255
+
+
+def bulk_add_items(family, added_by, names):
+    """
+    Add many shopping list items with a single INSERT.
+
+    Args:
+        family: Family instance
+        added_by: User adding the items
+        names: list of item names (see _core.text_utils.split_pasted_lines)
+
+    Returns:
+        tuple: (created_items: list, skipped_names: list)
+    """
+    items = []
+    skipped = []
+    for name in names:
+        if len(name) > MAX_ITEM_NAME_LENGTH:
+            skipped.append(name)
+            continue
+        items.append(ShoppingListItem(name=name, family=family, added_by=added_by))
+
+    if items:
+        with transaction.atomic():
+            ShoppingListItem.objects.bulk_create(items)
+    return items, skipped
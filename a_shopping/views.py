@@ -4,22 +4,20 @@ from django.conf import settings
 from django.shortcuts import redirect, render
 from django.urls import reverse
 
-from a_family.models import Family
-from a_family.emails import send_shopping_item_added_notification
+from _core.text_utils import split_pasted_lines
+from a_family.utils import get_request_family
+from a_family.emails import send_shopping_item_added_notification, send_shopping_items_added_notification
 from a_subscription.utils import has_shopping_list_access
 
 from .models import ShoppingListItem
+from .utils import MAX_BULK_ITEMS, MAX_ITEM_NAME_LENGTH, bulk_add_items
 
 
 @login_required
 def index(request):
     user = request.user
 
-    family = None
-    if hasattr(user, "families"):
-        family = user.families.first()
-    if family is None:
-        family = Family.objects.filter(owner=user).first()
+    family = get_request_family(request)
 
     # Check if family has shopping list access (for all users, including children)
     if family and not has_shopping_list_access(family):
@@ -77,6 +75,36 @@ def index(request):
                     import logging
                     logger = logging.getLogger(__name__)
                     logger.warning(f"Failed to send shopping item added notification: {e}", exc_info=True)
+        elif family and action == "bulk_add":
+            # Pasted list: one item per line, inserted in one query
+            names = split_pasted_lines(request.POST.get("names", ""))
+            if not names:
+                messages.error(request, "Palun sisesta ostunimekirja kauba nimi.")
+                return redirect("a_shopping:index")
+            if len(names) > MAX_BULK_ITEMS:
+                messages.error(request, f"Korraga saab lisada kuni {MAX_BULK_ITEMS} eset.")
+                return redirect("a_shopping:index")
+
+            try:
+                items, skipped = bulk_add_items(family, user, names)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.error(f"Error creating shopping items: {e}", exc_info=True)
+                messages.error(request, f"Midagi läks valesti kaupade lisamisel. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
+                return redirect("a_shopping:index")
+
+            if items:
+                messages.success(request, f"Lisatud {len(items)} eset.")
+                # One aggregated notification for the whole list
+                try:
+                    send_shopping_items_added_notification(request, items)
+                except Exception as e:
+                    import logging
+                    logger = logging.getLogger(__name__)
+                    logger.warning(f"Failed to send shopping items added notification: {e}", exc_info=True)
+            if skipped:
+                messages.warning(request, f"{len(skipped)} eset jäeti vahele (nimi üle {MAX_ITEM_NAME_LENGTH} tähemärgi).")
         elif family and action == "delete":
             item_id = request.POST.get("item_id")
             if item_id:
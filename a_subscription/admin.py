@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Subscription, SubscriptionUsage
+from .models import StripeCustomer, StripeEventInbox, Subscription, SubscriptionUsage, SubscriptionUsageYearly
 
 
 @admin.register(Subscription)
@@ -24,6 +24,14 @@ class SubscriptionAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(StripeCustomer)
+class StripeCustomerAdmin(admin.ModelAdmin):
+    list_display = ['user', 'customer_id', 'email', 'updated_at']
+    search_fields = ['user__username', 'user__email', 'customer_id', 'email']
+    readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['user']
+
+
 @admin.register(SubscriptionUsage)
 class SubscriptionUsageAdmin(admin.ModelAdmin):
     list_display = ['family', 'period_start', 'tasks_created', 'rewards_created', 'recurring_tasks_created', 'recurring_tasks_actual_count', 'updated_at']
@@ -53,3 +61,33 @@ class SubscriptionUsageAdmin(admin.ModelAdmin):
         count = TaskRecurrence.objects.filter(task__family=obj.family).count()
         return count
     recurring_tasks_actual_count.short_description = 'Tegelik korduvate ülesannete arv'
+
+
+@admin.register(SubscriptionUsageYearly)
+class SubscriptionUsageYearlyAdmin(admin.ModelAdmin):
+    list_display = ['family', 'year', 'periods', 'tasks_created', 'rewards_created', 'updated_at']
+    list_filter = ['year']
+    search_fields = ['family__name', 'family__owner__username']
+    readonly_fields = ['family', 'year', 'periods', 'tasks_created', 'rewards_created', 'updated_at']
+
+
+@admin.register(StripeEventInbox)
+class StripeEventInboxAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'customer_id', 'object_id', 'status', 'attempts', 'stripe_created', 'processed_at']
+    list_filter = ['status', 'event_type']
+    search_fields = ['event_id', 'customer_id', 'object_id']
+    readonly_fields = [
+        'event_id', 'event_type', 'customer_id', 'object_id', 'stripe_created', 'payload',
+        'attempts', 'last_error', 'claimed_at', 'received_at', 'processed_at',
+    ]
+    actions = ['retry_events']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Proovi uuesti (märgi ootele)')
+    def retry_events(self, request, queryset):
+        updated = queryset.exclude(status=StripeEventInbox.STATUS_PROCESSING).update(
+            status=StripeEventInbox.STATUS_PENDING, attempts=0
+        )
+        self.message_user(request, f'{updated} sündmust märgiti uuesti töötlemiseks.')
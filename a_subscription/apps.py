@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ASubscriptionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'a_subscription'
+
+    def ready(self):
+        """Import signals when the app is ready"""
+        import a_subscription.signals  # noqa
@@ -0,0 +1,99 @@
+"""
+Utility functions for the user -> Stripe customer mapping (StripeCustomer).
+
+The mapping is written whenever we learn a user's customer id (checkout,
+webhooks, plan changes) so checkout does not have to search Stripe by email.
+"""
+import logging
+
+import stripe
+from django.db import IntegrityError, transaction
+
+from . import stripe_gateway
+from .models import StripeCustomer, Subscription
+
+logger = logging.getLogger(__name__)
+
+
+def get_customer_id(user):
+    """
+    Get the user's Stripe customer id from local data only.
+
+    Returns:
+        str or None
+    """
+    customer_id = StripeCustomer.objects.filter(user=user).values_list('customer_id', flat=True).first()
+    if customer_id:
+        return customer_id
+    # Older accounts: customer id only stored on the subscription row
+    return Subscription.objects.filter(owner=user).exclude(stripe_customer_id__isnull=True).exclude(
+        stripe_customer_id=''
+    ).order_by('-created_at').values_list('stripe_customer_id', flat=True).first()
+
+
+def remember_customer(user, customer_id, email=None):
+    """
+    Store or update the user's Stripe customer id.
+    A customer id can only belong to one user; if it is mapped to someone else, that mapping is kept.
+
+    Returns:
+        StripeCustomer or None if the customer id belongs to another user
+    """
+    if not customer_id:
+        return None
+    defaults = {'customer_id': customer_id}
+    if email is not None:
+        defaults['email'] = email or ''
+    try:
+        with transaction.atomic():
+            mapping, _ = StripeCustomer.objects.update_or_create(user=user, defaults=defaults)
+    except IntegrityError:
+        logger.warning(f"Stripe customer {customer_id} is already mapped to another user, not mapping user {user.id}")
+        return None
+    return mapping
+
+
+def forget_customer(customer_id):
+    """Remove every local reference to a customer deleted in Stripe."""
+    if not customer_id:
+        return False
+    with transaction.atomic():
+        deleted, _ = StripeCustomer.objects.filter(customer_id=customer_id).delete()
+        Subscription.objects.filter(stripe_customer_id=customer_id).update(stripe_customer_id=None)
+    return bool(deleted)
+
+
+def get_or_create_customer_id(user, family):
+    """
+    Get the user's Stripe customer id, creating the customer in Stripe only when needed.
+
+    Lookup order: local mapping, then (for accounts from before the mapping
+    existed) a Customer.list by email, then Customer.create. The result is
+    stored so the next checkout needs no lookup at all.
+
+    Raises:
+        stripe.StripeError: if Stripe had to be contacted and the call failed
+    """
+    customer_id = StripeCustomer.objects.filter(user=user).values_list('customer_id', flat=True).first()
+    if customer_id:
+        return customer_id
+    customer_id = get_customer_id(user)
+    if customer_id:
+        remember_customer(user, customer_id, user.email)
+        return customer_id
+
+    customers = stripe_gateway.call(stripe.Customer.list, email=user.email, limit=1)
+    if customers.data:
+        customer_id = customers.data[0].id
+        logger.info(f"Found existing Stripe customer {customer_id} for email {user.email}")
+    else:
+        customer = stripe_gateway.call(
+            stripe.Customer.create,
+            email=user.email,
+            metadata={'user_id': str(user.id), 'family_id': str(family.id)}
+        )
+        customer_id = customer.id
+        logger.info(f"Created new Stripe customer {customer_id} for user {user.id}")
+
+    remember_customer(user, customer_id, user.email)
+    return customer_id
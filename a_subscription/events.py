@@ -0,0 +1,488 @@
+"""
+Stripe webhook event inbox.
+
+The webhook view verifies the signature and calls record_event(), which
+inserts the event into StripeEventInbox keyed by its Stripe event id (a
+redelivery of the same event is ignored) and returns immediately.
+
+process_inbox() drains pending events, run every few seconds by the scheduler
+and by the `process_stripe_events` command:
+- events are handled in Stripe creation order per customer; if one fails, it is
+  retried with exponential backoff and the customer's later events wait until it
+  succeeds (or is marked failed), so they are never applied out of order,
+- subscription events are coalesced: only the newest pending event per
+  subscription is applied, older snapshots are marked coalesced,
+- events are claimed with a conditional UPDATE (pending -> processing) that
+  stamps a per-run claim token, so several scheduler instances can run the
+  worker without handling an event twice.
+
+handle_event() lets unexpected errors (database, Stripe timeouts) propagate to
+process_inbox(), which records them on the row and schedules the retry.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import stripe
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import stripe_gateway
+from .customer_utils import forget_customer, remember_customer
+from .models import StripeCustomer, StripeEventInbox, Subscription
+from .stripe_mapping import update_subscription_from_stripe
+
+logger = logging.getLogger(__name__)
+
+
+# Events processed per worker run
+PROCESS_BATCH_SIZE = 500
+
+# Failed events are retried this many times before they are marked failed
+MAX_ATTEMPTS = 5
+
+# Delay before retrying a failed event: RETRY_BACKOFF * 2 ** (attempts - 1), capped
+RETRY_BACKOFF = timedelta(seconds=30)
+MAX_RETRY_BACKOFF = timedelta(hours=1)
+
+# A claim older than this is considered abandoned (worker crashed) and is taken over
+STALE_CLAIM_AFTER = timedelta(minutes=10)
+
+# Read timeout (seconds) for Stripe calls made while handling an event
+EVENT_STRIPE_TIMEOUT = 5
+
+# Subscription snapshot events: the newest one for a subscription supersedes older ones
+COALESCED_EVENT_TYPES = (
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+)
+
+
+def _event_refs(event):
+    """Return (customer_id, subscription_id) referenced by an event payload."""
+    obj = (event.get('data') or {}).get('object') or {}
+    customer = obj.get('id') if obj.get('object') == 'customer' else obj.get('customer')
+    customer = customer or ''
+    if isinstance(customer, dict):
+        customer = customer.get('id') or ''
+    if obj.get('object') == 'subscription' or event.get('type', '').startswith('customer.subscription.'):
+        subscription_id = obj.get('id') or ''
+    else:
+        subscription_id = obj.get('subscription') or ''
+    if isinstance(subscription_id, dict):
+        subscription_id = subscription_id.get('id') or ''
+    return customer, subscription_id
+
+
+def record_event(event):
+    """
+    Store a verified Stripe event in the inbox.
+
+    Args:
+        event: event payload as a dict (the parsed webhook body)
+
+    Returns:
+        bool: True if the event was new, False if it was already in the inbox
+    """
+    customer_id, subscription_id = _event_refs(event)
+    created = event.get('created')
+    stripe_created = (
+        datetime.fromtimestamp(created, tz=dt_timezone.utc) if isinstance(created, (int, float)) else timezone.now()
+    )
+    try:
+        with transaction.atomic():
+            StripeEventInbox.objects.create(
+                event_id=event['id'],
+                event_type=event.get('type', ''),
+                customer_id=customer_id,
+                object_id=subscription_id,
+                stripe_created=stripe_created,
+                payload=event,
+            )
+    except IntegrityError:
+        logger.info(f"Duplicate Stripe event {event['id']} ignored")
+        return False
+    return True
+
+
+def _claimable():
+    now = timezone.now()
+    due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+    return (Q(status=StripeEventInbox.STATUS_PENDING) & due) | Q(
+        status=StripeEventInbox.STATUS_PROCESSING, claimed_at__lt=now - STALE_CLAIM_AFTER
+    )
+
+
+def _retry_delay(attempts):
+    return min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_RETRY_BACKOFF)
+
+
+def _claim(event_ids):
+    """Claim events with one conditional UPDATE; returns the ids this worker won."""
+    token = uuid.uuid4()
+    StripeEventInbox.objects.filter(_claimable(), id__in=event_ids).update(
+        status=StripeEventInbox.STATUS_PROCESSING,
+        claimed_at=timezone.now(),
+        claim_token=token,
+    )
+    return set(
+        StripeEventInbox.objects.filter(id__in=event_ids, claim_token=token).values_list('id', flat=True)
+    )
+
+
+def process_inbox(limit=PROCESS_BATCH_SIZE):
+    """
+    Handle pending inbox events.
+
+    Returns:
+        dict: counts of 'processed', 'coalesced', 'failed' and 'deferred' events
+    """
+    stats = {'processed': 0, 'coalesced': 0, 'failed': 0, 'deferred': 0}
+
+    # Customers with an event another worker is still handling, or with a failed
+    # event waiting for its retry, wait for the next run
+    now = timezone.now()
+    busy_customers = set(
+        StripeEventInbox.objects.filter(
+            Q(status=StripeEventInbox.STATUS_PROCESSING, claimed_at__gte=now - STALE_CLAIM_AFTER)
+            | Q(status=StripeEventInbox.STATUS_PENDING, next_attempt_at__gt=now)
+        ).exclude(customer_id='').values_list('customer_id', flat=True)
+    )
+    events = list(
+        StripeEventInbox.objects.filter(_claimable()).exclude(customer_id__in=busy_customers)
+        .order_by('stripe_created', 'id')[:limit]
+    )
+    if not events:
+        return stats
+
+    won_ids = _claim([event.id for event in events])
+    events = [event for event in events if event.id in won_ids]
+
+    # Newest pending snapshot event per subscription, and which event types it replaces
+    latest_by_subscription = {}
+    coalesced_types = {}
+    for event in events:
+        if event.event_type in COALESCED_EVENT_TYPES and event.object_id:
+            latest_by_subscription[event.object_id] = event.id
+            coalesced_types.setdefault(event.object_id, set()).add(event.event_type)
+
+    failed_customers = set()
+    for event in events:
+        if event.customer_id and event.customer_id in failed_customers:
+            # Keep per-customer order: retry after the earlier event succeeds
+            StripeEventInbox.objects.filter(id=event.id).update(status=StripeEventInbox.STATUS_PENDING)
+            stats['deferred'] += 1
+            continue
+
+        if (
+            event.event_type in COALESCED_EVENT_TYPES
+            and event.object_id
+            and latest_by_subscription[event.object_id] != event.id
+        ):
+            StripeEventInbox.objects.filter(id=event.id).update(
+                status=StripeEventInbox.STATUS_COALESCED, processed_at=timezone.now()
+            )
+            stats['coalesced'] += 1
+            continue
+
+        event_type = event.event_type
+        if (
+            event_type == 'customer.subscription.updated'
+            and 'customer.subscription.created' in coalesced_types.get(event.object_id, ())
+        ):
+            # The local row is only linked to the subscription by the created handler
+            event_type = 'customer.subscription.created'
+
+        try:
+            # Partial writes of a failed handler are rolled back before the retry
+            with transaction.atomic():
+                handle_event(event_type, event.payload.get('data') or {})
+        except Exception as e:
+            attempts = event.attempts + 1
+            status = StripeEventInbox.STATUS_FAILED if attempts >= MAX_ATTEMPTS else StripeEventInbox.STATUS_PENDING
+            StripeEventInbox.objects.filter(id=event.id).update(
+                status=status,
+                attempts=attempts,
+                last_error=str(e)[:2000],
+                next_attempt_at=timezone.now() + _retry_delay(attempts) if status == StripeEventInbox.STATUS_PENDING else None,
+            )
+            logger.error(
+                f"Error processing Stripe event {event.event_id} ({event.event_type}), "
+                f"attempt {attempts}/{MAX_ATTEMPTS}: {str(e)}",
+                exc_info=True
+            )
+            if status == StripeEventInbox.STATUS_FAILED:
+                stats['failed'] += 1
+            else:
+                stats['deferred'] += 1
+                if event.customer_id:
+                    failed_customers.add(event.customer_id)
+            continue
+
+        StripeEventInbox.objects.filter(id=event.id).update(
+            status=StripeEventInbox.STATUS_PROCESSED, attempts=event.attempts + 1, processed_at=timezone.now()
+        )
+        stats['processed'] += 1
+
+    logger.info(
+        f"Stripe inbox: {stats['processed']} processed, {stats['coalesced']} coalesced, "
+        f"{stats['failed']} failed, {stats['deferred']} deferred"
+    )
+    return stats
+
+
+def handle_event(event_type, event_data):
+    """
+    Apply one Stripe event to local subscriptions.
+
+    Args:
+        event_type: Stripe event type
+        event_data: the event's `data` dict ({'object': {...}})
+
+    Unexpected errors are not caught here: process_inbox() records them and
+    retries the event. Only "subscription not found" is treated as done.
+    """
+    logger.info(f"Processing Stripe event: {event_type}")
+
+    if event_type == 'customer.subscription.created':
+        subscription_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        subscription_id = subscription_obj.get('id') if isinstance(subscription_obj, dict) else None
+        customer_id = subscription_obj.get('customer') if isinstance(subscription_obj, dict) else None
+
+        logger.info(f"Processing subscription.created for {subscription_id}, customer: {customer_id}")
+
+        # Try to find existing subscription by customer ID first
+        subscription = None
+        if customer_id:
+            subscription = Subscription.objects.filter(
+                stripe_customer_id=customer_id
+            ).order_by('-created_at').first()
+
+        # If not found, try by subscription ID
+        if not subscription and subscription_id:
+            subscription = Subscription.objects.filter(
+                stripe_subscription_id=subscription_id
+            ).first()
+
+        # If still not found, try to find by customer email via Stripe
+        if not subscription and customer_id:
+            try:
+                customer = stripe_gateway.call(stripe.Customer.retrieve, customer_id, timeout=EVENT_STRIPE_TIMEOUT)
+                user_id = customer.metadata.get('user_id')
+                if user_id:
+                    from a_family.models import User
+                    try:
+                        user = User.objects.get(id=user_id)
+                        subscription = Subscription.objects.filter(
+                            owner=user,
+                            tier__in=[Subscription.TIER_STARTER, Subscription.TIER_PRO]
+                        ).order_by('-created_at').first()
+                        if subscription:
+                            logger.info(f"Found subscription {subscription.id} by user_id from customer metadata")
+                    except User.DoesNotExist:
+                        pass
+            except stripe.InvalidRequestError as e:
+                # Customer no longer exists; other Stripe errors are retried by the inbox
+                logger.warning(f"Could not retrieve customer to find user: {str(e)}")
+
+        if subscription:
+            # Update existing subscription
+            subscription.stripe_subscription_id = subscription_id
+            subscription.stripe_customer_id = customer_id  # Ensure customer ID is set
+            update_subscription_from_stripe(subscription, subscription_obj)
+            remember_customer(subscription.owner, customer_id)
+            logger.info(f"Updated existing subscription {subscription.id} for customer {customer_id}")
+        else:
+            logger.warning(f"Subscription created event received but no matching subscription found: {subscription_id}, customer: {customer_id}")
+
+    elif event_type == 'customer.subscription.updated':
+        subscription_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        subscription_id = subscription_obj.get('id') if isinstance(subscription_obj, dict) else None
+
+        logger.info(f"Processing subscription.updated for {subscription_id}")
+
+        try:
+            subscription = Subscription.objects.get(
+                stripe_subscription_id=subscription_id
+            )
+
+            # Store old tier to detect changes
+            old_tier = subscription.tier
+            old_status = subscription.status
+
+            # Update subscription from Stripe (this will handle tier changes and downgrades)
+            update_subscription_from_stripe(subscription, subscription_obj)
+
+            # Log tier changes immediately
+            if subscription.tier != old_tier:
+                if subscription.tier == Subscription.TIER_FREE:
+                    logger.info(
+                        f"Subscription {subscription.id} downgraded from {old_tier} to FREE tier "
+                        f"(status: {subscription.status})"
+                    )
+                else:
+                    logger.info(
+                        f"Subscription {subscription.id} tier changed from {old_tier} to {subscription.tier}"
+                    )
+
+            # Log status changes
+            if subscription.status != old_status:
+                logger.info(
+                    f"Subscription {subscription.id} status changed from {old_status} to {subscription.status}"
+                )
+
+            logger.info(f"Updated subscription {subscription.id}")
+        except Subscription.DoesNotExist:
+            logger.warning(f"Subscription updated event received but subscription not found: {subscription_id}")
+
+    elif event_type == 'customer.subscription.deleted':
+        subscription_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        subscription_id = subscription_obj.get('id') if isinstance(subscription_obj, dict) else None
+
+        logger.info(f"Processing subscription.deleted for {subscription_id}")
+
+        try:
+            subscription = Subscription.objects.get(
+                stripe_subscription_id=subscription_id
+            )
+            # When deleted, revert to FREE tier
+            subscription.status = Subscription.STATUS_CANCELLED
+            subscription.tier = Subscription.TIER_FREE
+            subscription.stripe_subscription_id = None  # Clear subscription ID
+            subscription.save()
+            logger.info(f"Subscription {subscription.id} deleted, reverted to FREE tier")
+        except Subscription.DoesNotExist:
+            logger.warning(f"Subscription deleted event received but subscription not found: {subscription_id}")
+
+    elif event_type == 'invoice.payment_failed':
+        invoice_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        subscription_id = invoice_obj.get('subscription') if isinstance(invoice_obj, dict) else None
+
+        logger.info(f"Processing invoice.payment_failed for subscription {subscription_id}")
+
+        if subscription_id:
+            try:
+                subscription = Subscription.objects.get(
+                    stripe_subscription_id=subscription_id
+                )
+
+                # Check if this is a final payment failure
+                # Stripe retries up to 3 times (4 total attempts: initial + 3 retries)
+                attempt_count = invoice_obj.get('attempt_count', 0) if isinstance(invoice_obj, dict) else 0
+                max_attempts = 4  # Stripe's default max attempts
+
+                # Also check the subscription status from Stripe to see if it's already unpaid/expired
+                try:
+                    stripe_subscription = stripe_gateway.call(
+                        stripe.Subscription.retrieve, subscription_id, timeout=EVENT_STRIPE_TIMEOUT
+                    )
+                    stripe_status = stripe_subscription.status
+
+                    # If subscription is already unpaid or incomplete_expired, downgrade immediately
+                    if stripe_status in ['unpaid', 'incomplete_expired']:
+                        subscription.status = Subscription.STATUS_UNPAID if stripe_status == 'unpaid' else Subscription.STATUS_INCOMPLETE_EXPIRED
+                        subscription.tier = Subscription.TIER_FREE
+                        subscription.save()
+                        logger.info(
+                            f"Subscription {subscription.id} payment failed with final status {stripe_status}, "
+                            f"downgraded to FREE tier immediately"
+                        )
+                    elif attempt_count >= max_attempts:
+                        # Final attempt failed - downgrade immediately
+                        subscription.status = Subscription.STATUS_PAST_DUE
+                        subscription.tier = Subscription.TIER_FREE
+                        subscription.save()
+                        logger.info(
+                            f"Subscription {subscription.id} payment failed after {attempt_count} attempts "
+                            f"(max: {max_attempts}), downgraded to FREE tier immediately"
+                        )
+                    else:
+                        # Still in retry period, just update status
+                        subscription.status = Subscription.STATUS_PAST_DUE
+                        subscription.save()
+                        logger.info(
+                            f"Subscription {subscription.id} payment failed (attempt {attempt_count}/{max_attempts}), "
+                            f"status set to past_due"
+                        )
+                except stripe.StripeError as e:
+                    # If we can't retrieve subscription, just set to past_due
+                    logger.warning(f"Could not retrieve Stripe subscription to check status: {str(e)}")
+                    subscription.status = Subscription.STATUS_PAST_DUE
+                    subscription.save()
+                    logger.info(f"Subscription {subscription.id} payment failed, status set to past_due")
+
+            except Subscription.DoesNotExist:
+                logger.warning(f"Payment failed event received but subscription not found: {subscription_id}")
+
+    elif event_type == 'invoice.payment_succeeded':
+        invoice_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        subscription_id = invoice_obj.get('subscription') if isinstance(invoice_obj, dict) else None
+
+        logger.info(f"Processing invoice.payment_succeeded for subscription {subscription_id}")
+
+        if subscription_id:
+            try:
+                subscription = Subscription.objects.get(
+                    stripe_subscription_id=subscription_id
+                )
+
+                # Payment succeeded - refresh subscription from Stripe to ensure tier is correct
+                try:
+                    stripe_subscription = stripe_gateway.call(
+                        stripe.Subscription.retrieve, subscription_id, timeout=EVENT_STRIPE_TIMEOUT
+                    )
+                    update_subscription_from_stripe(subscription, stripe_subscription)
+                    logger.info(
+                        f"Subscription {subscription.id} payment succeeded, "
+                        f"status: {subscription.status}, tier: {subscription.tier}"
+                    )
+                except stripe.StripeError as e:
+                    # Fallback: just update status if we can't retrieve subscription
+                    logger.warning(f"Could not retrieve Stripe subscription: {str(e)}")
+                    if subscription.status == Subscription.STATUS_PAST_DUE:
+                        subscription.status = Subscription.STATUS_ACTIVE
+                        subscription.save()
+                        logger.info(f"Subscription {subscription.id} payment succeeded, status set to active")
+
+            except Subscription.DoesNotExist:
+                logger.warning(f"Payment succeeded event received but subscription not found: {subscription_id}")
+
+    elif event_type == 'invoice.payment_action_required':
+        # Payment requires action (e.g., 3D Secure authentication)
+        invoice_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        subscription_id = invoice_obj.get('subscription') if isinstance(invoice_obj, dict) else None
+
+        logger.info(f"Processing invoice.payment_action_required for subscription {subscription_id}")
+
+        if subscription_id:
+            try:
+                subscription = Subscription.objects.get(
+                    stripe_subscription_id=subscription_id
+                )
+                # Don't downgrade yet - payment might still succeed after action
+                # Just log for monitoring
+                logger.info(
+                    f"Subscription {subscription.id} payment requires action "
+                    f"(invoice: {invoice_obj.get('id', 'unknown')})"
+                )
+            except Subscription.DoesNotExist:
+                logger.warning(f"Payment action required event received but subscription not found: {subscription_id}")
+
+    elif event_type == 'customer.updated':
+        customer_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        customer_id = customer_obj.get('id') if isinstance(customer_obj, dict) else None
+        if customer_id:
+            StripeCustomer.objects.filter(customer_id=customer_id).update(
+                email=customer_obj.get('email') or '', updated_at=timezone.now()
+            )
+
+    elif event_type == 'customer.deleted':
+        customer_obj = event_data.get('object', {}) if isinstance(event_data, dict) else {}
+        customer_id = customer_obj.get('id') if isinstance(customer_obj, dict) else None
+        if forget_customer(customer_id):
+            logger.info(f"Stripe customer {customer_id} deleted, mapping removed")
+
+    else:
+        logger.debug(f"Unhandled webhook event type: {event_type}")
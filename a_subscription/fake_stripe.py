@@ -0,0 +1,219 @@
+"""
+Minimal local stand-in for the Stripe API, for offline tests and development.
+
+Serves the handful of endpoints this project uses (subscriptions, customers,
+checkout and billing portal sessions) from in-memory data, with Stripe-style
+list pagination and error bodies. It can inject latency and failures, and
+records every request and the client connections it saw, so timeouts,
+keep-alive, retries and the circuit breaker can be exercised without network access.
+
+    with FakeStripeServer(subscriptions=[...]) as server:
+        with override_settings(STRIPE_API_BASE=server.url, STRIPE_SECRET_KEY='sk_test_local'):
+            ...
+
+Run it standalone with `python manage.py run_fake_stripe` and set STRIPE_API_BASE.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _error(message, status=400, error_type='invalid_request_error'):
+    return status, {'error': {'type': error_type, 'message': message}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, method):
+        fake = self.server.fake
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8')
+            params.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+        fake.record(method, parsed.path, self.client_address)
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        status, payload = fake.take_failure() or fake.route(method, parsed.path, params)
+        data = json.dumps(payload).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Request-Id', f'req_fake_{len(fake.requests)}')
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client gave up (e.g. a timeout test)
+            self.close_connection = True
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def do_DELETE(self):
+        self._respond('DELETE')
+
+
+class FakeStripeServer:
+    """
+    In-process fake Stripe API on 127.0.0.1.
+
+    Args:
+        subscriptions: list of subscription dicts (need at least 'id' and 'customer')
+        customers: list of customer dicts (need at least 'id')
+        latency: seconds to sleep before every response
+        port: port to bind, 0 picks a free one
+    """
+
+    def __init__(self, subscriptions=(), customers=(), latency=0.0, port=0):
+        self.subscriptions = {}
+        self.customers = {}
+        for subscription in subscriptions:
+            self.add_subscription(subscription)
+        for customer in customers:
+            self.add_customer(customer)
+        self.latency = latency
+        self.requests = []
+        self.connections = set()
+        self._failures = []
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Test controls
+
+    def add_subscription(self, subscription):
+        subscription = {'object': 'subscription', 'status': 'active', 'metadata': {}, **subscription}
+        self.subscriptions[subscription['id']] = subscription
+        return subscription
+
+    def add_customer(self, customer):
+        customer = {'object': 'customer', 'email': None, 'metadata': {}, **customer}
+        self.customers[customer['id']] = customer
+        return customer
+
+    def fail_next(self, count=1, status=500, message='Fake Stripe failure'):
+        """Answer the next `count` requests with an error status."""
+        error_type = 'rate_limit_error' if status == 429 else 'api_error'
+        with self._lock:
+            self._failures.extend([_error(message, status, error_type)] * count)
+
+    def take_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def record(self, method, path, client_address):
+        with self._lock:
+            self.requests.append((method, path))
+            self.connections.add(client_address)
+
+    def _next_id(self, prefix):
+        with self._lock:
+            self._counter += 1
+            return f'{prefix}_fake{self._counter}'
+
+    # Routing
+
+    def route(self, method, path, params):
+        parts = [part for part in path.split('/') if part][1:]  # drop "v1"
+        if not parts:
+            return _error('Unrecognized request URL', 404)
+        resource, object_id = parts[0], parts[1] if len(parts) > 1 else None
+
+        if resource == 'subscriptions':
+            if method == 'GET' and object_id is None:
+                items = list(self.subscriptions.values())
+                if params.get('customer'):
+                    items = [s for s in items if s.get('customer') == params['customer']]
+                if params.get('status') and params['status'] != 'all':
+                    items = [s for s in items if s.get('status') == params['status']]
+                return self._list(path, items, params)
+            if object_id not in self.subscriptions:
+                return _error(f"No such subscription: '{object_id}'", 404)
+            subscription = self.subscriptions[object_id]
+            if method == 'DELETE':
+                subscription['status'] = 'canceled'
+            elif method == 'POST':
+                subscription['metadata'].update(self._metadata(params))
+            return 200, subscription
+
+        if resource == 'customers':
+            if method == 'GET' and object_id is None:
+                items = list(self.customers.values())
+                if params.get('email'):
+                    items = [c for c in items if c.get('email') == params['email']]
+                return self._list(path, items, params)
+            if method == 'POST' and object_id is None:
+                customer = self.add_customer({
+                    'id': self._next_id('cus'),
+                    'email': params.get('email'),
+                    'metadata': self._metadata(params),
+                })
+                return 200, customer
+            if object_id not in self.customers:
+                return _error(f"No such customer: '{object_id}'", 404)
+            return 200, self.customers[object_id]
+
+        if resource in ('checkout', 'billing_portal') and method == 'POST':
+            session_id = self._next_id('cs' if resource == 'checkout' else 'bps')
+            return 200, {
+                'id': session_id,
+                'object': f'{resource}.session',
+                'url': f'{self.url}/pay/{session_id}',
+                'customer': params.get('customer'),
+                'metadata': self._metadata(params),
+            }
+
+        return _error('Unrecognized request URL', 404)
+
+    def _metadata(self, params):
+        return {key[len('metadata['):-1]: value for key, value in params.items() if key.startswith('metadata[')}
+
+    def _list(self, path, items, params):
+        limit = int(params.get('limit') or 10)
+        if params.get('starting_after'):
+            ids = [item['id'] for item in items]
+            if params['starting_after'] in ids:
+                items = items[ids.index(params['starting_after']) + 1:]
+        return 200, {
+            'object': 'list',
+            'url': path,
+            'data': items[:limit],
+            'has_more': len(items) > limit,
+        }
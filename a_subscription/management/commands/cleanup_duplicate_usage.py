@@ -1,10 +1,27 @@
+"""
+Merge duplicate SubscriptionUsage records.
+
+Rows of one family whose period_start falls in the same minute are one
+period. The work is done in SQL: a GROUP BY on Trunc('period_start', 'minute')
+finds the families with duplicates, then per chunk of families a single
+window query ranks each group's rows with ROW_NUMBER() and returns the
+per-group maximum of every counter. Losers are deleted with one DELETE and
+winners get the merged counters (and the normalized period_start) with one
+bulk_update, so memory use depends on the chunk size, not the table size.
+"""
 from django.core.management.base import BaseCommand
-from django.db.models import Count, Q
-from django.utils import timezone
-from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, F, Max, Window
+from django.db.models.functions import RowNumber, Trunc
 from a_subscription.models import SubscriptionUsage
 
 
+# Families handled per window query / transaction
+DEFAULT_CHUNK_SIZE = 500
+
+MERGED_FIELDS = ['tasks_created', 'rewards_created', 'recurring_tasks_created']
+
+
 class Command(BaseCommand):
     help = 'Clean up duplicate SubscriptionUsage records, keeping the one with the highest values'
 
@@ -19,121 +36,107 @@ class Command(BaseCommand):
             type=str,
             help='Only clean up duplicates for a specific family (searches by name containing this string)',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Number of families to merge per transaction (default {DEFAULT_CHUNK_SIZE})',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         family_name_filter = options.get('family_name')
-        
+        chunk_size = max(options['chunk_size'], 1)
+        self.verbosity = options['verbosity']
+
+        records = SubscriptionUsage.objects.all()
+
         # Filter by family name if specified
-        from a_family.models import Family
-        family_filter = {}
         if family_name_filter:
+            from a_family.models import Family
             families = Family.objects.filter(name__icontains=family_name_filter)
             if not families.exists():
                 self.stdout.write(self.style.ERROR(f'No family found with "{family_name_filter}" in name'))
                 return
-            family_filter = {'family__in': families}
+            records = records.filter(family__in=families)
             self.stdout.write(f'Filtering for families: {", ".join([f.name for f in families])}')
-        
-        # Also find near-duplicates (same family, period_start within 1 minute)
-        # Group by family and normalized period_start (rounded to minute)
-        all_records = SubscriptionUsage.objects.filter(**family_filter).order_by('family', 'period_start')
-        
-        # Group records by family and normalized period_start
-        grouped = {}
-        for record in all_records:
-            # Normalize period_start to minute precision
-            normalized = record.period_start.replace(second=0, microsecond=0)
-            key = (record.family_id, normalized)
-            
-            if key not in grouped:
-                grouped[key] = []
-            grouped[key].append(record)
-        
-        # Find groups with multiple records
-        duplicate_groups = {k: v for k, v in grouped.items() if len(v) > 1}
-        
-        if not duplicate_groups:
+
+        # Families that have at least one (family, minute) group with more than one row
+        family_ids = sorted(set(
+            records.annotate(period_minute=Trunc('period_start', 'minute'))
+            .values('family_id', 'period_minute')
+            .annotate(rows=Count('id'))
+            .filter(rows__gt=1)
+            .values_list('family_id', flat=True)
+        ))
+
+        if not family_ids:
             self.stdout.write(self.style.SUCCESS('No duplicate records found.'))
             return
-        
-        self.stdout.write(f'Found {len(duplicate_groups)} duplicate group(s).')
-        
+
+        self.stdout.write(f'Found duplicates in {len(family_ids)} family(ies).')
+
+        total_groups = 0
         total_deleted = 0
-        
-        for (family_id, normalized_period), records in duplicate_groups.items():
-            # Sort records: keep the one with highest values or most recent
-            records_sorted = sorted(
-                records,
-                key=lambda r: (
-                    -r.tasks_created,
-                    -r.rewards_created,
-                    -r.recurring_tasks_created,
-                    -r.updated_at.timestamp() if r.updated_at else 0
-                )
-            )
-            
-            keep_record = records_sorted[0]
-            delete_records = records_sorted[1:]
-            
-            self.stdout.write(
-                f'\nFamily: {keep_record.family.name}, Period: {normalized_period}'
-            )
-            self.stdout.write(
-                f'  Keeping: ID {keep_record.id} (period_start={keep_record.period_start}, '
-                f'tasks={keep_record.tasks_created}, '
-                f'rewards={keep_record.rewards_created}, '
-                f'recurring={keep_record.recurring_tasks_created})'
-            )
-            
-            # Merge values: take the maximum of each field
-            for record in delete_records:
-                self.stdout.write(
-                    f'  {"Would delete" if dry_run else "Deleting"}: ID {record.id} '
-                    f'(period_start={record.period_start}, tasks={record.tasks_created}, '
-                    f'rewards={record.rewards_created}, '
-                    f'recurring={record.recurring_tasks_created})'
-                )
-                
-                # Merge values into keep_record
-                keep_record.tasks_created = max(keep_record.tasks_created, record.tasks_created)
-                keep_record.rewards_created = max(keep_record.rewards_created, record.rewards_created)
-                keep_record.recurring_tasks_created = max(
-                    keep_record.recurring_tasks_created, 
-                    record.recurring_tasks_created
-                )
-            
-            if not dry_run:
-                # Normalize period_start to minute precision
-                keep_record.period_start = normalized_period
-                keep_record.save()
-                
-                # Delete duplicates
-                for record in delete_records:
-                    record.delete()
-                    total_deleted += 1
-                
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'  Merged and deleted {len(delete_records)} duplicate(s). '
-                        f'Final values: tasks={keep_record.tasks_created}, '
-                        f'rewards={keep_record.rewards_created}, '
-                        f'recurring={keep_record.recurring_tasks_created}'
-                    )
-                )
-        
+        for start in range(0, len(family_ids), chunk_size):
+            groups, deleted = self._merge_chunk(records, family_ids[start:start + chunk_size], dry_run)
+            total_groups += groups
+            total_deleted += deleted
+
         if dry_run:
-            would_delete = sum(len(records) - 1 for records in duplicate_groups.values())
             self.stdout.write(
                 self.style.WARNING(
-                    f'\nDRY RUN: Would delete {would_delete} duplicate record(s). '
-                    'Run without --dry-run to actually delete.'
+                    f'\nDRY RUN: Would merge {total_groups} duplicate group(s) and delete {total_deleted} '
+                    'duplicate record(s). Run without --dry-run to actually delete.'
                 )
             )
         else:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'\nSuccessfully deleted {total_deleted} duplicate record(s).'
+                    f'\nSuccessfully merged {total_groups} duplicate group(s) and deleted '
+                    f'{total_deleted} duplicate record(s).'
                 )
             )
 
+    def _merge_chunk(self, records, family_ids, dry_run):
+        """Merge all duplicate groups of these families. Returns (groups, deleted)."""
+        period_minute = Trunc('period_start', 'minute')
+        partition = [F('family_id'), period_minute]
+        ranked = records.filter(family_id__in=family_ids).annotate(
+            period_minute=period_minute,
+            group_rows=Window(Count('id'), partition_by=partition),
+            rank=Window(
+                RowNumber(),
+                partition_by=partition,
+                # Keep the row with the highest values, then the most recently updated
+                order_by=[F(field).desc() for field in MERGED_FIELDS] + [F('updated_at').desc(), F('id').desc()],
+            ),
+            **{f'max_{field}': Window(Max(field), partition_by=partition) for field in MERGED_FIELDS},
+        ).filter(group_rows__gt=1).values(
+            'id', 'family_id', 'period_minute', 'rank', *[f'max_{field}' for field in MERGED_FIELDS]
+        )
+
+        keepers = []
+        loser_ids = []
+        for row in ranked:
+            if row['rank'] > 1:
+                loser_ids.append(row['id'])
+                continue
+            keeper = SubscriptionUsage(id=row['id'], period_start=row['period_minute'])
+            for field in MERGED_FIELDS:
+                setattr(keeper, field, row[f'max_{field}'])
+            keepers.append(keeper)
+            if self.verbosity >= 2:
+                self.stdout.write(
+                    f'  Family {row["family_id"]}, period {row["period_minute"]}: keeping ID {row["id"]} '
+                    f'(tasks={keeper.tasks_created}, rewards={keeper.rewards_created}, '
+                    f'recurring={keeper.recurring_tasks_created})'
+                )
+
+        if not dry_run and keepers:
+            with transaction.atomic():
+                # Delete first: a winner's normalized period_start may equal a loser's
+                SubscriptionUsage.objects.filter(pk__in=loser_ids).delete()
+                SubscriptionUsage.objects.bulk_update(keepers, ['period_start', *MERGED_FIELDS])
+
+        return len(keepers), len(loser_ids)
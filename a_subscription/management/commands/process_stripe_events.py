@@ -0,0 +1,37 @@
+"""
+Process stored Stripe webhook events (StripeEventInbox).
+The scheduler runs the same worker every few seconds; use this command to
+drain the inbox manually, e.g. after an outage.
+"""
+from django.core.management.base import BaseCommand
+
+from a_subscription.events import PROCESS_BATCH_SIZE, process_inbox
+
+
+class Command(BaseCommand):
+    help = 'Processes pending Stripe webhook events from the event inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=PROCESS_BATCH_SIZE,
+            help=f'Events handled per batch (default: {PROCESS_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        totals = {'processed': 0, 'coalesced': 0, 'failed': 0, 'deferred': 0}
+        while True:
+            stats = process_inbox(limit=options['batch_size'])
+            for key in totals:
+                totals[key] += stats[key]
+            # Stop when a batch made no progress (empty inbox or only deferred events)
+            if not (stats['processed'] or stats['coalesced'] or stats['failed']):
+                break
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {totals['processed']} event(s), coalesced {totals['coalesced']}, "
+                f"failed {totals['failed']}, deferred {totals['deferred']}"
+            )
+        )
@@ -0,0 +1,46 @@
+"""
+Run the local fake Stripe API (a_subscription.fake_stripe) for offline development.
+Point the app at it with STRIPE_API_BASE=http://127.0.0.1:<port>.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from a_subscription.fake_stripe import FakeStripeServer
+
+
+class Command(BaseCommand):
+    help = 'Runs a local fake Stripe API server for offline development and testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=12111, help='Port to listen on (default: 12111)')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before every response')
+        parser.add_argument(
+            '--fixtures',
+            type=str,
+            help='JSON file with {"subscriptions": [...], "customers": [...]} to preload',
+        )
+
+    def handle(self, *args, **options):
+        fixtures = {}
+        if options['fixtures']:
+            with open(options['fixtures'], encoding='utf-8') as f:
+                fixtures = json.load(f)
+
+        server = FakeStripeServer(
+            subscriptions=fixtures.get('subscriptions', []),
+            customers=fixtures.get('customers', []),
+            latency=options['latency'],
+            port=options['port'],
+        )
+        server.start()
+        self.stdout.write(self.style.SUCCESS(f"Fake Stripe API listening on {server.url} (Ctrl+C to stop)"))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(f"Served {len(server.requests)} request(s)")
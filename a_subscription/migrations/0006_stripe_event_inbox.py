@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_subscription', '0005_subscriptionusage_recurring_tasks_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEventInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('event_type', models.CharField(db_index=True, max_length=100)),
+                ('customer_id', models.CharField(blank=True, default='', max_length=255)),
+                ('object_id', models.CharField(blank=True, default='', max_length=255)),
+                ('stripe_created', models.DateTimeField()),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Ootel'), ('processing', 'Töötlemisel'), ('processed', 'Töödeldud'), ('coalesced', 'Asendatud uuemaga'), ('failed', 'Ebaõnnestunud')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Stripe event',
+                'verbose_name_plural': 'Stripe events',
+                'db_table': 'subscription_stripeeventinbox',
+                'ordering': ['stripe_created', 'id'],
+                'indexes': [models.Index(fields=['status', 'customer_id', 'stripe_created'], name='subscriptio_status_d23075_idx'), models.Index(fields=['object_id', 'status'], name='subscriptio_object__ec6a94_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_stripe_customers(apps, schema_editor):
+    """Map each owner to the customer of their newest subscription that has one."""
+    Subscription = apps.get_model('a_subscription', 'Subscription')
+    StripeCustomer = apps.get_model('a_subscription', 'StripeCustomer')
+
+    seen_users = set()
+    seen_customers = set()
+    rows = []
+    subscriptions = Subscription.objects.exclude(stripe_customer_id__isnull=True).exclude(
+        stripe_customer_id=''
+    ).order_by('-created_at').values_list('owner_id', 'stripe_customer_id', 'owner__email')
+    for owner_id, customer_id, email in subscriptions.iterator(chunk_size=1000):
+        if owner_id in seen_users or customer_id in seen_customers:
+            continue
+        seen_users.add(owner_id)
+        seen_customers.add(customer_id)
+        rows.append(StripeCustomer(user_id=owner_id, customer_id=customer_id, email=email or ''))
+    StripeCustomer.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_subscription', '0006_stripe_event_inbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='cancel_at_period_end',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='stripe_item_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='stripe_price_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='StripeCustomer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_id', models.CharField(max_length=255, unique=True)),
+                ('email', models.EmailField(blank=True, default='', max_length=254)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stripe_customer', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Stripe customer',
+                'verbose_name_plural': 'Stripe customers',
+                'db_table': 'subscription_stripecustomer',
+            },
+        ),
+        migrations.RunPython(backfill_stripe_customers, migrations.RunPython.noop),
+    ]
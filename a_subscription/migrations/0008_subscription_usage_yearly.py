@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_family', '0011_family_usage_period'),
+        ('a_subscription', '0007_stripe_customer_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionUsageYearly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('periods', models.PositiveIntegerField(default=0)),
+                ('tasks_created', models.PositiveIntegerField(default=0)),
+                ('rewards_created', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('family', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscription_usage_yearly', to='a_family.family')),
+            ],
+            options={
+                'verbose_name': 'yearly subscription usage',
+                'verbose_name_plural': 'yearly subscription usages',
+                'db_table': 'subscription_subscriptionusageyearly',
+                'ordering': ['-year'],
+                'unique_together': {('family', 'year')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_subscription', '0008_subscription_usage_yearly'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeeventinbox',
+            name='claim_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stripeeventinbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
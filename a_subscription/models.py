@@ -42,6 +42,11 @@ class Subscription(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE, db_index=True)
     current_period_start = models.DateTimeField(null=True, blank=True)
     current_period_end = models.DateTimeField(null=True, blank=True)
+    # Snapshot of the Stripe subscription, kept fresh by webhooks and the nightly sync,
+    # so pages and plan changes do not need a Subscription.retrieve
+    stripe_price_id = models.CharField(max_length=255, blank=True, default='')
+    stripe_item_id = models.CharField(max_length=255, blank=True, default='')
+    cancel_at_period_end = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -66,6 +71,30 @@ class Subscription(models.Model):
         return self.status == self.STATUS_ACTIVE or self.status == self.STATUS_TRIALING
 
 
+class StripeCustomer(models.Model):
+    """
+    Persistent mapping from a user to their Stripe customer.
+    Replaces looking the customer up by email (Customer.list) on every checkout.
+    """
+    user = models.OneToOneField(
+        'a_family.User',
+        on_delete=models.CASCADE,
+        related_name='stripe_customer',
+    )
+    customer_id = models.CharField(max_length=255, unique=True)
+    email = models.EmailField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'subscription_stripecustomer'
+        verbose_name = 'Stripe customer'
+        verbose_name_plural = 'Stripe customers'
+
+    def __str__(self):
+        return f'{self.user.get_display_name()} - {self.customer_id}'
+
+
 class SubscriptionUsage(models.Model):
     """Track usage of tasks and rewards per family per subscription period"""
     family = models.ForeignKey(
@@ -92,3 +121,83 @@ class SubscriptionUsage(models.Model):
 
     def __str__(self):
         return f'{self.family.name} - {self.period_start.strftime("%Y-%m-%d %H:%M")}'
+
+
+class SubscriptionUsageYearly(models.Model):
+    """
+    Yearly totals of SubscriptionUsage periods removed by the retention job
+    (a_subscription.retention_utils). One row per family per calendar year.
+    """
+    family = models.ForeignKey(
+        'a_family.Family',
+        on_delete=models.CASCADE,
+        related_name='subscription_usage_yearly',
+    )
+    year = models.PositiveSmallIntegerField()
+    periods = models.PositiveIntegerField(default=0)
+    tasks_created = models.PositiveIntegerField(default=0)
+    rewards_created = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'subscription_subscriptionusageyearly'
+        verbose_name = 'yearly subscription usage'
+        verbose_name_plural = 'yearly subscription usages'
+        unique_together = ['family', 'year']
+        ordering = ['-year']
+
+    def __str__(self):
+        return f'{self.family.name} - {self.year}'
+
+
+class StripeEventInbox(models.Model):
+    """
+    Stripe webhook events waiting to be processed (and a record of processed ones).
+
+    The webhook view only verifies and stores the event; the unique event_id
+    makes redelivered events a no-op. a_subscription.events drains the inbox
+    in order per customer.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_PROCESSED = 'processed'
+    STATUS_COALESCED = 'coalesced'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ootel'),
+        (STATUS_PROCESSING, 'Töötlemisel'),
+        (STATUS_PROCESSED, 'Töödeldud'),
+        (STATUS_COALESCED, 'Asendatud uuemaga'),
+        (STATUS_FAILED, 'Ebaõnnestunud'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100, db_index=True)
+    customer_id = models.CharField(max_length=255, blank=True, default='')
+    # Subscription the event is about (subscription id or invoice.subscription), used for coalescing
+    object_id = models.CharField(max_length=255, blank=True, default='')
+    stripe_created = models.DateTimeField()
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Set on claim; the worker only handles rows carrying its own token
+    claim_token = models.UUIDField(null=True, blank=True)
+    # Failed events are not retried before this time (exponential backoff)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'subscription_stripeeventinbox'
+        verbose_name = 'Stripe event'
+        verbose_name_plural = 'Stripe events'
+        ordering = ['stripe_created', 'id']
+        indexes = [
+            models.Index(fields=['status', 'customer_id', 'stripe_created']),
+            models.Index(fields=['object_id', 'status']),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} {self.event_id} ({self.status})'
@@ -0,0 +1,101 @@
+"""
+Retention for SubscriptionUsage.
+
+Limit checks only ever read the current period, so old period rows are
+rolled up into SubscriptionUsageYearly (one row per family per year) and
+deleted in primary-key batches. Each batch is aggregated with one GROUP BY,
+merged into the yearly rows and deleted in the same transaction, so a
+crash never counts a period twice.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from datetime import timedelta
+
+from a_tasks.batch_utils import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SLEEP, iter_pk_batches
+from .models import SubscriptionUsage, SubscriptionUsageYearly
+
+logger = logging.getLogger(__name__)
+
+
+def compact_subscription_usage(retention_days=None, batch_size=DEFAULT_BATCH_SIZE,
+                               sleep_seconds=DEFAULT_BATCH_SLEEP, progress=None):
+    """
+    Roll SubscriptionUsage periods that started more than `retention_days` ago
+    into yearly totals and delete them.
+
+    Args:
+        retention_days: detail rows to keep, in days (default SUBSCRIPTION_USAGE_RETENTION_DAYS)
+        progress: optional callable(label, rows_done) called after each batch
+
+    Returns:
+        int: number of period rows compacted
+    """
+    if retention_days is None:
+        retention_days = settings.SUBSCRIPTION_USAGE_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    old_rows = SubscriptionUsage.objects.filter(period_start__lt=cutoff)
+
+    compacted = 0
+    for pks in iter_pk_batches(old_rows, batch_size, sleep_seconds):
+        with transaction.atomic():
+            compacted += _compact_batch(pks)
+        logger.info(f"Subscription usage retention: {compacted} period row(s) compacted")
+        if progress:
+            progress('subscription usage', compacted)
+    return compacted
+
+
+def _compact_batch(pks):
+    totals = list(
+        SubscriptionUsage.objects.filter(pk__in=pks)
+        .annotate(year=ExtractYear('period_start'))
+        .values('family_id', 'year')
+        .annotate(
+            periods=Count('id'),
+            tasks=Sum('tasks_created'),
+            rewards=Sum('rewards_created'),
+        )
+        .order_by()
+    )
+
+    existing = {
+        (row.family_id, row.year): row
+        for row in SubscriptionUsageYearly.objects.filter(
+            family_id__in={total['family_id'] for total in totals},
+            year__in={total['year'] for total in totals},
+        )
+    }
+
+    to_update = []
+    to_create = []
+    for total in totals:
+        yearly = existing.get((total['family_id'], total['year']))
+        if yearly is None:
+            to_create.append(SubscriptionUsageYearly(
+                family_id=total['family_id'],
+                year=total['year'],
+                periods=total['periods'],
+                tasks_created=total['tasks'] or 0,
+                rewards_created=total['rewards'] or 0,
+            ))
+            continue
+        yearly.periods = F('periods') + total['periods']
+        yearly.tasks_created = F('tasks_created') + (total['tasks'] or 0)
+        yearly.rewards_created = F('rewards_created') + (total['rewards'] or 0)
+        yearly.updated_at = timezone.now()
+        to_update.append(yearly)
+
+    if to_update:
+        SubscriptionUsageYearly.objects.bulk_update(
+            to_update, ['periods', 'tasks_created', 'rewards_created', 'updated_at']
+        )
+    if to_create:
+        SubscriptionUsageYearly.objects.bulk_create(to_create)
+
+    # Nothing references SubscriptionUsage and it has no delete signals
+    return SubscriptionUsage.objects.filter(pk__in=pks)._raw_delete(SubscriptionUsage.objects.db)
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Subscription
+
+
+@receiver(post_save, sender=Subscription)
+def reset_family_period(sender, instance, raw=False, **kwargs):
+    """
+    A subscription change can move the family's usage period (upgrade, renewal, downgrade).
+    Clear the stored boundaries so the next lookup recalculates them.
+    """
+    if raw:
+        return
+    from .utils import clear_family_periods
+    clear_family_periods([instance.owner_id])
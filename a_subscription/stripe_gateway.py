@@ -0,0 +1,291 @@
+"""
+Shared gateway for all Stripe API calls.
+
+Views, webhooks and management commands call Stripe through `call()` instead
+of using the global `stripe` module directly. The gateway:
+- configures the Stripe SDK once per process (API key, optional API base,
+  network retries) with a pooled keep-alive HTTP session and connect/read timeouts,
+- allows a per-call timeout override (e.g. a short one inside request handlers),
+- throttles outgoing requests with a token bucket (per process),
+- opens a circuit breaker after repeated connection/5xx failures so callers
+  fail fast with StripeUnavailable instead of blocking a worker on timeouts,
+- fans out bulk retrieves over a small thread pool (`map_concurrent`, `retrieve_many`).
+
+StripeUnavailable subclasses stripe.StripeError, so existing
+`except stripe.StripeError` handlers treat it like any other Stripe failure.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import stripe
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Errors that say something about Stripe's availability (not about our request)
+BREAKER_ERRORS = (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError)
+
+# Longest time a caller waits for a rate limiter token before giving up
+MAX_RATE_LIMIT_WAIT = 5.0
+
+# Connection pool size of the shared HTTP session (covers the fan-out thread pool)
+HTTP_POOL_SIZE = 16
+
+
+class StripeUnavailable(stripe.StripeError):
+    """Raised without contacting Stripe when the circuit is open or the rate limit wait is too long."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=MAX_RATE_LIMIT_WAIT):
+        """Take one token, sleeping until one is available. Returns False if that takes longer than max_wait."""
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures.
+    While open every call fails fast; after `reset_timeout` seconds one trial
+    call is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.STATE_CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.STATE_HALF_OPEN
+        return self.STATE_OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == self.STATE_CLOSED:
+                return True
+            if state == self.STATE_HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Stripe circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Stripe circuit breaker opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+
+class _GatewayHttpClient(stripe.RequestsClient):
+    """RequestsClient sharing one pooled session, with a per-thread timeout override."""
+
+    def __init__(self, timeout, session):
+        self._timeout_override = threading.local()
+        super().__init__(timeout=timeout, session=session)
+
+    @property
+    def _timeout(self):
+        return getattr(self._timeout_override, 'value', None) or self._default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._default_timeout = value
+
+
+_lock = threading.Lock()
+_http_client = None
+_rate_limiter = None
+_breaker = None
+
+
+def _build_http_client():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return _GatewayHttpClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+        session=session,
+    )
+
+
+def configure():
+    """
+    Point the Stripe SDK at the configured key/host and install the pooled HTTP client.
+    Safe to call on every request; the HTTP client, limiter and breaker are built once.
+    """
+    global _http_client, _rate_limiter, _breaker
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = getattr(settings, 'STRIPE_API_BASE', None) or 'https://api.stripe.com'
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _rate_limiter = TokenBucket(settings.STRIPE_RATE_LIMIT)
+                _breaker = CircuitBreaker(settings.STRIPE_BREAKER_THRESHOLD, settings.STRIPE_BREAKER_RESET_SECONDS)
+                _http_client = _build_http_client()
+    stripe.default_http_client = _http_client
+
+
+def reset():
+    """Drop the HTTP client, limiter and breaker so the next call rebuilds them from settings (tests)."""
+    global _http_client, _rate_limiter, _breaker
+    with _lock:
+        _http_client = None
+        _rate_limiter = None
+        _breaker = None
+    stripe.default_http_client = None
+
+
+def get_breaker():
+    configure()
+    return _breaker
+
+
+def call(func, *args, timeout=None, **kwargs):
+    """
+    Call a Stripe SDK function through the rate limiter and circuit breaker.
+
+        customer = stripe_gateway.call(stripe.Customer.retrieve, customer_id, timeout=5)
+
+    Args:
+        func: Stripe SDK callable (e.g. stripe.Subscription.retrieve)
+        timeout: optional read timeout in seconds for this call only
+
+    Raises:
+        StripeUnavailable: circuit open or rate limit wait exceeded (Stripe was not contacted)
+        stripe.StripeError: any error returned by Stripe
+    """
+    configure()
+    if not _breaker.allow():
+        raise StripeUnavailable("Stripe is temporarily unavailable (circuit open)")
+    if not _rate_limiter.acquire():
+        raise StripeUnavailable("Stripe rate limit exceeded")
+
+    if timeout is not None:
+        _http_client._timeout_override.value = (settings.STRIPE_CONNECT_TIMEOUT, timeout)
+    try:
+        result = func(*args, **kwargs)
+    except BREAKER_ERRORS:
+        _breaker.record_failure()
+        raise
+    except Exception:
+        # Request-level errors (invalid request, card declined, ...) mean Stripe is up
+        _breaker.record_success()
+        raise
+    finally:
+        if timeout is not None:
+            _http_client._timeout_override.value = None
+    _breaker.record_success()
+    return result
+
+
+def iter_all(list_func, page_size=100, **params):
+    """
+    Iterate over every object of a Stripe list endpoint, one gateway call per page.
+
+        for subscription in stripe_gateway.iter_all(stripe.Subscription.list, status='all'):
+            ...
+    """
+    params['limit'] = page_size
+    while True:
+        page = call(list_func, **params)
+        data = page.get('data') or []
+        yield from data
+        if not page.get('has_more') or not data:
+            return
+        params['starting_after'] = data[-1].get('id')
+
+
+def map_concurrent(func, items, max_workers=None, timeout=None):
+    """
+    Run `call(func, item)` for every item on a thread pool.
+    The rate limiter still applies, so this only overlaps network latency.
+
+    Returns:
+        list of (item, result, error) tuples in input order; error is None on success
+    """
+    items = list(items)
+    if not items:
+        return []
+    configure()
+    max_workers = min(max_workers or settings.STRIPE_MAX_WORKERS, len(items))
+
+    def run(item):
+        try:
+            return item, call(func, item, timeout=timeout), None
+        except Exception as e:
+            return item, None, e
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stripe') as executor:
+        return list(executor.map(run, items))
+
+
+def retrieve_many(retrieve_func, ids, max_workers=None, timeout=None):
+    """
+    Retrieve many Stripe objects concurrently.
+
+    Returns:
+        tuple: (found: dict {id: object}, errors: dict {id: exception})
+    """
+    found = {}
+    errors = {}
+    for object_id, result, error in map_concurrent(retrieve_func, dict.fromkeys(ids), max_workers, timeout):
+        if error is None:
+            found[object_id] = result
+        else:
+            errors[object_id] = error
+            logger.warning(f"Could not retrieve Stripe object {object_id}: {str(error)}")
+    return found, errors
@@ -0,0 +1,250 @@
+"""
+Mapping of Stripe subscription objects onto Subscription rows.
+
+Shared by the checkout views, the webhook event inbox (events.py) and the
+reconciliation job (sync_utils.py).
+"""
+import logging
+from datetime import datetime
+
+from django.utils import timezone
+
+from .models import Subscription
+from .utils import get_tier_from_price_id
+
+logger = logging.getLogger(__name__)
+
+
+def extract_tier_from_subscription(subscription_obj):
+    """
+    Extract tier from Stripe subscription object.
+    Tries to get tier from price ID first, then falls back to metadata.
+    
+    Args:
+        subscription_obj: Stripe subscription object (dict or Stripe object)
+    
+    Returns:
+        str: Subscription tier or None
+    """
+    # Handle Stripe object - try to_dict first, then access attributes
+    if hasattr(subscription_obj, 'to_dict'):
+        subscription_dict = subscription_obj.to_dict()
+    elif isinstance(subscription_obj, dict):
+        # Plain dict (dict.items is a method, so check this before the attribute branch)
+        subscription_dict = subscription_obj
+    elif hasattr(subscription_obj, 'items'):
+        # Stripe object with items attribute
+        try:
+            # Try to get items directly
+            items_obj = subscription_obj.items
+            if hasattr(items_obj, 'data') and items_obj.data:
+                # Get first item
+                first_item = items_obj.data[0] if items_obj.data else None
+                if first_item:
+                    price_obj = first_item.price if hasattr(first_item, 'price') else None
+                    if price_obj:
+                        price_id = price_obj.id if hasattr(price_obj, 'id') else str(price_obj) if isinstance(price_obj, str) else None
+                        if price_id:
+                            tier = get_tier_from_price_id(price_id)
+                            if tier:
+                                logger.debug(f"Extracted tier {tier} from Stripe object price ID {price_id}")
+                                return tier
+        except Exception as e:
+            logger.debug(f"Error extracting tier from Stripe object attributes: {str(e)}")
+        
+        # Fallback: try to convert to dict
+        try:
+            subscription_dict = subscription_obj.to_dict() if hasattr(subscription_obj, 'to_dict') else {}
+        except Exception:
+            subscription_dict = {}
+    else:
+        subscription_dict = subscription_obj if isinstance(subscription_obj, dict) else {}
+    
+    # Try to get tier from price ID (primary method, scalable)
+    items = subscription_dict.get('items', {})
+    if isinstance(items, dict):
+        items_data = items.get('data', [])
+    elif hasattr(items, 'data'):
+        items_data = items.data if hasattr(items, 'data') else []
+    else:
+        items_data = []
+    
+    if items_data and len(items_data) > 0:
+        first_item = items_data[0]
+        if isinstance(first_item, dict):
+            price = first_item.get('price', {})
+        elif hasattr(first_item, 'price'):
+            price_obj = first_item.price
+            price = price_obj.to_dict() if hasattr(price_obj, 'to_dict') else {'id': getattr(price_obj, 'id', None)}
+        else:
+            price = {}
+        
+        price_id = price.get('id') if isinstance(price, dict) else (getattr(price, 'id', None) if hasattr(price, 'id') else None)
+        if price_id:
+            tier = get_tier_from_price_id(price_id)
+            if tier:
+                logger.debug(f"Extracted tier {tier} from price ID {price_id}")
+                return tier
+    
+    # Fallback to metadata
+    metadata = subscription_dict.get('metadata', {})
+    if not metadata and hasattr(subscription_obj, 'metadata'):
+        metadata = subscription_obj.metadata if hasattr(subscription_obj, 'metadata') else {}
+    
+    tier = metadata.get('tier') if isinstance(metadata, dict) else getattr(metadata, 'tier', None) if metadata else None
+    if tier in [Subscription.TIER_STARTER, Subscription.TIER_PRO]:
+        logger.debug(f"Extracted tier {tier} from metadata")
+        return tier
+    
+    return None
+
+
+def extract_item_from_subscription(subscription_dict):
+    """
+    Get (item_id, price_id) of the first subscription item.
+    
+    Args:
+        subscription_dict: Stripe subscription as a dict
+    
+    Returns:
+        tuple: (item_id or None, price_id or None)
+    """
+    items = subscription_dict.get('items') or {}
+    items_data = items.get('data') if isinstance(items, dict) else getattr(items, 'data', None)
+    if not items_data:
+        return None, None
+    first_item = items_data[0]
+    if not isinstance(first_item, dict):
+        return None, None
+    price = first_item.get('price')
+    price_id = price.get('id') if isinstance(price, dict) else price
+    return first_item.get('id'), price_id
+
+
+def update_subscription_from_stripe(subscription, subscription_obj):
+    """
+    Update subscription object from Stripe subscription data and save it.
+    Handles tier extraction, status updates, and period dates.
+    
+    Args:
+        subscription: Django Subscription model instance
+        subscription_obj: Stripe subscription object (dict or Stripe object)
+    """
+    apply_stripe_subscription(subscription, subscription_obj)
+    subscription.save()
+
+
+def apply_stripe_subscription(subscription, subscription_obj):
+    """
+    Copy Stripe subscription data onto a Subscription instance without saving.
+    Used directly by bulk reconciliation, which writes rows with bulk_update.
+    
+    Args:
+        subscription: Django Subscription model instance
+        subscription_obj: Stripe subscription object (dict or Stripe object)
+    """
+    # Convert to dict if it's a Stripe object
+    if hasattr(subscription_obj, 'to_dict'):
+        subscription_obj = subscription_obj.to_dict()
+    elif not isinstance(subscription_obj, dict):
+        # Try to access as object attributes
+        subscription_obj = {
+            'status': getattr(subscription_obj, 'status', None),
+            'current_period_start': getattr(subscription_obj, 'current_period_start', None),
+            'current_period_end': getattr(subscription_obj, 'current_period_end', None),
+            'items': getattr(subscription_obj, 'items', {}),
+            'metadata': getattr(subscription_obj, 'metadata', {}),
+        }
+    
+    # Cache the subscription item and price so plan changes can skip Subscription.retrieve
+    item_id, price_id = extract_item_from_subscription(subscription_obj)
+    if item_id:
+        subscription.stripe_item_id = item_id
+    if price_id:
+        subscription.stripe_price_id = price_id
+    if 'cancel_at_period_end' in subscription_obj:
+        subscription.cancel_at_period_end = bool(subscription_obj.get('cancel_at_period_end'))
+    
+    # Extract tier from price ID or metadata
+    # This will immediately reflect any tier changes (upgrades or downgrades) from Stripe
+    tier = extract_tier_from_subscription(subscription_obj)
+    if tier:
+        old_tier = subscription.tier
+        subscription.tier = tier
+        if old_tier != tier:
+            logger.info(
+                f"Subscription {subscription.stripe_subscription_id} tier changed from {old_tier} to {tier}"
+            )
+    elif subscription.tier in [Subscription.TIER_STARTER, Subscription.TIER_PRO]:
+        # If we couldn't extract tier but subscription is currently paid, log warning
+        logger.warning(
+            f"Could not extract tier from Stripe subscription {subscription.stripe_subscription_id}, "
+            f"keeping current tier: {subscription.tier}"
+        )
+    
+    # Update status (map Stripe 'canceled' to our 'cancelled')
+    status = subscription_obj.get('status')
+    if status:
+        # Stripe uses 'canceled' (one 'l') but we use 'cancelled' (two 'l's)
+        if status == 'canceled':
+            status = Subscription.STATUS_CANCELLED
+        subscription.status = status
+    
+    # Update period dates
+    if subscription_obj.get('current_period_start'):
+        period_start = subscription_obj['current_period_start']
+        if isinstance(period_start, (int, float)):
+            subscription.current_period_start = timezone.make_aware(
+                datetime.fromtimestamp(period_start)
+            )
+    if subscription_obj.get('current_period_end'):
+        period_end = subscription_obj['current_period_end']
+        if isinstance(period_end, (int, float)):
+            subscription.current_period_end = timezone.make_aware(
+                datetime.fromtimestamp(period_end)
+            )
+    
+    # Handle cancellation vs expiration
+    # Cancelled: Keep tier until period_end (user keeps access)
+    # Expired/unpaid: Revert to FREE immediately
+    # Use the mapped status for checks
+    mapped_status = subscription.status if subscription.status else status
+    
+    # Immediately downgrade to FREE for permanent payment failures
+    if mapped_status in [Subscription.STATUS_INCOMPLETE_EXPIRED, Subscription.STATUS_UNPAID]:
+        # Payment failed permanently - revert to FREE immediately
+        if subscription.tier != Subscription.TIER_FREE:
+            old_tier = subscription.tier
+            subscription.tier = Subscription.TIER_FREE
+            logger.info(
+                f"Subscription {subscription.stripe_subscription_id} expired/unpaid, "
+                f"immediately downgraded from {old_tier} to FREE tier"
+            )
+        else:
+            logger.debug(
+                f"Subscription {subscription.stripe_subscription_id} already FREE tier, "
+                f"status: {mapped_status}"
+            )
+    elif mapped_status == Subscription.STATUS_CANCELLED:
+        # Cancelled but may still have access until period_end
+        # Check if period has ended
+        if subscription.current_period_end and subscription.current_period_end < timezone.now():
+            # Period ended, revert to FREE immediately
+            if subscription.tier != Subscription.TIER_FREE:
+                old_tier = subscription.tier
+                subscription.tier = Subscription.TIER_FREE
+                logger.info(
+                    f"Subscription {subscription.stripe_subscription_id} cancelled and period ended, "
+                    f"immediately downgraded from {old_tier} to FREE tier"
+                )
+            else:
+                logger.debug(
+                    f"Subscription {subscription.stripe_subscription_id} already FREE tier, "
+                    f"cancelled and period ended"
+                )
+        else:
+            # Keep tier until period_end (user still has access)
+            logger.debug(
+                f"Subscription {subscription.stripe_subscription_id} cancelled, "
+                f"keeping tier {subscription.tier} until period_end {subscription.current_period_end}"
+            )
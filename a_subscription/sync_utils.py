@@ -0,0 +1,192 @@
+"""
+Bulk reconciliation of local Subscription rows against Stripe.
+
+Instead of one `stripe.Subscription.retrieve` per row, all subscriptions are
+read from a single auto-paginated `stripe.Subscription.list(status='all')`
+stream (100 per page, prices expanded). Local rows are joined against it in
+memory by subscription id, or by customer id for rows that never got a
+subscription id, and every changed row is written with one bulk_update.
+"""
+import logging
+
+import stripe
+from django.db import transaction
+from django.utils import timezone
+
+from . import stripe_gateway
+from .models import Subscription
+from .stripe_mapping import apply_stripe_subscription
+from .utils import clear_family_periods
+
+logger = logging.getLogger(__name__)
+
+
+# Stripe's maximum page size for list endpoints
+LIST_PAGE_SIZE = 100
+
+# Rows per UPDATE statement in bulk_update
+BULK_UPDATE_BATCH_SIZE = 500
+
+SYNC_FIELDS = [
+    'tier', 'status', 'stripe_subscription_id', 'current_period_start', 'current_period_end',
+    'stripe_price_id', 'stripe_item_id', 'cancel_at_period_end', 'updated_at',
+]
+
+# Stripe statuses that count as a live subscription for a customer
+ACTIVE_STRIPE_STATUSES = ('active', 'trialing')
+
+
+def _map_stripe_status_to_django(stripe_status):
+    """
+    Map Stripe subscription status to Django subscription status.
+    Stripe uses 'canceled' (one 'l') but Django uses 'cancelled' (two 'l's).
+    """
+    status_mapping = {
+        'active': Subscription.STATUS_ACTIVE,
+        'canceled': Subscription.STATUS_CANCELLED,  # Stripe uses 'canceled', we use 'cancelled'
+        'cancelled': Subscription.STATUS_CANCELLED,  # Handle both just in case
+        'past_due': Subscription.STATUS_PAST_DUE,
+        'incomplete': Subscription.STATUS_INCOMPLETE,
+        'incomplete_expired': Subscription.STATUS_INCOMPLETE_EXPIRED,
+        'trialing': Subscription.STATUS_TRIALING,
+        'unpaid': Subscription.STATUS_UNPAID,
+    }
+    return status_mapping.get(stripe_status, stripe_status)
+
+
+def iter_stripe_subscriptions(page_size=LIST_PAGE_SIZE):
+    """
+    Stream every Stripe subscription (any status) with prices expanded.
+    Pages are fetched lazily through the Stripe gateway, one HTTP call per page.
+    """
+    return stripe_gateway.iter_all(
+        stripe.Subscription.list,
+        page_size=page_size,
+        status='all',
+        expand=['data.items.data.price'],
+    )
+
+
+def _customer_id(stripe_subscription):
+    customer = stripe_subscription.get('customer')
+    if isinstance(customer, dict):
+        return customer.get('id')
+    return customer
+
+
+def _sync_state(subscription):
+    return (
+        subscription.tier,
+        subscription.status,
+        subscription.stripe_subscription_id,
+        subscription.current_period_start,
+        subscription.current_period_end,
+        subscription.stripe_price_id,
+        subscription.stripe_item_id,
+        subscription.cancel_at_period_end,
+    )
+
+
+def _downgrade(subscription, clear_subscription_id=False):
+    subscription.tier = Subscription.TIER_FREE
+    subscription.status = Subscription.STATUS_CANCELLED
+    if clear_subscription_id:
+        subscription.stripe_subscription_id = None
+
+
+def reconcile_subscriptions(subscriptions, stripe_subscriptions, dry_run=False):
+    """
+    Join local subscriptions with a Stripe subscription stream and save the differences.
+
+    Args:
+        subscriptions: iterable of local Subscription rows to check (paid tiers)
+        stripe_subscriptions: iterable of Stripe subscriptions (Stripe objects or dicts),
+            consumed once; only entries matching a local row are kept in memory
+        dry_run: compute the changes without writing them
+
+    Returns:
+        dict: {
+            'synced': rows matched to a Stripe subscription,
+            'downgraded': rows moved to FREE,
+            'errors': rows that could not be processed,
+            'changes': list of (subscription, old_tier, old_status) for changed rows,
+        }
+    """
+    local = list(subscriptions)
+    wanted_ids = {s.stripe_subscription_id for s in local if s.stripe_subscription_id}
+    wanted_customers = {
+        s.stripe_customer_id for s in local if not s.stripe_subscription_id and s.stripe_customer_id
+    }
+
+    by_id = {}
+    active_by_customer = {}
+    for stripe_subscription in stripe_subscriptions:
+        subscription_id = stripe_subscription.get('id')
+        if subscription_id in wanted_ids:
+            by_id[subscription_id] = stripe_subscription
+        customer_id = _customer_id(stripe_subscription)
+        if (
+            customer_id in wanted_customers
+            and customer_id not in active_by_customer
+            and stripe_subscription.get('status') in ACTIVE_STRIPE_STATUSES
+        ):
+            # Stripe lists newest first, so the first active one wins
+            active_by_customer[customer_id] = stripe_subscription
+
+    result = {'synced': 0, 'downgraded': 0, 'errors': 0, 'changes': []}
+    changed = []
+    for subscription in local:
+        old_state = _sync_state(subscription)
+        try:
+            if subscription.stripe_subscription_id:
+                stripe_subscription = by_id.get(subscription.stripe_subscription_id)
+                if stripe_subscription is None:
+                    logger.info(f"Subscription {subscription.id} not found in Stripe, downgrading to FREE")
+                    _downgrade(subscription, clear_subscription_id=True)
+            elif subscription.stripe_customer_id:
+                stripe_subscription = active_by_customer.get(subscription.stripe_customer_id)
+                if stripe_subscription is None:
+                    logger.info(
+                        f"No active Stripe subscription found for subscription {subscription.id}, "
+                        f"downgrading to FREE"
+                    )
+                    _downgrade(subscription)
+                else:
+                    subscription.stripe_subscription_id = stripe_subscription.get('id')
+            else:
+                stripe_subscription = None
+                logger.info(f"Subscription {subscription.id} has no Stripe IDs, downgrading to FREE")
+                _downgrade(subscription)
+
+            if stripe_subscription is not None:
+                apply_stripe_subscription(subscription, stripe_subscription)
+                subscription.status = _map_stripe_status_to_django(subscription.status)
+                result['synced'] += 1
+        except Exception as e:
+            logger.error(f"Error reconciling subscription {subscription.id}: {str(e)}", exc_info=True)
+            result['errors'] += 1
+            continue
+
+        if _sync_state(subscription) == old_state:
+            continue
+
+        if subscription.tier == Subscription.TIER_FREE and old_state[0] != Subscription.TIER_FREE:
+            result['downgraded'] += 1
+        if subscription.tier != old_state[0]:
+            logger.info(f"Subscription {subscription.id} tier changed from {old_state[0]} to {subscription.tier}")
+        if subscription.status != old_state[1]:
+            logger.info(
+                f"Subscription {subscription.id} status changed from {old_state[1]} to {subscription.status}"
+            )
+        subscription.updated_at = timezone.now()
+        changed.append(subscription)
+        result['changes'].append((subscription, old_state[0], old_state[1]))
+
+    if changed and not dry_run:
+        with transaction.atomic():
+            Subscription.objects.bulk_update(changed, SYNC_FIELDS, batch_size=BULK_UPDATE_BATCH_SIZE)
+            # bulk_update sends no post_save, so reset the owners' stored usage periods here
+            clear_family_periods({subscription.owner_id for subscription in changed})
+        logger.info(f"Subscription sync wrote {len(changed)} changed row(s)")
+
+    return result
@@ -1,9 +1,16 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from unittest import mock
+
+import stripe
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 from a_family.models import Family, User
-from .models import Subscription, SubscriptionUsage
+from .models import StripeCustomer, StripeEventInbox, Subscription, SubscriptionUsage
 from .utils import (
     get_user_subscription,
     get_family_subscription,
@@ -13,7 +20,17 @@ from .utils import (
     increment_usage,
     get_current_period_start,
     get_current_month_usage,
+    get_member_counts,
+    can_add_member,
+    roll_family_periods,
+    reserve_quota,
 )
+from . import stripe_gateway
+from .customer_utils import get_or_create_customer_id
+from .events import process_inbox
+from .fake_stripe import FakeStripeServer
+from .sync_utils import reconcile_subscriptions
+from .stripe_mapping import update_subscription_from_stripe
 
 
 class SubscriptionModelTest(TestCase):
@@ -218,3 +235,692 @@ class SubscriptionUtilsTest(TestCase):
         self.assertEqual(usage.period_start, period_start)
         self.assertEqual(usage.tasks_created, 0)
         self.assertEqual(usage.rewards_created, 0)
+
+
+class SubscriptionSyncTest(TestCase):
+    """Test bulk reconciliation of local subscriptions against a Stripe subscription list"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.users = [
+            User.objects.create_user(
+                username=f'parent{i}',
+                email=f'parent{i}@test.com',
+                password='testpass123',
+                role=User.ROLE_PARENT
+            )
+            for i in range(4)
+        ]
+        self.period_end = int((timezone.now() + timedelta(days=20)).timestamp())
+
+    def _stripe_sub(self, sub_id, customer, status='active', tier=Subscription.TIER_PRO):
+        return {
+            'id': sub_id,
+            'customer': customer,
+            'status': status,
+            'current_period_start': self.period_end - 30 * 86400,
+            'current_period_end': self.period_end,
+            'items': {'data': []},
+            'metadata': {'tier': tier},
+        }
+
+    def test_reconcile_joins_by_id_and_customer(self):
+        """Rows are matched by subscription id, or by customer id when the id is missing"""
+        by_id = Subscription.objects.create(
+            owner=self.users[0], tier=Subscription.TIER_STARTER, stripe_subscription_id='sub_1', stripe_customer_id='cus_1'
+        )
+        by_customer = Subscription.objects.create(
+            owner=self.users[1], tier=Subscription.TIER_STARTER, stripe_customer_id='cus_2'
+        )
+        missing = Subscription.objects.create(
+            owner=self.users[2], tier=Subscription.TIER_PRO, stripe_subscription_id='sub_gone'
+        )
+        unpaid = Subscription.objects.create(
+            owner=self.users[3], tier=Subscription.TIER_PRO, stripe_subscription_id='sub_4'
+        )
+        stream = [
+            self._stripe_sub('sub_1', 'cus_1', tier=Subscription.TIER_PRO),
+            self._stripe_sub('sub_2_old', 'cus_2', status='canceled'),
+            self._stripe_sub('sub_2', 'cus_2', tier=Subscription.TIER_STARTER),
+            self._stripe_sub('sub_4', 'cus_4', status='unpaid'),
+            self._stripe_sub('sub_other', 'cus_other'),
+        ]
+
+        result = reconcile_subscriptions(Subscription.objects.all(), stream)
+
+        by_id.refresh_from_db()
+        by_customer.refresh_from_db()
+        missing.refresh_from_db()
+        unpaid.refresh_from_db()
+        self.assertEqual(by_id.tier, Subscription.TIER_PRO)
+        self.assertIsNotNone(by_id.current_period_end)
+        self.assertEqual(by_customer.stripe_subscription_id, 'sub_2')
+        self.assertEqual(by_customer.status, Subscription.STATUS_ACTIVE)
+        self.assertEqual(missing.tier, Subscription.TIER_FREE)
+        self.assertIsNone(missing.stripe_subscription_id)
+        self.assertEqual(unpaid.tier, Subscription.TIER_FREE)
+        self.assertEqual(unpaid.status, Subscription.STATUS_UNPAID)
+        self.assertEqual(result['synced'], 3)
+        self.assertEqual(result['downgraded'], 2)
+
+    def test_reconcile_dry_run_writes_nothing(self):
+        """Dry run reports changes without saving them"""
+        subscription = Subscription.objects.create(
+            owner=self.users[0], tier=Subscription.TIER_PRO, stripe_subscription_id='sub_gone'
+        )
+
+        result = reconcile_subscriptions(Subscription.objects.all(), [], dry_run=True)
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.tier, Subscription.TIER_PRO)
+        self.assertEqual(len(result['changes']), 1)
+
+    @override_settings(STRIPE_SECRET_KEY='sk_test_local', STRIPE_MAX_NETWORK_RETRIES=0)
+    def test_command_pages_through_fake_stripe(self):
+        """The command lists subscriptions page by page and never retrieves them one by one"""
+        for i in range(3):
+            Subscription.objects.create(
+                owner=self.users[i], tier=Subscription.TIER_STARTER, stripe_subscription_id=f'sub_{i}'
+            )
+        extra = [self._stripe_sub(f'sub_x{i}', f'cus_x{i}') for i in range(150)]
+        stripe_gateway.reset()
+        with FakeStripeServer(subscriptions=[self._stripe_sub(f'sub_{i}', f'cus_{i}') for i in range(3)] + extra) as server:
+            with override_settings(STRIPE_API_BASE=server.url):
+                call_command('sync_subscriptions', stdout=StringIO())
+        stripe_gateway.reset()
+
+        self.assertEqual(server.requests, [('GET', '/v1/subscriptions'), ('GET', '/v1/subscriptions')])
+        self.assertEqual(Subscription.objects.filter(tier=Subscription.TIER_PRO).count(), 3)
+
+
+@override_settings(STRIPE_SECRET_KEY='sk_test_local', STRIPE_MAX_NETWORK_RETRIES=0,
+                   STRIPE_BREAKER_THRESHOLD=2, STRIPE_BREAKER_RESET_SECONDS=60)
+class StripeGatewayTest(TestCase):
+    """Test the shared Stripe gateway against the local fake Stripe server"""
+
+    def setUp(self):
+        """Start a fake Stripe server with a few customers"""
+        stripe_gateway.reset()
+        self.server = FakeStripeServer(
+            customers=[{'id': f'cus_{i}', 'email': f'parent{i}@test.com'} for i in range(5)]
+        ).start()
+        self.settings_override = override_settings(STRIPE_API_BASE=self.server.url)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.stop()
+        stripe_gateway.reset()
+
+    def test_calls_reuse_one_connection(self):
+        """Sequential calls go over a single keep-alive connection"""
+        for i in range(5):
+            customer = stripe_gateway.call(stripe.Customer.retrieve, f'cus_{i}')
+            self.assertEqual(customer.email, f'parent{i}@test.com')
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_circuit_breaker_fails_fast(self):
+        """After repeated server errors the breaker opens and Stripe is not contacted"""
+        self.server.fail_next(2, status=500)
+        for _ in range(2):
+            with self.assertRaises(stripe.APIError):
+                stripe_gateway.call(stripe.Customer.retrieve, 'cus_0')
+
+        with self.assertRaises(stripe_gateway.StripeUnavailable):
+            stripe_gateway.call(stripe.Customer.retrieve, 'cus_0')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(stripe_gateway.get_breaker().state, stripe_gateway.CircuitBreaker.STATE_OPEN)
+
+    def test_invalid_requests_do_not_open_breaker(self):
+        """Errors about the request itself (404) do not count as Stripe outages"""
+        for _ in range(3):
+            with self.assertRaises(stripe.InvalidRequestError):
+                stripe_gateway.call(stripe.Customer.retrieve, 'cus_missing')
+        self.assertEqual(stripe_gateway.get_breaker().state, stripe_gateway.CircuitBreaker.STATE_CLOSED)
+
+    def test_retrieve_many(self):
+        """Bulk retrieves fan out over the thread pool and report missing objects"""
+        found, errors = stripe_gateway.retrieve_many(stripe.Customer.retrieve, ['cus_1', 'cus_3', 'cus_missing'])
+
+        self.assertEqual(set(found), {'cus_1', 'cus_3'})
+        self.assertEqual(set(errors), {'cus_missing'})
+
+    def test_per_call_timeout(self):
+        """A per-call timeout shorter than the server latency raises a connection error"""
+        self.server.latency = 0.5
+        with self.assertRaises(stripe.APIConnectionError):
+            stripe_gateway.call(stripe.Customer.retrieve, 'cus_0', timeout=0.1)
+
+
+@override_settings(STRIPE_SECRET_KEY='sk_test_local', STRIPE_WEBHOOK_SECRET=None)
+class StripeEventInboxTest(TestCase):
+    """Test webhook ingestion into the event inbox and the inbox worker"""
+
+    def setUp(self):
+        """Set up a paid subscription"""
+        self.user = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.subscription = Subscription.objects.create(
+            owner=self.user,
+            tier=Subscription.TIER_STARTER,
+            stripe_subscription_id='sub_1',
+            stripe_customer_id='cus_1',
+        )
+        self.created = int(timezone.now().timestamp())
+
+    def _event(self, event_id, event_type, offset=0, **obj):
+        data_object = {'id': 'sub_1', 'object': 'subscription', 'customer': 'cus_1', 'status': 'active'}
+        data_object.update(obj)
+        return {
+            'id': event_id,
+            'type': event_type,
+            'created': self.created + offset,
+            'data': {'object': data_object},
+        }
+
+    def _post(self, event):
+        return self.client.post(
+            reverse('a_subscription:webhook'), data=json.dumps(event), content_type='application/json'
+        )
+
+    def test_webhook_only_stores_event(self):
+        """The webhook stores the event once and leaves processing to the worker"""
+        event = self._event('evt_1', 'customer.subscription.updated', metadata={'tier': Subscription.TIER_PRO})
+
+        self.assertEqual(self._post(event).status_code, 200)
+        self.assertEqual(self._post(event).status_code, 200)
+
+        self.assertEqual(StripeEventInbox.objects.count(), 1)
+        inbox = StripeEventInbox.objects.get()
+        self.assertEqual(inbox.status, StripeEventInbox.STATUS_PENDING)
+        self.assertEqual(inbox.customer_id, 'cus_1')
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.tier, Subscription.TIER_STARTER)
+
+    def test_worker_coalesces_subscription_events(self):
+        """Only the newest pending snapshot of a subscription is applied"""
+        self._post(self._event('evt_1', 'customer.subscription.updated', 0, metadata={'tier': Subscription.TIER_PRO}))
+        self._post(self._event('evt_2', 'customer.subscription.updated', 5, metadata={'tier': Subscription.TIER_STARTER}))
+        self._post(self._event('evt_3', 'customer.subscription.updated', 10, metadata={'tier': Subscription.TIER_PRO}))
+
+        stats = process_inbox()
+
+        self.assertEqual(stats['processed'], 1)
+        self.assertEqual(stats['coalesced'], 2)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.tier, Subscription.TIER_PRO)
+        self.assertEqual(
+            StripeEventInbox.objects.get(event_id='evt_3').status, StripeEventInbox.STATUS_PROCESSED
+        )
+
+    def test_failure_defers_later_events_of_customer(self):
+        """If an event fails, later events of the same customer wait so order is kept"""
+        self._post(self._event('evt_1', 'customer.subscription.updated', 0, metadata={'tier': Subscription.TIER_PRO}))
+        self._post({
+            'id': 'evt_2',
+            'type': 'customer.subscription.deleted',
+            'created': self.created + 5,
+            'data': {'object': {'id': 'sub_other', 'object': 'subscription', 'customer': 'cus_1'}},
+        })
+
+        with mock.patch('a_subscription.events.handle_event', side_effect=RuntimeError('boom')) as handler:
+            stats = process_inbox()
+
+        handler.assert_called_once()
+        self.assertEqual(stats['deferred'], 2)
+        first = StripeEventInbox.objects.get(event_id='evt_1')
+        self.assertEqual(first.status, StripeEventInbox.STATUS_PENDING)
+        self.assertEqual(first.attempts, 1)
+        self.assertEqual(StripeEventInbox.objects.get(event_id='evt_2').attempts, 0)
+
+        # The failed event backs off, and the customer's later event waits for it
+        stats = process_inbox()
+        self.assertEqual(stats['processed'], 0)
+        self.assertEqual(StripeEventInbox.objects.get(event_id='evt_2').status, StripeEventInbox.STATUS_PENDING)
+
+        StripeEventInbox.objects.update(next_attempt_at=None)
+        stats = process_inbox()
+        self.assertEqual(stats['processed'], 2)
+
+    def test_handler_error_is_retried_then_failed(self):
+        """An error inside a handler is recorded and retried until MAX_ATTEMPTS"""
+        from django.db import DatabaseError
+        from a_subscription.events import MAX_ATTEMPTS
+
+        self._post(self._event('evt_1', 'customer.subscription.updated', 0, metadata={'tier': Subscription.TIER_PRO}))
+
+        with mock.patch('a_subscription.events.update_subscription_from_stripe', side_effect=DatabaseError('db down')):
+            process_inbox()
+            inbox = StripeEventInbox.objects.get()
+            self.assertEqual(inbox.status, StripeEventInbox.STATUS_PENDING)
+            self.assertEqual(inbox.attempts, 1)
+            self.assertIn('db down', inbox.last_error)
+            self.assertIsNotNone(inbox.next_attempt_at)
+
+            for _ in range(MAX_ATTEMPTS - 1):
+                StripeEventInbox.objects.update(next_attempt_at=None)
+                process_inbox()
+
+        inbox.refresh_from_db()
+        self.assertEqual(inbox.status, StripeEventInbox.STATUS_FAILED)
+        self.assertEqual(inbox.attempts, MAX_ATTEMPTS)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.tier, Subscription.TIER_STARTER)
+
+    def test_claim_is_won_once(self):
+        """A second claim of the same events gets nothing"""
+        from a_subscription.events import _claim
+
+        self._post(self._event('evt_1', 'customer.subscription.updated', 0, metadata={'tier': Subscription.TIER_PRO}))
+        event_ids = list(StripeEventInbox.objects.values_list('id', flat=True))
+        self.assertEqual(_claim(event_ids), set(event_ids))
+        self.assertEqual(_claim(event_ids), set())
+
+    def test_customer_deleted_event_removes_mapping(self):
+        """A customer.deleted webhook removes the local customer mapping"""
+        StripeCustomer.objects.create(user=self.user, customer_id='cus_1', email='parent@test.com')
+        self._post({
+            'id': 'evt_del',
+            'type': 'customer.deleted',
+            'created': self.created,
+            'data': {'object': {'id': 'cus_1', 'object': 'customer'}},
+        })
+
+        process_inbox()
+
+        self.assertFalse(StripeCustomer.objects.filter(user=self.user).exists())
+        self.subscription.refresh_from_db()
+        self.assertIsNone(self.subscription.stripe_customer_id)
+
+
+@override_settings(STRIPE_SECRET_KEY='sk_test_local', STRIPE_MAX_NETWORK_RETRIES=0)
+class StripeCustomerMappingTest(TestCase):
+    """Test the cached user -> Stripe customer mapping"""
+
+    def setUp(self):
+        """Set up a parent with a family and a fake Stripe server"""
+        self.user = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.user)
+        stripe_gateway.reset()
+        self.server = FakeStripeServer(customers=[{'id': 'cus_existing', 'email': 'parent@test.com'}]).start()
+        self.settings_override = override_settings(STRIPE_API_BASE=self.server.url)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.stop()
+        stripe_gateway.reset()
+
+    def test_lookup_by_email_happens_once(self):
+        """The first checkout finds the customer by email, later ones use the stored mapping"""
+        self.assertEqual(get_or_create_customer_id(self.user, self.family), 'cus_existing')
+        self.assertEqual(get_or_create_customer_id(self.user, self.family), 'cus_existing')
+
+        self.assertEqual(self.server.requests, [('GET', '/v1/customers')])
+        self.assertEqual(StripeCustomer.objects.get(user=self.user).customer_id, 'cus_existing')
+
+    def test_subscription_customer_id_needs_no_stripe_call(self):
+        """Accounts with a customer id on their subscription are mapped without contacting Stripe"""
+        Subscription.objects.create(owner=self.user, tier=Subscription.TIER_PRO, stripe_customer_id='cus_sub')
+
+        self.assertEqual(get_or_create_customer_id(self.user, self.family), 'cus_sub')
+        self.assertEqual(self.server.requests, [])
+
+    def test_snapshot_caches_price_and_item(self):
+        """Applying Stripe data caches the subscription item, price and cancellation flag"""
+        subscription = Subscription.objects.create(owner=self.user, tier=Subscription.TIER_PRO, stripe_subscription_id='sub_1')
+
+        update_subscription_from_stripe(subscription, {
+            'id': 'sub_1',
+            'status': 'active',
+            'cancel_at_period_end': True,
+            'items': {'data': [{'id': 'si_1', 'price': {'id': 'price_pro'}}]},
+            'metadata': {'tier': Subscription.TIER_PRO},
+        })
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.stripe_item_id, 'si_1')
+        self.assertEqual(subscription.stripe_price_id, 'price_pro')
+        self.assertTrue(subscription.cancel_at_period_end)
+
+
+class RecurrenceCounterTest(TestCase):
+    """Test the per-family active recurring task counter"""
+
+    def setUp(self):
+        """Set up a parent with a family"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+
+    def _create_recurring_task(self, name='Task'):
+        from a_tasks.models import Task, TaskRecurrence
+        task = Task.objects.create(name=name, family=self.family, created_by=self.parent)
+        TaskRecurrence.objects.create(
+            task=task,
+            frequency=TaskRecurrence.FREQUENCY_DAILY,
+            next_occurrence=timezone.now() + timedelta(days=1)
+        )
+        return task
+
+    def test_counter_follows_create_and_delete(self):
+        """Creating a recurrence and deleting its task (cascade) keep the counter in step"""
+        task = self._create_recurring_task('Task 1')
+        self._create_recurring_task('Task 2')
+        self.family.refresh_from_db()
+        self.assertEqual(self.family.active_recurrences, 2)
+
+        task.delete()
+        self.family.refresh_from_db()
+        self.assertEqual(self.family.active_recurrences, 1)
+
+    def test_limit_check_reads_counter(self):
+        """The limit check uses the counter instead of counting recurrences"""
+        Family.objects.filter(pk=self.family.pk).update(active_recurrences=3)
+        can_create, current, limit, tier = check_recurring_task_limit(self.family)
+        self.assertFalse(can_create)
+        self.assertEqual(current, 3)
+        self.assertFalse(SubscriptionUsage.objects.filter(family=self.family).exists())
+
+    def test_bulk_create_updates_counter(self):
+        """Recurrences created through bulk_create are counted"""
+        from a_tasks.bulk_utils import bulk_create_tasks
+        result = bulk_create_tasks(self.family, self.parent, ['Prügi välja *daily', 'Tolmuimeja'])
+        self.assertIsNone(result['limit_error'])
+        self.assertEqual(len(result['created']), 2)
+        self.family.refresh_from_db()
+        self.assertEqual(self.family.active_recurrences, 1)
+
+    def test_limits_api(self):
+        """The limits endpoint reports active recurring tasks"""
+        self._create_recurring_task()
+        self.client.force_login(self.parent)
+        response = self.client.get(reverse('a_api:limits'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['tier'], Subscription.TIER_FREE)
+        self.assertEqual(data['recurring_tasks'], {'active': 1, 'limit': 3, 'can_create': True})
+
+
+class MemberCountTest(TestCase):
+    """Test the set-based member quota check"""
+
+    def setUp(self):
+        """Set up a family whose owner is also listed in members"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.parent)
+
+    def test_counts_in_one_query(self):
+        """Parents and children are counted together and the owner only once"""
+        child = User.objects.create_user(username='child', password='testpass123', role=User.ROLE_CHILD)
+        self.family.members.add(child)
+        with self.assertNumQueries(1):
+            counts = get_member_counts(self.family)
+        self.assertEqual(counts, {'parents': 1, 'children': 1})
+
+    def test_can_add_member_uses_counts(self):
+        """The FREE tier allows one child"""
+        can_add, current, limit, tier = can_add_member(self.family, User.ROLE_CHILD)
+        self.assertTrue(can_add)
+        self.assertEqual((current, limit), (0, 1))
+
+        child = User.objects.create_user(username='child', password='testpass123', role=User.ROLE_CHILD)
+        self.family.members.add(child)
+        can_add, current, limit, tier = can_add_member(self.family, User.ROLE_CHILD)
+        self.assertFalse(can_add)
+        self.assertEqual(current, 1)
+
+    def test_api_join_respects_limit(self):
+        """Joining through the API is refused once the limit is reached"""
+        first = User.objects.create_user(username='child1', password='testpass123', role=User.ROLE_CHILD)
+        second = User.objects.create_user(username='child2', password='testpass123', role=User.ROLE_CHILD)
+        url = reverse('a_api:join_family')
+
+        self.client.force_login(first)
+        response = self.client.post(url, json.dumps({'join_code': self.family.join_code}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_login(second)
+        response = self.client.post(url, json.dumps({'join_code': self.family.join_code}), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.family.members.filter(pk=second.pk).exists())
+
+
+class FamilyPeriodTest(TestCase):
+    """Test the usage period boundaries stored on the family"""
+
+    def setUp(self):
+        """Set up a FREE family created 61 days ago"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.created = (timezone.now() - timedelta(days=61)).replace(second=0, microsecond=0)
+        Family.objects.filter(pk=self.family.pk).update(created_at=self.created)
+        self.family.refresh_from_db()
+
+    def test_free_period_is_stored(self):
+        """The FREE period is whole 30-day steps from creation and is read from the family afterwards"""
+        period_start = get_current_period_start(self.family)
+        self.assertEqual(period_start, self.created + timedelta(days=60))
+
+        self.family.refresh_from_db()
+        self.assertEqual(self.family.current_period_end, self.created + timedelta(days=90))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_current_period_start(self.family), period_start)
+
+    def test_limit_check_does_not_create_usage(self):
+        """Checking a limit reads the usage row but never creates it"""
+        can_create, current, limit, tier = check_subscription_limit(self.family, 'tasks', 1)
+        self.assertTrue(can_create)
+        self.assertEqual(current, 0)
+        self.assertFalse(SubscriptionUsage.objects.filter(family=self.family).exists())
+
+        increment_usage(self.family, 'tasks', 2)
+        can_create, current, limit, tier = check_subscription_limit(self.family, 'tasks', 1)
+        self.assertEqual(current, 2)
+
+    def test_subscription_change_resets_period(self):
+        """Saving the owner's subscription clears the stored period"""
+        get_current_period_start(self.family)
+        period_start = timezone.now() - timedelta(days=3)
+        Subscription.objects.create(
+            owner=self.parent,
+            tier=Subscription.TIER_PRO,
+            status=Subscription.STATUS_ACTIVE,
+            current_period_start=period_start,
+            current_period_end=period_start + timedelta(days=30),
+        )
+        family = Family.objects.get(pk=self.family.pk)
+        self.assertIsNone(family.current_period_start)
+        self.assertEqual(get_current_period_start(family), period_start.replace(second=0, microsecond=0))
+
+    def test_roll_family_periods(self):
+        """Maintenance moves ended periods forward"""
+        Family.objects.filter(pk=self.family.pk).update(
+            current_period_start=self.created,
+            current_period_end=self.created + timedelta(days=30),
+        )
+        self.assertEqual(roll_family_periods(), 1)
+        self.family.refresh_from_db()
+        self.assertEqual(self.family.current_period_start, self.created + timedelta(days=60))
+        self.assertEqual(roll_family_periods(), 0)
+
+    def test_stale_stripe_period_is_rolled_monthly(self):
+        """An ended Stripe period is rolled by calendar month and stored once"""
+        stripe_start = datetime(2026, 1, 31, 12, 0, tzinfo=dt_timezone.utc)
+        Subscription.objects.create(
+            owner=self.parent,
+            tier=Subscription.TIER_PRO,
+            status=Subscription.STATUS_ACTIVE,
+            current_period_start=stripe_start,
+            current_period_end=datetime(2026, 2, 28, 12, 0, tzinfo=dt_timezone.utc),
+        )
+        family = Family.objects.get(pk=self.family.pk)
+        now = datetime(2026, 4, 15, 8, 0, tzinfo=dt_timezone.utc)
+
+        with mock.patch('a_subscription.utils.timezone.now', return_value=now):
+            self.assertEqual(get_current_period_start(family), datetime(2026, 3, 31, 12, 0, tzinfo=dt_timezone.utc))
+            self.assertEqual(family.current_period_end, datetime(2026, 4, 30, 12, 0, tzinfo=dt_timezone.utc))
+            with self.assertNumQueries(0):
+                get_current_period_start(family)
+
+
+class CleanupDuplicateUsageTest(TestCase):
+    """Test the set-based SubscriptionUsage duplicate merge"""
+
+    def setUp(self):
+        """Set up a family with near-duplicate usage rows"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.period = timezone.now().replace(second=0, microsecond=0) - timedelta(days=1)
+
+    def test_duplicates_merged(self):
+        """Rows in the same minute are merged into one with the highest counters"""
+        SubscriptionUsage.objects.create(family=self.family, period_start=self.period + timedelta(seconds=10),
+                                         tasks_created=5, rewards_created=1)
+        SubscriptionUsage.objects.create(family=self.family, period_start=self.period,
+                                         tasks_created=3, rewards_created=4, recurring_tasks_created=2)
+        SubscriptionUsage.objects.create(family=self.family, period_start=self.period - timedelta(days=30))
+
+        out = StringIO()
+        call_command('cleanup_duplicate_usage', '--dry-run', stdout=out)
+        self.assertIn('Would merge 1 duplicate group(s) and delete 1', out.getvalue())
+        self.assertEqual(SubscriptionUsage.objects.count(), 3)
+
+        call_command('cleanup_duplicate_usage', '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual(SubscriptionUsage.objects.count(), 2)
+        merged = SubscriptionUsage.objects.get(family=self.family, period_start=self.period)
+        self.assertEqual(
+            (merged.tasks_created, merged.rewards_created, merged.recurring_tasks_created),
+            (5, 4, 2)
+        )
+
+
+class QuotaReservationTest(TestCase):
+    """Test atomic quota reservation"""
+
+    def setUp(self):
+        """Set up a FREE family (30 tasks per period)"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+
+    def _tasks_used(self):
+        usage = SubscriptionUsage.objects.filter(family=self.family).first()
+        return usage.tasks_created if usage else 0
+
+    def test_reserve_and_refuse(self):
+        """Reservations are granted until the limit, then refused without changing usage"""
+        granted, current, limit, tier = reserve_quota(self.family, 'tasks', 28)
+        self.assertEqual((granted, limit), (28, 30))
+
+        granted, current, limit, tier = reserve_quota(self.family, 'tasks', 5)
+        self.assertEqual(granted, 0)
+        self.assertEqual(current, 28)
+        self.assertEqual(self._tasks_used(), 28)
+
+    def test_partial_grant(self):
+        """With partial=True the remaining quota is granted"""
+        reserve_quota(self.family, 'tasks', 28)
+        granted, current, limit, tier = reserve_quota(self.family, 'tasks', 5, partial=True)
+        self.assertEqual(granted, 2)
+        self.assertEqual(self._tasks_used(), 30)
+
+        granted, current, limit, tier = reserve_quota(self.family, 'tasks', 1, partial=True)
+        self.assertEqual(granted, 0)
+
+    def test_rollback_releases_reservation(self):
+        """A reservation made in a rolled back transaction is released"""
+        from django.db import transaction
+        reserve_quota(self.family, 'tasks', 1)
+        with transaction.atomic():
+            reserve_quota(self.family, 'tasks', 10)
+            transaction.set_rollback(True)
+        self.assertEqual(self._tasks_used(), 1)
+
+    def test_api_create_task_reserves_quota(self):
+        """The API refuses task creation once the quota is used up"""
+        reserve_quota(self.family, 'tasks', 30)
+        self.client.force_login(self.parent)
+        response = self.client.post(
+            reverse('a_api:create_task'), json.dumps({'name': 'Prügi'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response.json()['limit_reached'])
+
+
+class UsageRetentionTest(TestCase):
+    """Test SubscriptionUsage compaction and inactive family handling"""
+
+    def setUp(self):
+        """Set up a family with old usage periods"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+
+    def test_old_periods_rolled_into_yearly_totals(self):
+        """Old periods are summed per year and deleted, recent ones are kept"""
+        from .models import SubscriptionUsageYearly
+        from .retention_utils import compact_subscription_usage
+
+        now = timezone.now().replace(second=0, microsecond=0)
+        old = now.replace(year=now.year - 3, month=6, day=1)
+        for i in range(3):
+            SubscriptionUsage.objects.create(
+                family=self.family, period_start=old + timedelta(days=30 * i), tasks_created=10, rewards_created=1
+            )
+        SubscriptionUsage.objects.create(family=self.family, period_start=now - timedelta(days=5), tasks_created=7)
+
+        compacted = compact_subscription_usage(retention_days=400, batch_size=2, sleep_seconds=0)
+
+        self.assertEqual(compacted, 3)
+        self.assertEqual(SubscriptionUsage.objects.count(), 1)
+        yearly = SubscriptionUsageYearly.objects.get(family=self.family)
+        self.assertEqual((yearly.year, yearly.periods, yearly.tasks_created, yearly.rewards_created),
+                         (old.year, 3, 30, 3))
+
+    def test_maintenance_skips_inactive_family(self):
+        """Maintenance increments don't start a usage row for a family nobody used this period"""
+        increment_usage(self.family, 'tasks', 1, only_if_active=True)
+        self.assertFalse(SubscriptionUsage.objects.exists())
+
+        User.objects.filter(pk=self.parent.pk).update(last_login=timezone.now())
+        increment_usage(self.family, 'tasks', 1, only_if_active=True)
+        self.assertEqual(SubscriptionUsage.objects.get().tasks_created, 1)
@@ -1,5 +1,9 @@
+import calendar
+
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
 
 User = get_user_model()
 from django.utils import timezone
@@ -8,6 +12,21 @@ from django.conf import settings
 from .models import Subscription, SubscriptionUsage
 
 
+# Length of a FREE tier usage period
+FREE_PERIOD_LENGTH = timedelta(days=30)
+
+# Families per bulk_update when maintenance rolls periods forward
+PERIOD_ROLL_BATCH_SIZE = 500
+
+# Conditional UPDATE attempts in reserve_quota (retries only when usage moved concurrently)
+RESERVE_ATTEMPTS = 3
+
+# SubscriptionUsage counter per resource type
+USAGE_FIELDS = {
+    'tasks': 'tasks_created',
+    'rewards': 'rewards_created',
+}
+
 # Tier limits
 TIER_LIMITS = {
     Subscription.TIER_FREE: {
@@ -70,61 +89,180 @@ def get_tier_limits(tier):
     return TIER_LIMITS.get(tier, TIER_LIMITS[Subscription.TIER_FREE])
 
 
+def _get_paid_subscription(owner_id):
+    """The owner's STARTER/PRO subscription row, if any."""
+    return Subscription.objects.filter(
+        owner_id=owner_id,
+        tier__in=[Subscription.TIER_STARTER, Subscription.TIER_PRO]
+    ).first()
+
+
+def _add_months(value, months):
+    """Shift a datetime by whole calendar months, clamping the day to the month's length."""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def compute_period_bounds(family, subscription=None, now=None):
+    """
+    Calculate the start and end of a family's current subscription period.
+    For active paid subscriptions, uses the Stripe period; if that period has
+    already ended (webhook or sync not processed yet), it is rolled forward by
+    calendar months like Stripe's monthly billing, so the stored period still
+    covers now and is not recalculated on every request.
+    For FREE tier, counts whole 30-day periods from the family creation date
+    (integer timedelta division, no float rounding).
+    Both ends are truncated to the minute so they match stored usage rows.
+    
+    Args:
+        family: Family instance
+        subscription: the owner's paid Subscription or None
+        now: current time (defaults to timezone.now())
+    
+    Returns:
+        tuple: (period_start, period_end)
+    """
+    now = (now or timezone.now()).replace(second=0, microsecond=0)
+
+    if subscription and subscription.is_active() and subscription.current_period_start:
+        # Paid subscription - use the subscription period
+        period_start = subscription.current_period_start.replace(second=0, microsecond=0)
+        period_end = subscription.current_period_end
+        if period_end:
+            period_end = period_end.replace(second=0, microsecond=0)
+        if not period_end or period_end <= period_start:
+            period_end = period_start + FREE_PERIOD_LENGTH
+        if period_end <= now:
+            months = max((now.year - period_start.year) * 12 + now.month - period_start.month, 0)
+            if _add_months(period_start, months) > now:
+                months -= 1
+            period_start, period_end = _add_months(period_start, months), _add_months(period_start, months + 1)
+        return period_start, period_end
+
+    # FREE tier - 30-day periods counted from family creation
+    family_created = family.created_at or now
+    family_created = family_created.replace(second=0, microsecond=0)
+    periods_passed = max((now - family_created) // FREE_PERIOD_LENGTH, 0)
+    period_start = family_created + periods_passed * FREE_PERIOD_LENGTH
+    return period_start, period_start + FREE_PERIOD_LENGTH
+
+
+def refresh_family_period(family, now=None):
+    """
+    Recalculate and store the family's current period boundaries.
+    
+    Returns:
+        datetime: The start of the current subscription period
+    """
+    from a_family.models import Family
+
+    period_start, period_end = compute_period_bounds(family, _get_paid_subscription(family.owner_id), now)
+    Family.objects.filter(pk=family.pk).update(
+        current_period_start=period_start,
+        current_period_end=period_end,
+    )
+    family.current_period_start = period_start
+    family.current_period_end = period_end
+    return period_start
+
+
 def get_current_period_start(family):
     """
     Get the start date of the current subscription period for a family.
-    For paid subscriptions, uses current_period_start.
-    For FREE tier, uses family creation date and calculates 30-day periods from there.
+    Uses the boundaries stored on the family (see roll_family_periods), so the
+    common case needs no query; they are recalculated only once the stored
+    period has ended or was cleared by a subscription change.
     
     Returns:
         datetime: The start of the current subscription period
     """
     if not family:
         return None
+
+    now = timezone.now()
+    if (
+        family.current_period_start and family.current_period_end
+        and family.current_period_start <= now < family.current_period_end
+    ):
+        return family.current_period_start
+    return refresh_family_period(family, now)
+
+
+def clear_family_periods(owner_ids):
+    """
+    Forget stored period boundaries for the families of these owners.
+    Called when a subscription changes; the next lookup recalculates them.
+    """
+    from a_family.models import Family
+    Family.objects.filter(owner_id__in=owner_ids).update(current_period_start=None, current_period_end=None)
+
+
+def roll_family_periods(now=None, batch_size=PERIOD_ROLL_BATCH_SIZE):
+    """
+    Move every family whose stored period has ended (or was never set) to its current period.
+    Run by daily maintenance after the subscription sync.
     
-    # Get the family's subscription
-    subscription = Subscription.objects.filter(
-        owner=family.owner,
+    Returns:
+        int: Number of families updated
+    """
+    from a_family.models import Family
+
+    now = now or timezone.now()
+    stale = Family.objects.filter(
+        Q(current_period_end__isnull=True) | Q(current_period_end__lte=now)
+    ).only('id', 'owner_id', 'created_at', 'current_period_start', 'current_period_end').order_by('pk')
+
+    updated = 0
+    batch = []
+    for family in stale.iterator(chunk_size=batch_size):
+        batch.append(family)
+        if len(batch) >= batch_size:
+            updated += _roll_batch(batch, now)
+            batch = []
+    if batch:
+        updated += _roll_batch(batch, now)
+    return updated
+
+
+def _roll_batch(families, now):
+    from a_family.models import Family
+
+    owner_ids = {family.owner_id for family in families}
+    subscriptions = {}
+    for subscription in Subscription.objects.filter(
+        owner_id__in=owner_ids,
         tier__in=[Subscription.TIER_STARTER, Subscription.TIER_PRO]
-    ).first()
-    
-    if subscription and subscription.is_active() and subscription.current_period_start:
-        # Paid subscription - use the subscription period start
-        # Normalize to remove seconds and microseconds for consistency
-        period_start = subscription.current_period_start.replace(second=0, microsecond=0)
-        return period_start
-    
-    # FREE tier - use family creation date as the base period start
-    # Calculate which 30-day period we're in based on family creation
-    family_created = family.created_at
-    if not family_created:
-        # Fallback to current time if created_at is somehow missing
-        family_created = timezone.now()
-    
-    # Normalize family_created to remove seconds and microseconds
-    family_created = family_created.replace(second=0, microsecond=0)
-    
-    now = timezone.now().replace(second=0, microsecond=0)
-    
-    # Calculate how many 30-day periods have passed since family creation
-    time_diff = now - family_created
-    days_passed = time_diff.total_seconds() / 86400  # Convert to days
-    periods_passed = int(days_passed / 30)
-    
-    # Calculate the start of the current period
-    period_start = family_created + timedelta(days=periods_passed * 30)
-    
-    # Ensure no seconds or microseconds
-    period_start = period_start.replace(second=0, microsecond=0)
-    
-    return period_start
+    ).order_by('-created_at'):
+        subscriptions.setdefault(subscription.owner_id, subscription)
+
+    for family in families:
+        family.current_period_start, family.current_period_end = compute_period_bounds(
+            family, subscriptions.get(family.owner_id), now
+        )
+    Family.objects.bulk_update(families, ['current_period_start', 'current_period_end'])
+    return len(families)
+
+
+def get_period_usage(family):
+    """
+    Get the usage record for the family's current period without creating it.
+    One indexed (family, period_start) read; returns None if nothing was used yet.
+    """
+    if not family:
+        return None
+    period_start = get_current_period_start(family)
+    if not period_start:
+        return None
+    return SubscriptionUsage.objects.filter(family=family, period_start=period_start).first()
 
 
 def get_current_month_usage(family):
     """
     Get or create usage record for the current subscription period.
     Returns the SubscriptionUsage object for the current period.
-    Uses subscription period start dates instead of calendar months.
+    Limit checks use get_period_usage instead, which never writes.
     """
     if not family:
         return None
@@ -172,11 +310,11 @@ def check_subscription_limit(family, resource_type, count=1):
 
     if resource_type == 'tasks':
         limit = limits['max_tasks_per_month']
-        usage = get_current_month_usage(family)
+        usage = get_period_usage(family)
         current_count = usage.tasks_created if usage else 0
     elif resource_type == 'rewards':
         limit = limits['max_rewards_per_month']
-        usage = get_current_month_usage(family)
+        usage = get_period_usage(family)
         current_count = usage.rewards_created if usage else 0
     else:
         return False, 0, 0, tier
@@ -185,7 +323,74 @@ def check_subscription_limit(family, resource_type, count=1):
     return can_create, current_count, limit, tier
 
 
-def increment_usage(family, resource_type, count=1):
+def reserve_quota(family, resource_type, count=1, partial=False):
+    """
+    Atomically reserve monthly quota before creating tasks or rewards.
+    
+    The reservation is a single conditional UPDATE
+    (... SET tasks_created = tasks_created + n WHERE tasks_created + n <= limit),
+    so concurrent requests can never push usage over the limit. Call it inside
+    the transaction that creates the objects: if that transaction rolls back,
+    the reservation is released with it.
+    
+    Args:
+        family: Family instance
+        resource_type: 'tasks' or 'rewards'
+        count: Number of resources to create
+        partial: grant whatever is left (at least 1) instead of all or nothing
+    
+    Returns:
+        tuple: (granted: int, current_count: int or None, limit: int, tier: str)
+            granted is 0 when the reservation was refused.
+            current_count is the usage read when the first UPDATE could not
+            grant the request (always set when refused), otherwise None.
+    """
+    if not family:
+        return 0, 0, 0, Subscription.TIER_FREE
+
+    tier = get_family_subscription(family)
+    field = USAGE_FIELDS.get(resource_type)
+    if not field or count <= 0:
+        return 0, 0, 0, tier
+    limit = get_tier_limits(tier)[f'max_{resource_type}_per_month']
+
+    period_start = get_current_period_start(family)
+    usage_row = SubscriptionUsage.objects.filter(family=family, period_start=period_start)
+
+    wanted = count
+    current_count = None
+    for _ in range(RESERVE_ATTEMPTS):
+        reserved = usage_row.filter(**{f'{field}__lte': limit - wanted}).update(
+            **{field: F(field) + wanted, 'updated_at': timezone.now()}
+        )
+        if reserved:
+            return wanted, current_count, limit, tier
+
+        # Either the limit would be exceeded or this is the first use in the period
+        usage = get_current_month_usage(family)
+        current_count = getattr(usage, field)
+        available = limit - current_count
+        if available < (1 if partial else count):
+            return 0, current_count, limit, tier
+        wanted = min(count, available)
+
+    return 0, current_count, limit, tier
+
+
+def is_family_active(family, since):
+    """
+    Check whether the family has been used since `since`: someone (owner or
+    member) logged in, or a task was completed (children often stay logged in).
+    """
+    from a_family.models import Family
+    from a_tasks.models import Task
+    member_ids = Family.members.through.objects.filter(family_id=family.pk).values('user_id')
+    if User.objects.filter(Q(pk=family.owner_id) | Q(pk__in=member_ids), last_login__gte=since).exists():
+        return True
+    return Task.objects.filter(family=family, completed_at__gte=since).exists()
+
+
+def increment_usage(family, resource_type, count=1, only_if_active=False):
     """
     Increment the monthly usage counter for a family.
     
@@ -193,26 +398,62 @@ def increment_usage(family, resource_type, count=1):
         family: Family instance
         resource_type: 'tasks' or 'rewards'
         count: Number to increment (default 1)
+        only_if_active: don't start a usage row for the period unless the family
+            has been used during it (see is_family_active); used by maintenance so
+            families that never come back don't gain a row every period
     """
     if not family:
         return
 
-    usage = get_current_month_usage(family)
-    if not usage:
+    field = USAGE_FIELDS.get(resource_type)
+    if not field:
         return
 
-    if resource_type == 'tasks':
-        usage.tasks_created += count
-        usage.save(update_fields=['tasks_created', 'updated_at'])
-    elif resource_type == 'rewards':
-        usage.rewards_created += count
-        usage.save(update_fields=['rewards_created', 'updated_at'])
+    period_start = get_current_period_start(family)
+    if not period_start:
+        return
+
+    # Single UPDATE on the (family, period_start) row; the row is only created on first use
+    usage_row = SubscriptionUsage.objects.filter(family=family, period_start=period_start)
+    changes = {field: F(field) + count, 'updated_at': timezone.now()}
+    if not usage_row.update(**changes):
+        if only_if_active and not is_family_active(family, period_start):
+            return
+        get_current_month_usage(family)
+        usage_row.update(**changes)
+
+
+def get_member_counts(family):
+    """
+    Count a family's parents and children with one conditional-aggregation query.
+    The owner is counted once and always as a parent, whether or not they are also in members.
+
+    Returns:
+        dict: {'parents': int, 'children': int}
+    """
+    if not family:
+        return {'parents': 0, 'children': 0}
+
+    from a_family.models import Family, User
+
+    member_ids = Family.members.through.objects.filter(family_id=family.pk).values('user_id')
+    counts = User.objects.filter(
+        Q(pk=family.owner_id) | Q(pk__in=member_ids)
+    ).aggregate(
+        parents=Count('pk', filter=Q(role=User.ROLE_PARENT) | Q(pk=family.owner_id)),
+        children=Count('pk', filter=Q(role=User.ROLE_CHILD) & ~Q(pk=family.owner_id)),
+    )
+    return {'parents': counts['parents'] or 0, 'children': counts['children'] or 0}
 
 
 def can_add_member(family, role):
     """
     Check if a family can add a member with the given role.
     
+    To enforce the limit under concurrent joins, call this inside a transaction
+    after locking the family row (Family.objects.select_for_update()), and add
+    the member in that same transaction.
+    
     Args:
         family: Family instance
         role: 'parent' or 'child' (from User.ROLE_CHOICES)
@@ -230,18 +471,14 @@ def can_add_member(family, role):
 
     if role == User.ROLE_PARENT:
         limit = limits['max_parents']
-        # Count owner + members with parent role
-        current_count = 1  # Owner is always a parent
-        current_count += family.members.filter(role=User.ROLE_PARENT).count()
-        # Don't double count owner if they're also in members
-        if family.owner in family.members.all() and family.owner.role == User.ROLE_PARENT:
-            current_count -= 1
+        key = 'parents'
     elif role == User.ROLE_CHILD:
         limit = limits['max_children']
-        current_count = family.members.filter(role=User.ROLE_CHILD).count()
+        key = 'children'
     else:
         return False, 0, 0, tier
 
+    current_count = get_member_counts(family)[key]
     can_add = current_count < limit
     return can_add, current_count, limit, tier
 
@@ -263,26 +500,35 @@ def check_recurring_task_limit(family):
     limits = get_tier_limits(tier)
     limit = limits.get('max_recurring_tasks', 0)
     
-    # Count active recurring tasks (tasks with active recurrences)
-    from a_tasks.models import TaskRecurrence
-    actual_count = TaskRecurrence.objects.filter(
-        task__family=family
-    ).count()
-    
-    # Check if there's a manually set value in SubscriptionUsage for testing
-    # If the manual value differs from actual count, use it (allows testing)
-    usage = get_current_month_usage(family)
-    if usage and usage.recurring_tasks_created != actual_count:
-        # Use the manually set value for testing
-        current_count = usage.recurring_tasks_created
-    else:
-        # Use actual count
-        current_count = actual_count
-    
+    current_count = get_active_recurrence_count(family)
     can_create = current_count < limit
     return can_create, current_count, limit, tier
 
 
+def get_active_recurrence_count(family):
+    """
+    Read the family's active recurring task counter (one primary key lookup).
+    The value is read from the database, not from the possibly stale instance.
+    """
+    from a_family.models import Family
+    count = Family.objects.filter(pk=family.pk).values_list('active_recurrences', flat=True).first()
+    return count or 0
+
+
+def adjust_recurrence_count(family_id, delta):
+    """
+    Add delta (may be negative) to a family's active recurring task counter.
+    Done as a single UPDATE so concurrent changes are not lost; never goes below zero.
+    Called from a_tasks.signals whenever a TaskRecurrence is created or deleted.
+    """
+    if not family_id or not delta:
+        return
+    from a_family.models import Family
+    Family.objects.filter(pk=family_id).update(
+        active_recurrences=Greatest(F('active_recurrences') + delta, 0)
+    )
+
+
 def has_shopping_list_access(family):
     """
     Check if a family has access to the shopping list feature.
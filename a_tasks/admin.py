@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Task, TaskRecurrence
+from .models import Task, TaskHistory, TaskRecurrence
 
 
 class TaskRecurrenceInline(admin.TabularInline):
@@ -58,3 +58,20 @@ class TaskRecurrenceAdmin(admin.ModelAdmin):
     )
     date_hierarchy = 'next_occurrence'
     ordering = ('next_occurrence',)
+
+
+@admin.register(TaskHistory)
+class TaskHistoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'family', 'completed_by', 'points', 'approved', 'was_recurring', 'completed_at', 'month')
+    list_filter = ('approved', 'was_recurring', 'priority', 'month')
+    search_fields = ('name', 'family__name', 'completed_by__username', 'completed_by__email')
+    raw_id_fields = ('family', 'completed_by')
+    date_hierarchy = 'completed_at'
+    ordering = ('-completed_at',)
+
+    def has_add_permission(self, request):
+        # History is written by daily maintenance only
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,106 @@
+"""
+Chunked batch executor for maintenance jobs.
+
+Large DELETE/UPDATE statements are split into primary-key ordered batches so
+each statement touches a bounded number of rows, holds its locks briefly and
+never builds a huge cascade collector. A short sleep between batches leaves
+room for concurrent requests.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import router, transaction
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BATCH_SIZE = getattr(settings, 'MAINTENANCE_BATCH_SIZE', 1000)
+DEFAULT_BATCH_SLEEP = getattr(settings, 'MAINTENANCE_BATCH_SLEEP', 0.05)
+
+
+def iter_pk_batches(queryset, batch_size=DEFAULT_BATCH_SIZE, sleep_seconds=DEFAULT_BATCH_SLEEP):
+    """
+    Yield lists of primary keys matched by `queryset`, in ascending pk ranges.
+
+    Uses keyset pagination (pk > last seen pk) so every batch is an index range
+    scan, even when earlier batches were deleted. Sleeps between batches.
+    """
+    last_pk = None
+    first = True
+    queryset = queryset.order_by('pk')
+    while True:
+        batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(batch_qs.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        if not first and sleep_seconds:
+            time.sleep(sleep_seconds)
+        first = False
+        last_pk = pks[-1]
+        yield pks
+        if len(pks) < batch_size:
+            return
+
+
+def _report(label, done, progress):
+    logger.info(f"{label}: {done} row(s) processed")
+    if progress:
+        progress(label, done)
+
+
+def batch_delete(queryset, batch_size=DEFAULT_BATCH_SIZE, sleep_seconds=DEFAULT_BATCH_SLEEP,
+                 raw=False, label=None, progress=None):
+    """
+    Delete the rows matched by `queryset` in bounded batches.
+
+    Like batch_update, each batch re-checks the original filter, so rows that
+    stopped matching after the pk scan are not deleted.
+
+    Args:
+        queryset: rows to delete
+        raw: use QuerySet._raw_delete (single DELETE, no cascades, no signals).
+            Only safe for models nothing references and that have no delete signals.
+        label: name used in progress logs (defaults to the model name)
+        progress: optional callable(label, rows_done) called after each batch
+
+    Returns:
+        int: number of rows deleted
+    """
+    model = queryset.model
+    label = label or model._meta.verbose_name_plural
+    using = router.db_for_write(model)
+    deleted = 0
+
+    for pks in iter_pk_batches(queryset, batch_size, sleep_seconds):
+        batch = queryset.using(using).filter(pk__in=pks)
+        with transaction.atomic(using=using):
+            if raw:
+                deleted += batch._raw_delete(using)
+            else:
+                deleted += batch.delete()[1].get(model._meta.label, 0)
+        _report(label, deleted, progress)
+
+    return deleted
+
+
+def batch_update(queryset, values, batch_size=DEFAULT_BATCH_SIZE, sleep_seconds=DEFAULT_BATCH_SLEEP,
+                 label=None, progress=None):
+    """
+    Apply `queryset.update(**values)` in bounded batches.
+
+    Rows are re-checked against the original filter inside each batch, so rows
+    changed by a concurrent request in the meantime are left alone.
+
+    Returns:
+        int: number of rows updated
+    """
+    model = queryset.model
+    label = label or model._meta.verbose_name_plural
+    updated = 0
+
+    for pks in iter_pk_batches(queryset, batch_size, sleep_seconds):
+        updated += queryset.filter(pk__in=pks).update(**values)
+        _report(label, updated, progress)
+
+    return updated
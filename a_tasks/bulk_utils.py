@@ -0,0 +1,147 @@
+"""
+Utility functions for bulk quick-add of tasks.
+Parents can paste a list of chores (one per line) and create them all in one request.
+Each line uses the same quick-add syntax as the single task input (@name, !high, +50, *daily, ...).
+"""
+from django.db import transaction
+
+from a_family.models import User
+from a_family.roster_utils import get_family_roster
+from a_subscription.utils import (
+    adjust_recurrence_count,
+    check_recurring_task_limit,
+    reserve_quota,
+)
+
+from .models import Task, TaskRecurrence
+from .parsing_utils import parse_task_text
+from .recurrence_utils import calculate_next_occurrence
+
+
+# Upper bound for lines accepted in one bulk request
+MAX_BULK_LINES = 100
+
+
+def bulk_create_tasks(family, created_by, lines):
+    """
+    Parse and create tasks for many quick-add lines in one transaction.
+
+    Task quota is reserved once for the whole batch (reserve_quota), tasks and
+    recurrences are inserted with bulk_create, all in one transaction.
+
+    Args:
+        family: Family instance
+        created_by: User creating the tasks (parent)
+        lines: list of quick-add lines (see _core.text_utils.split_pasted_lines)
+
+    Returns:
+        dict with:
+            created: list of created Task instances
+            skipped: list of (line, reason) tuples for lines that could not be used
+            limit_error: None or dict(resource, current, limit, tier) if a limit would be exceeded
+    """
+    result = {
+        'created': [],
+        'skipped': [],
+        'limit_error': None,
+    }
+
+    roster = get_family_roster(family)
+    children = [member for member in roster if member.role == User.ROLE_CHILD]
+    children_by_id = {child.id: child for child in children}
+
+    # Parse all lines first so limits can be validated for the whole batch
+    planned = []  # list of (parsed, assignees)
+    for line in lines:
+        parsed = parse_task_text(line, family, members=roster)
+        if not parsed or not parsed['name']:
+            result['skipped'].append((line, 'Ülesande nimi puudub.'))
+            continue
+
+        if parsed.get('assign_to_all_children'):
+            if not children:
+                result['skipped'].append((line, 'Peres pole lapsi.'))
+                continue
+            assignees = children
+        elif parsed['assigned_to_id']:
+            assignee = children_by_id.get(parsed['assigned_to_id'])
+            if not assignee:
+                result['skipped'].append((line, 'Ülesandeid saab määrata ainult lastele.'))
+                continue
+            assignees = [assignee]
+        else:
+            assignees = [None]
+
+        planned.append((parsed, assignees))
+
+    if not planned:
+        return result
+
+    num_tasks = sum(len(assignees) for _, assignees in planned)
+    num_recurring = sum(len(assignees) for parsed, assignees in planned if parsed['recurring'])
+
+    # Roster entries are snapshots; load the assigned children as User rows once
+    assigned_users = User.objects.in_bulk(
+        {assignee.id for _, assignees in planned for assignee in assignees if assignee}
+    )
+
+    tasks = []
+    frequencies = []  # recurring frequency per task (None for one-off tasks)
+    for parsed, assignees in planned:
+        for assignee in assignees:
+            tasks.append(Task(
+                name=parsed['name'][:255],
+                description='',
+                family=family,
+                assigned_to=assigned_users.get(assignee.id) if assignee else None,
+                created_by=created_by,
+                due_date=parsed['due_date'],
+                priority=parsed['priority'],
+                points=parsed['points'],
+            ))
+            frequencies.append(parsed['recurring'])
+
+    with transaction.atomic():
+        # All or nothing: reserve quota for the whole batch in one conditional UPDATE
+        granted, current_count, limit, tier = reserve_quota(family, 'tasks', num_tasks)
+        if not granted:
+            result['limit_error'] = {
+                'resource': 'tasks',
+                'current': current_count,
+                'limit': limit,
+                'tier': tier,
+            }
+            return result
+
+        if num_recurring:
+            can_create_recurring, current_recurring, recurring_limit, recurring_tier = check_recurring_task_limit(family)
+            if not can_create_recurring or (current_recurring + num_recurring) > recurring_limit:
+                result['limit_error'] = {
+                    'resource': 'recurring_tasks',
+                    'current': current_recurring,
+                    'limit': recurring_limit,
+                    'tier': recurring_tier,
+                }
+                # Releases the task quota reserved above
+                transaction.set_rollback(True)
+                return result
+
+        Task.objects.bulk_create(tasks)
+
+        recurrences = []
+        for task, frequency in zip(tasks, frequencies):
+            if not frequency:
+                continue
+            next_due_date, next_occurrence = calculate_next_occurrence(task.due_date, frequency)
+            recurrences.append(TaskRecurrence(
+                task=task,
+                frequency=frequency,
+                next_occurrence=next_occurrence,
+            ))
+        if recurrences:
+            TaskRecurrence.objects.bulk_create(recurrences)
+            # bulk_create sends no post_save signals, so update the counter here
+            adjust_recurrence_count(family.id, len(recurrences))
+
+    result['created'] = tasks
+    return result
@@ -0,0 +1,105 @@
+"""
+Utility functions for archiving finished tasks into TaskHistory.
+
+Completed tasks are moved (copied + deleted) in primary-key ordered chunks so
+each transaction stays short and the live tasks_task table only holds
+open and recently finished work.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .batch_utils import DEFAULT_BATCH_SLEEP, iter_pk_batches
+from .models import Task, TaskHistory, TaskRecurrence
+
+logger = logging.getLogger(__name__)
+
+
+# Tasks moved per transaction
+ARCHIVE_CHUNK_SIZE = 500
+
+HISTORY_FIELDS = (
+    'id', 'family_id', 'name', 'assigned_to_id', 'completed_by_id', 'approved', 'points', 'priority',
+    'due_date', 'created_at', 'completed_at', 'approved_at', 'has_recurrence',
+)
+
+
+def month_start(value):
+    """First day of the month for a date or datetime (in the current timezone)"""
+    if hasattr(value, 'hour'):
+        value = timezone.localtime(value) if timezone.is_aware(value) else value
+        value = value.date()
+    return value.replace(day=1)
+
+
+def _history_row(row):
+    completed_at = row['completed_at'] or row['approved_at'] or timezone.now()
+    return TaskHistory(
+        task_id=row['id'],
+        family_id=row['family_id'],
+        name=row['name'],
+        completed_by_id=row['completed_by_id'] or row['assigned_to_id'],
+        approved=row['approved'],
+        points=row['points'],
+        priority=row['priority'],
+        was_recurring=row['has_recurrence'],
+        due_date=row['due_date'],
+        created_at=row['created_at'],
+        completed_at=completed_at,
+        approved_at=row['approved_at'],
+        month=month_start(completed_at),
+    )
+
+
+def archive_tasks(queryset, chunk_size=ARCHIVE_CHUNK_SIZE, sleep_seconds=DEFAULT_BATCH_SLEEP, progress=None):
+    """
+    Move the tasks matched by `queryset` into TaskHistory.
+
+    Each chunk is copied with one bulk_create and removed from tasks_task in
+    the same transaction, so a task is never lost or archived twice.
+
+    Args:
+        queryset: Task queryset of finished tasks
+        chunk_size: number of tasks moved per transaction
+        sleep_seconds: pause between chunks (see batch_utils)
+        progress: optional callable(label, rows_done) called after each chunk
+
+    Returns:
+        int: number of tasks archived
+    """
+    archived = 0
+    annotated = queryset.annotate(
+        has_recurrence=Exists(TaskRecurrence.objects.filter(task=OuterRef('pk')))
+    )
+
+    for pks in iter_pk_batches(queryset, chunk_size, sleep_seconds):
+        with transaction.atomic():
+            # Re-apply the filter so tasks changed since the pk scan stay live
+            rows = list(annotated.filter(pk__in=pks).values(*HISTORY_FIELDS))
+            if not rows:
+                continue
+            TaskHistory.objects.bulk_create([_history_row(row) for row in rows])
+            Task.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        archived += len(rows)
+        logger.info(f"Task history: {archived} task(s) archived")
+        if progress:
+            progress('task history', archived)
+
+    return archived
+
+
+def get_completed_task_count(since, family=None):
+    """
+    Count tasks completed since `since`, across live tasks and the archive.
+
+    The archive lookup is narrowed by month first so it stays on the month index.
+    """
+    live = Task.objects.filter(completed=True, completed_at__gte=since)
+    history = TaskHistory.objects.filter(month__gte=month_start(since), completed_at__gte=since)
+    if family is not None:
+        live = live.filter(family=family)
+        history = history.filter(family=family)
+    return live.count() + history.count()
+
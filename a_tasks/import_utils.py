@@ -0,0 +1,403 @@
+"""
+Utility functions for importing tasks, recurring tasks and rewards from a file.
+
+Families moving over from a spreadsheet upload a CSV, JSON or NDJSON file
+with one task or reward per row. Rows are read as a stream and handled in
+batches of IMPORT_BATCH_SIZE: each batch is validated against the family
+roster, quota is reserved once per batch (reserve_quota with partial=True)
+and the rows are inserted with bulk_create in one transaction. Rows that
+cannot be imported are reported with their row number instead of failing
+the whole file. If the file becomes unreadable part way (bad encoding), the
+batches already committed stay and the error is reported with the counts.
+
+CSV and NDJSON are read line by line. A .json file has to be parsed as a
+whole, so it is limited to MAX_JSON_IMPORT_BYTES; larger imports should use
+NDJSON.
+
+Columns (English or Estonian names, case-insensitive):
+    type (task/reward), name, description, points, priority (low/medium/high),
+    due_date (YYYY-MM-DD or pp.kk.aaaa), assigned_to (child's username or name),
+    recurring (daily/business_daily/every_other_day/weekly/monthly)
+"""
+import csv
+import io
+import itertools
+import json
+from datetime import datetime
+
+from django.db import transaction
+
+from a_family.models import User
+from a_family.roster_utils import get_family_roster
+from a_rewards.models import Reward
+from a_subscription.utils import adjust_recurrence_count, check_recurring_task_limit, reserve_quota
+
+from .models import Task, TaskRecurrence
+from .recurrence_utils import calculate_next_occurrence
+
+
+# Rows validated and inserted per transaction
+IMPORT_BATCH_SIZE = 500
+
+# Upper bound for rows accepted in one file
+MAX_IMPORT_ROWS = 5000
+
+# .json uploads are loaded into memory at once, so their size is capped
+MAX_JSON_IMPORT_BYTES = 5 * 1024 * 1024
+
+DEFAULT_TASK_POINTS = 25
+
+# Keeps points well inside the PositiveIntegerField range of Task/Reward
+MAX_IMPORT_POINTS = 1_000_000
+
+COLUMN_ALIASES = {
+    'tüüp': 'type',
+    'nimi': 'name',
+    'kirjeldus': 'description',
+    'punktid': 'points',
+    'prioriteet': 'priority',
+    'tähtaeg': 'due_date',
+    'määratud': 'assigned_to',
+    'kordus': 'recurring',
+}
+
+ROW_TYPES = {
+    '': 'task',
+    'task': 'task',
+    'ülesanne': 'task',
+    'reward': 'reward',
+    'preemia': 'reward',
+}
+
+PRIORITIES = {
+    '': Task.PRIORITY_MEDIUM,
+    'low': Task.PRIORITY_LOW,
+    'madal': Task.PRIORITY_LOW,
+    'medium': Task.PRIORITY_MEDIUM,
+    'keskmine': Task.PRIORITY_MEDIUM,
+    'high': Task.PRIORITY_HIGH,
+    'kõrge': Task.PRIORITY_HIGH,
+}
+
+# Same words as the quick-add syntax (*daily, *nädalaselt, ...)
+FREQUENCIES = {
+    'daily': TaskRecurrence.FREQUENCY_DAILY,
+    'päevaselt': TaskRecurrence.FREQUENCY_DAILY,
+    'business_daily': TaskRecurrence.FREQUENCY_BUSINESS_DAILY,
+    'tööpäevaselt': TaskRecurrence.FREQUENCY_BUSINESS_DAILY,
+    'every_other_day': TaskRecurrence.FREQUENCY_EVERY_OTHER_DAY,
+    'iga_teine_päev': TaskRecurrence.FREQUENCY_EVERY_OTHER_DAY,
+    'weekly': TaskRecurrence.FREQUENCY_WEEKLY,
+    'nädalaselt': TaskRecurrence.FREQUENCY_WEEKLY,
+    'monthly': TaskRecurrence.FREQUENCY_MONTHLY,
+    'kuus': TaskRecurrence.FREQUENCY_MONTHLY,
+}
+
+
+def iter_import_rows(uploaded_file):
+    """
+    Yield (row_number, row dict) from an uploaded CSV, JSON or NDJSON file.
+
+    CSV and NDJSON are read line by line; JSON accepts a list of rows or
+    {"tasks": [...], "rewards": [...]}.
+
+    Raises:
+        ValueError: unsupported file type or unreadable content (Estonian message)
+    """
+    name = (getattr(uploaded_file, 'name', '') or '').lower()
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    try:
+        if name.endswith('.csv'):
+            header = text.readline()
+            # Spreadsheets with an Estonian locale export with ';'
+            delimiter = ';' if header.count(';') > header.count(',') else ','
+            reader = csv.DictReader(itertools.chain([header], text), delimiter=delimiter)
+            try:
+                for row in reader:
+                    yield reader.line_num, row
+            except csv.Error:
+                # e.g. a cell over csv.field_size_limit() or a stray quote
+                raise ValueError(
+                    f'CSV-faili rida {reader.line_num} ei saa lugeda (liiga pikk lahter või vigased jutumärgid).'
+                )
+        elif name.endswith(('.ndjson', '.jsonl')):
+            for line_number, line in enumerate(text, start=1):
+                if line.strip():
+                    yield line_number, _load_json_row(line)
+        elif name.endswith('.json'):
+            if (getattr(uploaded_file, 'size', 0) or 0) > MAX_JSON_IMPORT_BYTES:
+                raise ValueError(
+                    f'JSON-fail võib olla kuni {MAX_JSON_IMPORT_BYTES // (1024 * 1024)} MB. '
+                    f'Suuremate failide jaoks kasuta NDJSON-i (üks rida rea kohta).'
+                )
+            try:
+                data = json.load(text)
+            except json.JSONDecodeError:
+                raise ValueError('Fail ei ole korrektne JSON.')
+            if isinstance(data, dict):
+                data = [_with_type(row, 'task') for row in data.get('tasks', [])] + \
+                       [_with_type(row, 'reward') for row in data.get('rewards', [])]
+            if not isinstance(data, list):
+                raise ValueError('JSON-fail peab sisaldama ridade loendit.')
+            for index, row in enumerate(data, start=1):
+                yield index, row
+        else:
+            raise ValueError('Toetatud on CSV-, JSON- ja NDJSON-failid.')
+    except UnicodeDecodeError:
+        raise ValueError('Fail peab olema UTF-8 kodeeringus.')
+    finally:
+        # Leave the uploaded file open for Django to clean up
+        text.detach()
+
+
+def _with_type(row, kind):
+    return dict(row, type=kind) if isinstance(row, dict) else row
+
+
+def _load_json_row(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        # Reported for this row by _validate_row
+        return None
+
+
+def _normalize_row(row):
+    if not isinstance(row, dict):
+        return None
+    normalized = {}
+    for key, value in row.items():
+        key = COLUMN_ALIASES.get(str(key or '').strip().lower(), str(key or '').strip().lower())
+        normalized[key] = '' if value is None else str(value).strip()
+    return normalized
+
+
+def _parse_date(value):
+    for date_format in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _find_child(children, value):
+    value = value.lower()
+    for child in children:
+        if value in ((child.username or '').lower(), (child.first_name or '').lower(), child.display_name.lower()):
+            return child
+    return None
+
+
+def _validate_row(row, children):
+    """
+    Validate one normalized row.
+
+    Returns:
+        tuple: (kind, values, error) where kind is 'task' or 'reward' and
+            error is an Estonian message or None
+    """
+    if row is None:
+        return None, None, 'Rida peab olema JSON-objekt või CSV-rida.'
+
+    kind = ROW_TYPES.get(row.get('type', '').lower())
+    if kind is None:
+        return None, None, f"Tundmatu tüüp '{row['type']}'."
+
+    name = row.get('name', '')
+    if not name:
+        return kind, None, 'Nimi puudub.'
+    if len(name) > 255:
+        return kind, None, 'Nimi on liiga pikk (kuni 255 märki).'
+
+    points = row.get('points', '')
+    if points:
+        try:
+            points = int(points)
+        except ValueError:
+            return kind, None, f"Punktid peavad olema arv, mitte '{points}'."
+        if points < 0:
+            return kind, None, 'Punktid ei saa olla negatiivsed.'
+        if points > MAX_IMPORT_POINTS:
+            return kind, None, f'Punkte saab olla kuni {MAX_IMPORT_POINTS}.'
+    elif kind == 'reward':
+        return kind, None, 'Preemia punktid puuduvad.'
+    else:
+        points = DEFAULT_TASK_POINTS
+
+    values = {
+        'name': name,
+        'description': row.get('description', ''),
+        'points': points,
+    }
+    if kind == 'reward':
+        return kind, values, None
+
+    priority = PRIORITIES.get(row.get('priority', '').lower())
+    if priority is None:
+        return kind, None, f"Tundmatu prioriteet '{row['priority']}'."
+    values['priority'] = priority
+
+    due_date = None
+    if row.get('due_date'):
+        due_date = _parse_date(row['due_date'])
+        if due_date is None:
+            return kind, None, f"Vigane kuupäev '{row['due_date']}' (kasuta AAAA-KK-PP või pp.kk.aaaa)."
+    values['due_date'] = due_date
+
+    assignee = None
+    if row.get('assigned_to'):
+        assignee = _find_child(children, row['assigned_to'])
+        if assignee is None:
+            return kind, None, f"Last '{row['assigned_to']}' ei leitud peres."
+    values['assigned_to_id'] = assignee.id if assignee else None
+
+    frequency = None
+    if row.get('recurring'):
+        frequency = FREQUENCIES.get(row['recurring'].lower())
+        if frequency is None:
+            return kind, None, f"Tundmatu kordus '{row['recurring']}'."
+    values['recurring'] = frequency
+
+    return kind, values, None
+
+
+def import_family_data(family, created_by, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import tasks, recurring tasks and rewards for a family.
+
+    Args:
+        family: Family instance
+        created_by: User doing the import (parent)
+        rows: iterable of (row_number, row dict), e.g. iter_import_rows()
+
+    Returns:
+        dict with:
+            rows: number of rows read
+            tasks_created, recurrences_created, rewards_created: counts
+            errors: list of (row_number, message) tuples for rows not imported;
+                row_number is None for file-level errors (unreadable file, row limit)
+    """
+    result = {
+        'rows': 0,
+        'tasks_created': 0,
+        'recurrences_created': 0,
+        'rewards_created': 0,
+        'errors': [],
+    }
+    children = [member for member in get_family_roster(family) if member.role == User.ROLE_CHILD]
+
+    rows = iter(rows)
+    while True:
+        batch = []
+        read_error = None
+        try:
+            for row in itertools.islice(rows, batch_size):
+                batch.append(row)
+        except ValueError as e:
+            # Unreadable file: keep what was read so far, stop after this batch
+            read_error = str(e)
+        if not batch and read_error is None:
+            break
+        if result['rows'] + len(batch) > MAX_IMPORT_ROWS:
+            batch = batch[:MAX_IMPORT_ROWS - result['rows']]
+            result['errors'].append((None, f'Korraga saab importida kuni {MAX_IMPORT_ROWS} rida, ülejäänud jäeti vahele.'))
+        result['rows'] += len(batch)
+        if batch:
+            _import_batch(family, created_by, batch, children, result)
+        if read_error is not None:
+            if result['rows']:
+                read_error = f"{read_error} Import peatati pärast {result['rows']} rida."
+            result['errors'].append((None, read_error))
+            break
+        if result['rows'] >= MAX_IMPORT_ROWS:
+            break
+
+    result['errors'].sort(key=lambda error: (error[0] is not None, error[0] or 0))
+    return result
+
+
+def _import_batch(family, created_by, batch, children, result):
+    tasks = []  # (row_number, values)
+    rewards = []
+    for row_number, row in batch:
+        kind, values, error = _validate_row(_normalize_row(row), children)
+        if error:
+            result['errors'].append((row_number, error))
+        elif kind == 'reward':
+            rewards.append((row_number, values))
+        else:
+            tasks.append((row_number, values))
+
+    with transaction.atomic():
+        if any(values['recurring'] for _, values in tasks):
+            _, current_recurring, recurring_limit, _ = check_recurring_task_limit(family)
+            allowed_recurring = max(recurring_limit - current_recurring, 0)
+            kept = []
+            for row_number, values in tasks:
+                if values['recurring']:
+                    if not allowed_recurring:
+                        result['errors'].append((row_number, 'Korduvate ülesannete limiit on täis.'))
+                        continue
+                    allowed_recurring -= 1
+                kept.append((row_number, values))
+            tasks = kept
+
+        if tasks:
+            granted = reserve_quota(family, 'tasks', len(tasks), partial=True)[0]
+            for row_number, _ in tasks[granted:]:
+                result['errors'].append((row_number, 'Kuu ülesannete limiit on täis.'))
+            tasks = tasks[:granted]
+
+        if tasks:
+            task_objects = [
+                Task(
+                    name=values['name'],
+                    description=values['description'],
+                    family=family,
+                    assigned_to_id=values['assigned_to_id'],
+                    created_by=created_by,
+                    due_date=values['due_date'],
+                    priority=values['priority'],
+                    points=values['points'],
+                )
+                for _, values in tasks
+            ]
+            Task.objects.bulk_create(task_objects)
+
+            recurrences = []
+            for task, (_, values) in zip(task_objects, tasks):
+                if not values['recurring']:
+                    continue
+                _, next_occurrence = calculate_next_occurrence(task.due_date, values['recurring'])
+                recurrences.append(TaskRecurrence(
+                    task=task,
+                    frequency=values['recurring'],
+                    next_occurrence=next_occurrence,
+                ))
+            if recurrences:
+                TaskRecurrence.objects.bulk_create(recurrences)
+                # bulk_create sends no post_save signals, so update the counter here
+                adjust_recurrence_count(family.id, len(recurrences))
+
+            result['tasks_created'] += len(task_objects)
+            result['recurrences_created'] += len(recurrences)
+
+        if rewards:
+            granted = reserve_quota(family, 'rewards', len(rewards), partial=True)[0]
+            for row_number, _ in rewards[granted:]:
+                result['errors'].append((row_number, 'Kuu preemiate limiit on täis.'))
+            rewards = rewards[:granted]
+
+        if rewards:
+            Reward.objects.bulk_create([
+                Reward(
+                    name=values['name'],
+                    description=values['description'],
+                    points=values['points'],
+                    family=family,
+                    created_by=created_by,
+                )
+                for _, values in rewards
+            ])
+            result['rewards_created'] += len(rewards)
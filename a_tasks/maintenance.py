@@ -2,8 +2,12 @@
 Maintenance functions for daily tasks.
 """
 import logging
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from datetime import timedelta
+from a_tasks.batch_utils import batch_delete, batch_update
+from a_tasks.history_utils import archive_tasks
 from a_tasks.models import Task, TaskRecurrence
 from a_tasks.recurrence_utils import calculate_next_occurrence
 from a_subscription.utils import increment_usage
@@ -11,10 +15,11 @@ from a_subscription.utils import increment_usage
 logger = logging.getLogger(__name__)
 
 
-def reset_assigned_to_for_all_tasks():
+def reset_assigned_to_for_all_tasks(progress=None):
     """
     Resets assigned_to to None for all incomplete tasks.
     This ensures children can't "lock" tasks for multiple days.
+    Runs in primary-key batches (see batch_utils).
     Returns the number of tasks updated.
     """
     incomplete_tasks = Task.objects.filter(
@@ -22,10 +27,14 @@ def reset_assigned_to_for_all_tasks():
         assigned_to__isnull=False
     )
     
-    count = incomplete_tasks.count()
+    count = batch_update(
+        incomplete_tasks,
+        {'assigned_to': None, 'version': F('version') + 1},
+        label='task assignments',
+        progress=progress,
+    )
     
     if count > 0:
-        incomplete_tasks.update(assigned_to=None)
         logger.info(f"Reset assigned_to for {count} incomplete task(s)")
         return count
     
@@ -89,10 +98,14 @@ def create_recurring_tasks_for_today(today):
         # Check if end_date has passed
         if recurrence.end_date and recurrence.end_date < today:
             # Delete the recurrence and its task if it exists
-            if recurrence.task:
-                task_name_for_log = recurrence.task.name
-                recurrence.task.delete()
-            recurrence.delete()
+            # One transaction with the family's active recurrence counter update
+            with transaction.atomic():
+                if recurrence.task:
+                    task_name_for_log = recurrence.task.name
+                    # Cascades to the recurrence; deleting it again would count it twice
+                    recurrence.task.delete()
+                else:
+                    recurrence.delete()
             logger.info(
                 f"Deleted expired recurrence for task '{task_name_for_log}' "
                 f"(end date {recurrence.end_date} passed)"
@@ -133,7 +146,7 @@ def create_recurring_tasks_for_today(today):
             created_count += 1
             
             # Increment subscription usage for recurring task creation
-            increment_usage(task_family, 'tasks', 1)
+            increment_usage(task_family, 'tasks', 1, only_if_active=True)
             
             # Update recurrence to point to new task BEFORE deleting old task
             # This prevents CASCADE from deleting the recurrence
@@ -203,7 +216,8 @@ def create_recurring_tasks_for_today(today):
                 current_task.due_date = today
                 current_task.assigned_to = None  # Reset assignment
                 current_task.started_at = None  # Reset started_at
-                current_task.save()
+                current_task.version = F('version') + 1
+                current_task.save(update_fields=['due_date', 'assigned_to', 'started_at', 'version', 'updated_at'])
                 updated_count += 1
                 logger.info(
                     f"Updated due_date to {today} for existing task '{current_task.name}' (ID: {current_task.id})"
@@ -246,7 +260,7 @@ def create_recurring_tasks_for_today(today):
             created_count += 1
             
             # Increment subscription usage for recurring task creation
-            increment_usage(task_family, 'tasks', 1)
+            increment_usage(task_family, 'tasks', 1, only_if_active=True)
             
             # Update recurrence to point to new task
             recurrence.task = new_task
@@ -269,10 +283,11 @@ def create_recurring_tasks_for_today(today):
     return created_count + updated_count
 
 
-def delete_completed_tasks():
+def delete_completed_tasks(progress=None):
     """
-    Deletes tasks that have been both completed and approved by a parent.
-    Returns the number of tasks deleted.
+    Moves tasks that have been both completed and approved by a parent
+    out of the live table into TaskHistory (in chunks).
+    Returns the number of tasks archived.
     """
     completed_and_approved_tasks = Task.objects.filter(
         completed=True,
@@ -280,20 +295,21 @@ def delete_completed_tasks():
         approved=True
     )
     
-    count = completed_and_approved_tasks.count()
+    archived_count = archive_tasks(completed_and_approved_tasks, progress=progress)
     
-    if count > 0:
-        deleted_count, _ = completed_and_approved_tasks.delete()
-        logger.info(f"Deleted {deleted_count} completed and approved task(s)")
-        return deleted_count
+    if archived_count > 0:
+        logger.info(f"Archived {archived_count} completed and approved task(s)")
+        return archived_count
     
-    logger.info("No completed and approved tasks to delete")
+    logger.info("No completed and approved tasks to archive")
     return 0
 
 
-def clear_shopping_cart():
+def clear_shopping_cart(progress=None):
     """
     Deletes all items in the shopping cart (in_cart=True).
+    Shopping items have no dependent rows or delete signals, so batches use
+    the raw DELETE fast path.
     Returns the number of items deleted.
     """
     try:
@@ -301,10 +317,9 @@ def clear_shopping_cart():
         
         cart_items = ShoppingListItem.objects.filter(in_cart=True)
         
-        count = cart_items.count()
+        deleted_count = batch_delete(cart_items, raw=True, label='shopping cart items', progress=progress)
         
-        if count > 0:
-            deleted_count, _ = cart_items.delete()
+        if deleted_count > 0:
             logger.info(f"Deleted {deleted_count} item(s) from shopping cart")
             return deleted_count
         
@@ -2,12 +2,30 @@
 Management command to clean up duplicate recurring tasks in the database.
 This should be run once to fix existing duplicates, then the maintenance logic
 will prevent new duplicates from being created.
+
+Both passes are set-based:
+1. Tasks of a recurring series (same family and name as a task with a
+   recurrence) that share a due_date are ranked with ROW_NUMBER() OVER
+   (PARTITION BY family, name, due_date); everything but the first row
+   (the recurrence's own task, then incomplete tasks, then the oldest) is
+   deleted, one chunk of families per transaction.
+2. Recurrences whose task is not due on the next occurrence date are
+   re-pointed to the series task on that date (found with a subquery), or
+   their task's due_date is moved forward, in primary-key batches.
 """
+from datetime import timezone as dt_timezone
+
 from django.core.management.base import BaseCommand
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber, TruncDate
 from django.utils import timezone
+from a_tasks.batch_utils import iter_pk_batches
 from a_tasks.models import Task, TaskRecurrence
-from datetime import date
+
+
+# Families (pass 1) or recurrences (pass 2) handled per statement batch
+DEFAULT_CHUNK_SIZE = 500
 
 
 class Command(BaseCommand):
@@ -19,120 +37,28 @@ class Command(BaseCommand):
             action='store_true',
             help='Perform a dry run without actually making changes.',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Families / recurrences handled per batch (default {DEFAULT_CHUNK_SIZE})',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        chunk_size = max(options['chunk_size'], 1)
         today = timezone.now().date()
-        
+
         self.stdout.write(f"Cleaning up duplicate recurring tasks (today={today})...")
-        
+
         if dry_run:
             self.stdout.write(
                 self.style.WARNING("DRY RUN: No changes will be made")
             )
-        
-        # Find all recurrences
-        recurrences = TaskRecurrence.objects.select_related('task', 'task__family').all()
-        
-        total_deleted = 0
-        total_updated = 0
-        
-        for recurrence in recurrences:
-            if not recurrence.task:
-                continue
-            
-            family = recurrence.task.family
-            task_name = recurrence.task.name
-            
-            # Find all tasks for this recurrence (same family, same name)
-            all_tasks = Task.objects.filter(
-                family=family,
-                name=task_name
-            ).order_by('due_date', 'id')
-            
-            # Group by due_date to find duplicates
-            tasks_by_date = {}
-            for task in all_tasks:
-                if task.due_date not in tasks_by_date:
-                    tasks_by_date[task.due_date] = []
-                tasks_by_date[task.due_date].append(task)
-            
-            # For each due_date, keep only one task (prefer the one referenced by recurrence)
-            for due_date, tasks in tasks_by_date.items():
-                if len(tasks) > 1:
-                    # Find the task referenced by recurrence
-                    recurrence_task = None
-                    for task in tasks:
-                        if task.id == recurrence.task.id:
-                            recurrence_task = task
-                            break
-                    
-                    # Keep the recurrence task, or the first one if recurrence doesn't point to any
-                    if recurrence_task:
-                        task_to_keep = recurrence_task
-                    else:
-                        # Prefer incomplete tasks, then by ID
-                        incomplete_tasks = [t for t in tasks if not t.completed]
-                        if incomplete_tasks:
-                            task_to_keep = incomplete_tasks[0]
-                        else:
-                            task_to_keep = tasks[0]
-                    
-                    # Delete duplicates
-                    tasks_to_delete = [t for t in tasks if t.id != task_to_keep.id]
-                    if tasks_to_delete:
-                        if not dry_run:
-                            deleted_count, _ = Task.objects.filter(
-                                id__in=[t.id for t in tasks_to_delete]
-                            ).delete()
-                            total_deleted += deleted_count
-                            
-                            # Update recurrence to point to the kept task if needed
-                            if recurrence.task != task_to_keep:
-                                recurrence.task = task_to_keep
-                                recurrence.save()
-                                total_updated += 1
-                        
-                        self.stdout.write(
-                            f"  Found {len(tasks)} tasks for '{task_name}' on {due_date}, "
-                            f"keeping task {task_to_keep.id}, deleting {len(tasks_to_delete)} duplicate(s)"
-                        )
-        
-        # Also fix recurrences that point to tasks with wrong due_date
-        for recurrence in recurrences:
-            if not recurrence.task:
-                continue
-            
-            expected_due_date = recurrence.next_occurrence.date()
-            if recurrence.task.due_date != expected_due_date:
-                # Check if there's already a task for the expected due_date
-                existing_task = Task.objects.filter(
-                    family=recurrence.task.family,
-                    name=recurrence.task.name,
-                    due_date=expected_due_date
-                ).exclude(id=recurrence.task.id).first()
-                
-                if existing_task:
-                    # Point recurrence to the correct task
-                    if not dry_run:
-                        recurrence.task = existing_task
-                        recurrence.save()
-                        total_updated += 1
-                    self.stdout.write(
-                        f"  Updated recurrence {recurrence.id} to point to task {existing_task.id} "
-                        f"(due_date={expected_due_date})"
-                    )
-                elif recurrence.task.due_date < expected_due_date:
-                    # Update task due_date to match recurrence
-                    if not dry_run:
-                        recurrence.task.due_date = expected_due_date
-                        recurrence.task.save()
-                        total_updated += 1
-                    self.stdout.write(
-                        f"  Updated task {recurrence.task.id} due_date from {recurrence.task.due_date} "
-                        f"to {expected_due_date}"
-                    )
-        
+
+        total_deleted = self._delete_duplicate_tasks(chunk_size, dry_run)
+        total_updated = self._fix_recurrence_targets(chunk_size, dry_run)
+
         if dry_run:
             self.stdout.write(
                 self.style.WARNING(
@@ -148,3 +74,86 @@ class Command(BaseCommand):
                 )
             )
 
+    def _delete_duplicate_tasks(self, chunk_size, dry_run):
+        """Pass 1: keep one task per (family, name, due_date) of every recurring series."""
+        series_tasks = Task.objects.filter(
+            Exists(TaskRecurrence.objects.filter(
+                task__family=OuterRef('family'),
+                task__name=OuterRef('name'),
+            ))
+        )
+
+        family_ids = sorted(set(
+            series_tasks.values('family_id', 'name', 'due_date')
+            .annotate(rows=Count('id'))
+            .filter(rows__gt=1)
+            .values_list('family_id', flat=True)
+        ))
+
+        deleted = 0
+        for start in range(0, len(family_ids), chunk_size):
+            chunk = family_ids[start:start + chunk_size]
+            loser_ids = list(
+                series_tasks.filter(family_id__in=chunk).annotate(
+                    has_recurrence=Exists(TaskRecurrence.objects.filter(task=OuterRef('pk'))),
+                    rank=Window(
+                        RowNumber(),
+                        partition_by=[F('family_id'), F('name'), F('due_date')],
+                        order_by=[F('has_recurrence').desc(), F('completed').asc(), F('id').asc()],
+                    ),
+                ).filter(rank__gt=1).values_list('id', flat=True)
+            )
+            if not loser_ids:
+                continue
+
+            self.stdout.write(
+                f"  {len(chunk)} family(ies): {'would delete' if dry_run else 'deleting'} "
+                f"{len(loser_ids)} duplicate task(s)"
+            )
+            if not dry_run:
+                with transaction.atomic():
+                    Task.objects.filter(pk__in=loser_ids).delete()
+            deleted += len(loser_ids)
+        return deleted
+
+    def _fix_recurrence_targets(self, chunk_size, dry_run):
+        """Pass 2: make every recurrence point to a task due on its next occurrence date."""
+        # next_occurrence is compared by its UTC date, like the daily maintenance job
+        mismatched = TaskRecurrence.objects.annotate(
+            expected_date=TruncDate('next_occurrence', tzinfo=dt_timezone.utc),
+        ).exclude(task__due_date=F('expected_date'))
+
+        target_task = Task.objects.filter(
+            family=OuterRef('task__family'),
+            name=OuterRef('task__name'),
+            due_date=OuterRef('expected_date'),
+        ).exclude(pk=OuterRef('task_id')).order_by('id').values('id')[:1]
+
+        updated = 0
+        for pks in iter_pk_batches(mismatched, batch_size=chunk_size, sleep_seconds=0):
+            rows = mismatched.filter(pk__in=pks).annotate(target_task_id=Subquery(target_task)).values_list(
+                'id', 'task_id', 'task__due_date', 'expected_date', 'target_task_id'
+            )
+
+            repointed = []
+            moved = []
+            for recurrence_id, task_id, due_date, expected_date, target_task_id in rows:
+                if target_task_id:
+                    # Point recurrence to the correct task
+                    repointed.append(TaskRecurrence(id=recurrence_id, task_id=target_task_id))
+                elif due_date and due_date < expected_date:
+                    # Update task due_date to match recurrence
+                    moved.append(Task(id=task_id, due_date=expected_date))
+
+            if not repointed and not moved:
+                continue
+            self.stdout.write(
+                f"  {'Would update' if dry_run else 'Updating'} {len(repointed)} recurrence(s) "
+                f"and {len(moved)} task due date(s)"
+            )
+            if not dry_run:
+                with transaction.atomic():
+                    TaskRecurrence.objects.bulk_update(repointed, ['task'])
+                    Task.objects.bulk_update(moved, ['due_date'])
+            updated += len(repointed) + len(moved)
+        return updated
@@ -113,7 +113,7 @@ class Command(BaseCommand):
                 created_count += 1
                 
                 # Increment subscription usage for recurring task creation
-                increment_usage(new_task.family, 'tasks', 1)
+                increment_usage(new_task.family, 'tasks', 1, only_if_active=True)
                 
                 # Update recurrence next_occurrence using utility function
                 from a_tasks.recurrence_utils import calculate_next_occurrence
@@ -11,10 +11,13 @@ from a_tasks.maintenance import (
     clear_shopping_cart,
     reset_assigned_to_for_all_tasks,
 )
+from a_family.points_utils import snapshot_points_balances
+from a_subscription.retention_utils import compact_subscription_usage
+from a_subscription.utils import roll_family_periods
 
 
 class Command(BaseCommand):
-    help = 'Daily maintenance: creates recurring tasks for today and deletes completed tasks'
+    help = 'Daily maintenance: creates recurring tasks for today and archives completed tasks'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -25,6 +28,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
         today = timezone.now().date()
         
         self.stdout.write(f"Running daily maintenance for {today}...")
@@ -36,24 +40,30 @@ class Command(BaseCommand):
             # In dry run, we'd need to modify the functions to not actually save
             # For now, just show what would happen
             self.stdout.write("Would create recurring tasks for today")
-            self.stdout.write("Would delete all completed tasks")
+            self.stdout.write("Would move all completed tasks to task history")
             self.stdout.write("Would clear shopping cart")
+            self.stdout.write("Would snapshot points balances")
             self.stdout.write("Would sync subscriptions with Stripe")
+            self.stdout.write("Would roll family usage periods forward")
+            self.stdout.write("Would compact old subscription usage periods")
             return
         
         # 1. Reset assigned_to for all incomplete tasks (so children can't lock tasks)
-        reset_count = reset_assigned_to_for_all_tasks()
+        reset_count = reset_assigned_to_for_all_tasks(progress=self._report_progress)
         
         # 2. Create recurring tasks for today
         created_count = create_recurring_tasks_for_today(today)
         
-        # 3. Delete completed tasks
-        deleted_count = delete_completed_tasks()
+        # 3. Move completed tasks to task history
+        deleted_count = delete_completed_tasks(progress=self._report_progress)
         
         # 4. Clear shopping cart
-        cart_cleared_count = clear_shopping_cart()
+        cart_cleared_count = clear_shopping_cart(progress=self._report_progress)
         
-        # 5. Sync subscriptions with Stripe
+        # 5. Snapshot points balances (ledger checkpoint)
+        snapshot_count = snapshot_points_balances()
+        
+        # 6. Sync subscriptions with Stripe
         self.stdout.write("Syncing subscriptions with Stripe...")
         try:
             call_command('sync_subscriptions', verbosity=0)
@@ -63,12 +73,26 @@ class Command(BaseCommand):
                 self.style.ERROR(f"Error syncing subscriptions: {str(e)}")
             )
         
+        # 7. Roll family usage periods forward (after the sync, which may move paid periods)
+        rolled_count = roll_family_periods()
+        
+        # 8. Roll old usage periods into yearly totals
+        compacted_count = compact_subscription_usage(progress=self._report_progress)
+        
         self.stdout.write(
             self.style.SUCCESS(
                 f"Successfully reset {reset_count} task assignment(s), "
                 f"created/updated {created_count} recurring task(s), "
-                f"deleted {deleted_count} completed task(s), "
+                f"archived {deleted_count} completed task(s), "
                 f"cleared {cart_cleared_count} item(s) from shopping cart, "
+                f"snapshotted {snapshot_count} points balance(s), "
+                f"rolled {rolled_count} family usage period(s), "
+                f"compacted {compacted_count} old usage period(s), "
                 f"and synced subscriptions."
             )
         )
+
+    def _report_progress(self, label, done):
+        # Batched maintenance steps report after every batch (shown with -v 2)
+        if self.verbosity >= 2:
+            self.stdout.write(f"  {label}: {done} row(s) processed")
@@ -1,11 +1,12 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
+from a_tasks.history_utils import archive_tasks
 from a_tasks.models import Task
 
 
 class Command(BaseCommand):
-    help = 'Deletes tasks that have been completed for 48 hours or more'
+    help = 'Moves tasks that have been completed for 48 hours or more to task history'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,6 +17,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
         
         # Calculate the cutoff time (48 hours ago)
         cutoff_time = timezone.now() - timedelta(hours=48)
@@ -27,18 +29,17 @@ class Command(BaseCommand):
             completed_at__lt=cutoff_time
         )
         
-        count = old_tasks.count()
-        
-        if count == 0:
-            self.stdout.write(
-                self.style.SUCCESS('No tasks found that have been completed for 48+ hours.')
-            )
-            return
-        
         if dry_run:
+            count = old_tasks.count()
+            if count == 0:
+                self.stdout.write(
+                    self.style.SUCCESS('No tasks found that have been completed for 48+ hours.')
+                )
+                return
+            
             self.stdout.write(
                 self.style.WARNING(
-                    f'DRY RUN: Would delete {count} task(s) completed before {cutoff_time.strftime("%Y-%m-%d %H:%M:%S")}'
+                    f'DRY RUN: Would archive {count} task(s) completed before {cutoff_time.strftime("%Y-%m-%d %H:%M:%S")}'
                 )
             )
             for task in old_tasks[:10]:  # Show first 10 as examples
@@ -46,11 +47,19 @@ class Command(BaseCommand):
             if count > 10:
                 self.stdout.write(f'  ... and {count - 10} more')
         else:
-            # Delete the tasks
-            deleted_count, _ = old_tasks.delete()
+            # Move the tasks to history in chunks, reporting progress per chunk
+            archived_count = archive_tasks(old_tasks, progress=self._report_progress)
+            if archived_count == 0:
+                self.stdout.write(
+                    self.style.SUCCESS('No tasks found that have been completed for 48+ hours.')
+                )
+                return
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'Successfully deleted {deleted_count} task(s) that were completed 48+ hours ago.'
+                    f'Successfully archived {archived_count} task(s) that were completed 48+ hours ago.'
                 )
             )
 
+    def _report_progress(self, label, done):
+        if self.verbosity >= 2:
+            self.stdout.write(f'  {label}: {done} row(s) processed')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_tasks', '0005_add_business_daily_and_every_other_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented on every state change; used for optimistic concurrency (see state_utils)'),
+        ),
+    ]
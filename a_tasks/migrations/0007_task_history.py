@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_family', '0009_points_ledger'),
+        ('a_tasks', '0006_task_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.BigIntegerField(help_text='Primary key the task had in tasks_task')),
+                ('name', models.CharField(max_length=255)),
+                ('approved', models.BooleanField(default=False)),
+                ('points', models.PositiveIntegerField(default=0)),
+                ('priority', models.SmallIntegerField(choices=[(0, 'Low'), (1, 'Medium'), (2, 'High')], default=0)),
+                ('was_recurring', models.BooleanField(default=False)),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('completed_at', models.DateTimeField()),
+                ('approved_at', models.DateTimeField(blank=True, null=True)),
+                ('month', models.DateField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='task_history', to=settings.AUTH_USER_MODEL)),
+                ('family', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_history', to='a_family.family')),
+            ],
+            options={
+                'verbose_name': 'task history',
+                'verbose_name_plural': 'task history',
+                'db_table': 'tasks_taskhistory',
+                'ordering': ['-completed_at'],
+                'indexes': [models.Index(fields=['month', 'family'], name='tasks_taskh_month_6fcaa8_idx'), models.Index(fields=['family', 'month'], name='tasks_taskh_family__f29037_idx'), models.Index(fields=['completed_by', 'month'], name='tasks_taskh_complet_066492_idx')],
+            },
+        ),
+    ]
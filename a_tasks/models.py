@@ -49,6 +49,10 @@ class Task(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True, db_index=True)
     approved_at = models.DateTimeField(null=True, blank=True)
     started_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text='Incremented on every state change; used for optimistic concurrency (see state_utils)',
+    )
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -107,3 +111,46 @@ class TaskRecurrence(models.Model):
 
     def __str__(self):
         return f'{self.task.name} - {self.get_frequency_display()}'
+
+
+class TaskHistory(models.Model):
+    """
+    Compact, append-only archive of finished tasks.
+    Daily maintenance moves completed tasks here instead of deleting them, so
+    stats can be computed without keeping old rows in tasks_task.
+    Rows are grouped by `month` (first day of the month the task was completed).
+    """
+    task_id = models.BigIntegerField(help_text='Primary key the task had in tasks_task')
+    family = models.ForeignKey(Family, on_delete=models.CASCADE, related_name='task_history')
+    name = models.CharField(max_length=255)
+    completed_by = models.ForeignKey(
+        'a_family.User',
+        on_delete=models.SET_NULL,
+        related_name='task_history',
+        null=True,
+        blank=True,
+    )
+    approved = models.BooleanField(default=False)
+    points = models.PositiveIntegerField(default=0)
+    priority = models.SmallIntegerField(default=Task.PRIORITY_LOW, choices=Task.PRIORITY_CHOICES)
+    was_recurring = models.BooleanField(default=False)
+    due_date = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    completed_at = models.DateTimeField()
+    approved_at = models.DateTimeField(null=True, blank=True)
+    month = models.DateField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'tasks_taskhistory'
+        verbose_name = 'task history'
+        verbose_name_plural = 'task history'
+        ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['month', 'family']),
+            models.Index(fields=['family', 'month']),
+            models.Index(fields=['completed_by', 'month']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.completed_at:%Y-%m-%d})'
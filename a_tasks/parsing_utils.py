@@ -0,0 +1,175 @@
+"""
+Quick-add text parsing for tasks.
+
+The single task input, bulk quick-add (bulk_utils) and the API all use the
+same syntax: @name, !high, +50, *daily, date keywords and ^pp.kk.aaaa.
+"""
+import re
+from datetime import timedelta
+
+from django.utils import timezone
+
+from a_family.roster_utils import get_family_roster
+
+from .models import Task
+
+
+def parse_task_text(text, family, members=None):
+    """
+    Parse natural language task text to extract task details.
+    
+    Patterns:
+    - @name or @username - Assign to family member
+    - !low, !medium, !high - Set priority
+    - +50 or +points - Set points value
+    - *daily, *weekly, *monthly - Set recurring frequency
+    - Date keywords: today, tomorrow, next week, Monday, etc.
+    - Date format: ^25.12.2024 (pp.kk.aaaa) for specific dates
+    
+    members defaults to the cached family roster (a_family.roster_utils).
+    
+    Returns dict with: name, assigned_to_id, priority, points, due_date, recurring
+    """
+    if not text or not text.strip():
+        return None
+    
+    text = text.strip()
+    parsed = {
+        'name': '',
+        'assigned_to_id': None,
+        'assign_to_all_children': False,  # Flag for creating tasks for all children
+        'priority': Task.PRIORITY_MEDIUM,  # Default to medium
+        'points': 25,  # Default points
+        'due_date': None,
+        'recurring': None,
+    }
+    
+    # Extract @mentions (assignment)
+    mention_pattern = r'@(\w+)'
+    mentions = re.findall(mention_pattern, text, re.IGNORECASE)
+    if mentions:
+        mention_name = mentions[0].lower()
+        # Try to find family member by display name or username
+        family_members = members if members is not None else get_family_roster(family)
+        
+        # Handle "kõigile" or "everyone" special case - create task for each child
+        if mention_name in ['kõigile', 'everyone', 'kõik', 'all']:
+            parsed['assign_to_all_children'] = True
+            parsed['assigned_to_id'] = None
+        else:
+            # Try to find family member by display name or username
+            for member in family_members:
+                display_name = member.get_display_name().lower()
+                username = (member.username or '').lower()
+                first_name = (member.first_name or '').lower()
+                
+                if (mention_name in display_name or 
+                    mention_name == username or 
+                    mention_name == first_name):
+                    parsed['assigned_to_id'] = member.id
+                    break
+        
+        # Remove @mentions from text
+        text = re.sub(mention_pattern, '', text, flags=re.IGNORECASE).strip()
+    
+    # Extract priority (!low, !medium, !high)
+    priority_pattern = r'!(low|medium|high|madal|keskmine|kõrge)'
+    priority_match = re.search(priority_pattern, text, re.IGNORECASE)
+    if priority_match:
+        priority_str = priority_match.group(1).lower()
+        if priority_str in ['high', 'kõrge']:
+            parsed['priority'] = Task.PRIORITY_HIGH
+        elif priority_str in ['low', 'madal']:
+            parsed['priority'] = Task.PRIORITY_LOW
+        else:
+            parsed['priority'] = Task.PRIORITY_MEDIUM
+        
+        text = re.sub(priority_pattern, '', text, flags=re.IGNORECASE).strip()
+    
+    # Extract points (+50, +points)
+    points_pattern = r'\+(\d+)'
+    points_match = re.search(points_pattern, text)
+    if points_match:
+        parsed['points'] = int(points_match.group(1))
+        text = re.sub(points_pattern, '', text).strip()
+    
+    # Extract recurring (*daily, *business_daily, *every_other_day, *weekly, *monthly)
+    recurring_pattern = r'\*(daily|business_daily|every_other_day|weekly|monthly|päevaselt|tööpäevaselt|iga_teine_päev|nädalaselt|kuus)'
+    recurring_match = re.search(recurring_pattern, text, re.IGNORECASE)
+    if recurring_match:
+        recurring_str = recurring_match.group(1).lower()
+        if recurring_str in ['daily', 'päevaselt']:
+            parsed['recurring'] = 'daily'
+        elif recurring_str in ['business_daily', 'tööpäevaselt']:
+            parsed['recurring'] = 'business_daily'
+        elif recurring_str in ['every_other_day', 'iga_teine_päev']:
+            parsed['recurring'] = 'every_other_day'
+        elif recurring_str in ['weekly', 'nädalaselt']:
+            parsed['recurring'] = 'weekly'
+        elif recurring_str in ['monthly', 'kuus']:
+            parsed['recurring'] = 'monthly'
+        
+        text = re.sub(recurring_pattern, '', text, flags=re.IGNORECASE).strip()
+    
+    # Extract dates
+    today = timezone.localdate()
+    now = timezone.now()
+    
+    # Specific date format: ^25.12.2024 (Estonian format pp.kk.aaaa)
+    date_format_pattern = r'\^(\d{1,2}\.\d{1,2}\.\d{4})'
+    date_format_match = re.search(date_format_pattern, text)
+    if date_format_match:
+        try:
+            date_str = date_format_match.group(1)
+            # Parse Estonian format (dd.mm.yyyy) to date object
+            from datetime import datetime
+            date_obj = datetime.strptime(date_str, '%d.%m.%Y').date()
+            parsed['due_date'] = date_obj
+            text = re.sub(date_format_pattern, '', text).strip()
+        except (ValueError, TypeError):
+            pass
+    
+    # Date keywords (case-insensitive)
+    date_keywords = {
+        'today': today,
+        'täna': today,
+        'tomorrow': today + timedelta(days=1),
+        'homme': today + timedelta(days=1),
+        'next week': today + timedelta(days=7),
+        'järgmine nädal': today + timedelta(days=7),
+        'next month': today + timedelta(days=30),
+        'järgmine kuu': today + timedelta(days=30),
+    }
+    
+    # Weekday names (Estonian and English)
+    # Monday=0, Tuesday=1, ..., Sunday=6
+    weekdays_est = ['esmaspäev', 'teisipäev', 'kolmapäev', 'neljapäev', 'reede', 'laupäev', 'pühapäev']
+    weekdays_en = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    weekdays_est_short = ['esmasp', 'teisip', 'kolmap', 'neljap', 'reede', 'laup', 'pühap']
+    
+    for keyword, date_value in date_keywords.items():
+        if keyword.lower() in text.lower():
+            parsed['due_date'] = date_value
+            # Remove keyword from text (case-insensitive)
+            text = re.sub(re.escape(keyword), '', text, flags=re.IGNORECASE).strip()
+            break
+    
+    # Check for weekday names
+    text_lower = text.lower()
+    all_weekdays = weekdays_est + weekdays_en + weekdays_est_short
+    for i, weekday in enumerate(all_weekdays):
+        if weekday in text_lower:
+            # Find next occurrence of this weekday
+            # Map to 0-6 (Monday-Sunday)
+            weekday_index = i % 7
+            days_ahead = weekday_index - today.weekday()
+            if days_ahead <= 0:  # Target day already happened this week
+                days_ahead += 7
+            parsed['due_date'] = today + timedelta(days=days_ahead)
+            text = re.sub(weekday, '', text, flags=re.IGNORECASE).strip()
+            break
+    
+    # Clean up text: remove extra spaces, trim
+    parsed['name'] = ' '.join(text.split())
+    
+    return parsed
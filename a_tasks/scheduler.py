@@ -6,6 +6,8 @@ import logging
 import atexit
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from django.conf import settings
 from django.utils import timezone
 import pytz
 
@@ -15,6 +17,9 @@ from a_tasks.maintenance import (
     clear_shopping_cart,
     reset_assigned_to_for_all_tasks,
 )
+from a_family.points_utils import snapshot_points_balances
+from a_subscription.retention_utils import compact_subscription_usage
+from a_subscription.utils import roll_family_periods
 from django.core.management import call_command
 
 logger = logging.getLogger(__name__)
@@ -45,6 +50,28 @@ def start_scheduler():
         replace_existing=True
     )
     
+    # Drain the Stripe webhook inbox (webhooks only store events)
+    scheduler.add_job(
+        run_stripe_event_worker,
+        trigger=IntervalTrigger(seconds=settings.STRIPE_EVENT_POLL_SECONDS),
+        id='stripe_event_worker',
+        name='Process stored Stripe webhook events',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    
+    # Purge families and accounts queued for deletion
+    scheduler.add_job(
+        run_deletion_worker,
+        trigger=IntervalTrigger(seconds=settings.DELETION_POLL_SECONDS),
+        id='deletion_worker',
+        name='Purge families and accounts pending deletion',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    
     scheduler.start()
     logger.info("Daily maintenance scheduler started - will run at 00:00 Tallinn time every day")
     
@@ -69,15 +96,19 @@ def run_daily_maintenance():
         created_count = create_recurring_tasks_for_today(today)
         logger.info(f"Created/updated {created_count} recurring task(s) for {today}")
         
-        # 3. Delete all completed tasks
+        # 3. Move completed tasks to task history
         deleted_count = delete_completed_tasks()
-        logger.info(f"Deleted {deleted_count} completed task(s)")
+        logger.info(f"Archived {deleted_count} completed task(s)")
         
         # 4. Clear shopping cart
         cart_cleared_count = clear_shopping_cart()
         logger.info(f"Cleared {cart_cleared_count} item(s) from shopping cart")
         
-        # 5. Sync subscriptions with Stripe
+        # 5. Snapshot points balances (ledger checkpoint)
+        snapshot_count = snapshot_points_balances()
+        logger.info(f"Created {snapshot_count} points balance snapshot(s)")
+        
+        # 6. Sync subscriptions with Stripe
         logger.info("Syncing subscriptions with Stripe...")
         try:
             call_command('sync_subscriptions', verbosity=0)
@@ -85,12 +116,38 @@ def run_daily_maintenance():
         except Exception as e:
             logger.error(f"Error syncing subscriptions: {e}", exc_info=True)
         
+        # 7. Roll family usage periods forward (after the sync, which may move paid periods)
+        rolled_count = roll_family_periods()
+        logger.info(f"Rolled {rolled_count} family usage period(s)")
+        
+        # 8. Roll old usage periods into yearly totals
+        compacted_count = compact_subscription_usage()
+        logger.info(f"Compacted {compacted_count} old usage period(s)")
+        
         logger.info("=" * 60)
         logger.info(f"Daily maintenance completed successfully at {timezone.now()}")
     except Exception as e:
         logger.error(f"Error running scheduled daily maintenance: {e}", exc_info=True)
 
 
+def run_stripe_event_worker():
+    """Process pending Stripe webhook events"""
+    try:
+        from a_subscription.events import process_inbox
+        process_inbox()
+    except Exception as e:
+        logger.error(f"Error processing Stripe events: {e}", exc_info=True)
+
+
+def run_deletion_worker():
+    """Purge families and accounts marked for deletion"""
+    try:
+        from a_family.deletion_utils import purge_pending_deletions
+        purge_pending_deletions()
+    except Exception as e:
+        logger.error(f"Error purging pending deletions: {e}", exc_info=True)
+
+
 def shutdown_scheduler():
     """Shutdown the scheduler gracefully"""
     global scheduler
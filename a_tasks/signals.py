@@ -1,5 +1,5 @@
 import logging
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
@@ -43,3 +43,29 @@ def cleanup_previous_task_state(sender, instance, created, **kwargs):
         _previous_task_state.clear()
         logger.warning("Cleared _previous_task_state dictionary to prevent memory leak")
 
+
+
+def _recurrence_family_id(recurrence):
+    """Family id of a recurrence's task, without loading the task if it is not cached."""
+    if TaskRecurrence.task.is_cached(recurrence):
+        return recurrence.task.family_id
+    return Task.objects.filter(pk=recurrence.task_id).values_list('family_id', flat=True).first()
+
+
+@receiver(post_save, sender=TaskRecurrence)
+def count_created_recurrence(sender, instance, created, raw=False, **kwargs):
+    """Keep Family.active_recurrences in step when a recurrence is created"""
+    if not created or raw:
+        return
+    from a_subscription.utils import adjust_recurrence_count
+    adjust_recurrence_count(_recurrence_family_id(instance), 1)
+
+
+@receiver(post_delete, sender=TaskRecurrence)
+def count_deleted_recurrence(sender, instance, **kwargs):
+    """
+    Keep Family.active_recurrences in step when a recurrence is deleted.
+    Also runs for recurrences removed by a task or family cascade delete.
+    """
+    from a_subscription.utils import adjust_recurrence_count
+    adjust_recurrence_count(_recurrence_family_id(instance), -1)
@@ -0,0 +1,349 @@
+"""
+Task state machine shared by the HTML views (a_tasks.views) and the JSON API (a_api.views).
+
+Transitions use optimistic concurrency instead of row locks: the task is read,
+validated, and then written with a conditional
+    UPDATE tasks_task SET ..., version = version + 1 WHERE id = ? AND version = ?
+If another request changed the task in between, the update matches no row and
+the task is re-read so the caller gets a precise result (for example
+"already approved" instead of a generic error).
+
+Every transition returns a tuple (result, task), where result is one of the
+RESULT_* constants below and task is the latest known Task instance (or None).
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from a_family.models import PointsTransaction
+from a_family.points_utils import add_points, add_points_batch, deduct_points
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+RESULT_OK = 'ok'
+RESULT_NOT_FOUND = 'not_found'
+RESULT_CONFLICT = 'conflict'
+RESULT_ALREADY_COMPLETED = 'already_completed'
+RESULT_ALREADY_APPROVED = 'already_approved'
+RESULT_ALREADY_STARTED = 'already_started'
+RESULT_ASSIGNED_TO_OTHER = 'assigned_to_other'
+RESULT_NOT_STARTED_BY_USER = 'not_started_by_user'
+RESULT_NOT_COMPLETED = 'not_completed'
+RESULT_NOT_APPROVED = 'not_approved'
+RESULT_NO_ASSIGNEE = 'no_assignee'
+
+# Estonian messages for the HTML views
+RESULT_MESSAGES = {
+    RESULT_CONFLICT: "Ülesannet muudeti samal ajal. Värskenda lehte ja proovi uuesti.",
+    RESULT_ALREADY_COMPLETED: "See ülesanne on juba täidetud.",
+    RESULT_ALREADY_APPROVED: "See ülesanne on juba kinnitatud.",
+    RESULT_ALREADY_STARTED: "See ülesanne on juba teise lapse poolt alustatud.",
+    RESULT_ASSIGNED_TO_OTHER: "See ülesanne on määratud teisele lapsele.",
+    RESULT_NOT_STARTED_BY_USER: "Sa saad muuta ainult enda alustatud ülesandeid.",
+    RESULT_NOT_COMPLETED: "Saab kinnitada ainult täidetud ülesandeid.",
+    RESULT_NOT_APPROVED: "See ülesanne pole kinnitatud.",
+    RESULT_NO_ASSIGNEE: "Ülesandel pole määratud täitjat.",
+}
+
+# (error message, HTTP status) for the JSON API
+RESULT_API_ERRORS = {
+    RESULT_NOT_FOUND: ('Task not found', 404),
+    RESULT_CONFLICT: ('Task was modified concurrently, reload and retry', 409),
+    RESULT_ALREADY_COMPLETED: ('Task already completed', 400),
+    RESULT_ALREADY_APPROVED: ('Task already approved', 400),
+    RESULT_ALREADY_STARTED: ('Task already in progress', 400),
+    RESULT_ASSIGNED_TO_OTHER: ('Task assigned to another user', 403),
+    RESULT_NOT_STARTED_BY_USER: ('You can only change tasks you started', 403),
+    RESULT_NOT_COMPLETED: ('Task is not completed', 400),
+    RESULT_NOT_APPROVED: ('Task is not approved', 400),
+    RESULT_NO_ASSIGNEE: ('Task has no assignee', 400),
+}
+
+
+def _load_task(family, task_id):
+    return Task.objects.filter(family=family, id=task_id).select_related(
+        'assigned_to', 'completed_by'
+    ).first()
+
+
+def _transition(family, task_id, check, get_changes, on_success=None, expected_version=None):
+    """
+    Run one optimistic state transition.
+
+    Args:
+        family: Family the task must belong to
+        task_id: Task id
+        check: callable(task) -> None if the transition is allowed, else a RESULT_* constant
+        get_changes: callable(task) -> dict of field values to write
+        on_success: optional callable(task) run in the same transaction after the update
+        expected_version: version the client last saw; a mismatch is reported as a conflict
+
+    Returns:
+        tuple: (result, task)
+    """
+    task = _load_task(family, task_id)
+    if not task:
+        return RESULT_NOT_FOUND, None
+
+    if expected_version is not None and expected_version != task.version:
+        return check(task) or RESULT_CONFLICT, task
+
+    error = check(task)
+    if error:
+        return error, task
+
+    changes = get_changes(task)
+    changes['updated_at'] = timezone.now()
+    with transaction.atomic():
+        updated = Task.objects.filter(id=task.id, version=task.version).update(
+            version=F('version') + 1,
+            **changes
+        )
+        if updated and on_success:
+            on_success(task)
+
+    if not updated:
+        # Someone else won the race: report what happened to the task
+        latest = _load_task(family, task_id)
+        if not latest:
+            return RESULT_NOT_FOUND, None
+        logger.info(f"Task {task_id} version conflict (expected {task.version}, now {latest.version})")
+        return check(latest) or RESULT_CONFLICT, latest
+
+    for field, value in changes.items():
+        setattr(task, field, value)
+    task.version += 1
+    return RESULT_OK, task
+
+
+def start_task(family, task_id, user, expected_version=None):
+    """Child starts working on a task."""
+    def check(task):
+        if task.completed:
+            return RESULT_ALREADY_COMPLETED
+        if task.approved:
+            return RESULT_ALREADY_APPROVED
+        if task.is_in_progress:
+            return RESULT_ALREADY_STARTED
+        if task.assigned_to_id and task.assigned_to_id != user.id:
+            return RESULT_ASSIGNED_TO_OTHER
+        return None
+
+    return _transition(
+        family, task_id, check,
+        lambda task: {'assigned_to': user, 'started_at': timezone.now()},
+        expected_version=expected_version,
+    )
+
+
+def cancel_task(family, task_id, user, expected_version=None):
+    """Child stops working on a task they started."""
+    def check(task):
+        if task.completed:
+            return RESULT_ALREADY_COMPLETED
+        if not task.is_in_progress or task.assigned_to_id != user.id:
+            return RESULT_NOT_STARTED_BY_USER
+        return None
+
+    return _transition(
+        family, task_id, check,
+        lambda task: {'assigned_to': None, 'started_at': None},
+        expected_version=expected_version,
+    )
+
+
+def complete_task(family, task_id, user, expected_version=None):
+    """Child marks a task they started as done. started_at is kept for history."""
+    def check(task):
+        if task.completed:
+            return RESULT_ALREADY_COMPLETED
+        if not task.is_in_progress or task.assigned_to_id != user.id:
+            return RESULT_NOT_STARTED_BY_USER
+        return None
+
+    return _transition(
+        family, task_id, check,
+        lambda task: {
+            'completed': True,
+            'completed_by': user,
+            'completed_at': timezone.now(),
+            'approved': False,
+            'approved_by': None,
+            'approved_at': None,
+        },
+        expected_version=expected_version,
+    )
+
+
+def approve_task(family, task_id, user, expected_version=None):
+    """Parent approves a completed task; points are added to the assignee."""
+    def check(task):
+        if not task.completed:
+            return RESULT_NOT_COMPLETED
+        if task.approved:
+            return RESULT_ALREADY_APPROVED
+        if not (task.assigned_to or task.completed_by):
+            return RESULT_NO_ASSIGNEE
+        return None
+
+    def on_success(task):
+        add_points(task.assigned_to or task.completed_by, task.points, PointsTransaction.REASON_TASK_APPROVED,
+                   family=family, task=task, created_by=user)
+
+    return _transition(
+        family, task_id, check,
+        lambda task: {'approved': True, 'approved_by': user, 'approved_at': timezone.now()},
+        on_success=on_success,
+        expected_version=expected_version,
+    )
+
+
+def unapprove_task(family, task_id, user, expected_version=None):
+    """Parent withdraws an approval; points are removed from the assignee."""
+    def check(task):
+        if not task.approved:
+            return RESULT_NOT_APPROVED
+        return None
+
+    def on_success(task):
+        assignee = task.assigned_to or task.completed_by
+        if assignee:
+            deduct_points(assignee, task.points, PointsTransaction.REASON_TASK_UNAPPROVED,
+                          family=family, task=task, created_by=user)
+
+    return _transition(
+        family, task_id, check,
+        lambda task: {'approved': False, 'approved_by': None, 'approved_at': None},
+        on_success=on_success,
+        expected_version=expected_version,
+    )
+
+
+def reopen_task(family, task_id, user, expected_version=None):
+    """Parent sends a completed task back to the open list; approved points are removed."""
+    def check(task):
+        if not task.completed:
+            return RESULT_NOT_COMPLETED
+        return None
+
+    def on_success(task):
+        if task.approved:
+            assignee = task.assigned_to or task.completed_by
+            if assignee:
+                deduct_points(assignee, task.points, PointsTransaction.REASON_TASK_REOPENED,
+                              family=family, task=task, created_by=user)
+
+    return _transition(
+        family, task_id, check,
+        lambda task: {
+            'completed': False,
+            'completed_by': None,
+            'completed_at': None,
+            'approved': False,
+            'approved_by': None,
+            'approved_at': None,
+            'started_at': None,
+            'assigned_to': None,
+        },
+        on_success=on_success,
+        expected_version=expected_version,
+    )
+
+
+# Upper bound for tasks accepted in one bulk approve/reject request
+MAX_BULK_TASKS = 200
+
+# Completed tasks waiting for a parent's decision
+PENDING_APPROVAL = Q(completed=True, approved=False)
+
+
+def _bulk_transition(family, task_ids, eligible, changes):
+    """
+    Apply one transition to many tasks with a single UPDATE.
+
+    Must run inside transaction.atomic(). The eligible tasks are locked with
+    SELECT ... FOR UPDATE, so a concurrent transition either finished before
+    (and the task is no longer eligible) or waits until this one commits.
+    The locked rows are then updated by id.
+
+    Returns:
+        tuple: (updated_tasks: list, skipped_ids: list)
+    """
+    task_ids = list(dict.fromkeys(task_ids))[:MAX_BULK_TASKS]
+    candidates = list(
+        Task.objects.select_for_update(of=('self',)).filter(
+            eligible, family=family, id__in=task_ids
+        ).select_related('assigned_to', 'completed_by').order_by('id')
+    )
+    candidate_ids = {task.id for task in candidates}
+    skipped_ids = [task_id for task_id in task_ids if task_id not in candidate_ids]
+    if not candidates:
+        return [], skipped_ids
+
+    Task.objects.filter(id__in=candidate_ids).update(version=F('version') + 1, **changes)
+
+    for task in candidates:
+        for field, value in changes.items():
+            setattr(task, field, value)
+        task.version += 1
+    return candidates, skipped_ids
+
+
+def bulk_approve_tasks(family, task_ids, user):
+    """
+    Approve many completed tasks in one transaction.
+
+    Point increments are grouped per assignee (one UPDATE each) and the ledger
+    gets one row per task. Tasks without an assignee are skipped, like in approve_task.
+
+    Returns:
+        tuple: (approved_by_assignee: dict {User: [Task, ...]}, skipped_ids: list)
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        approved, skipped_ids = _bulk_transition(
+            family,
+            task_ids,
+            PENDING_APPROVAL & (Q(assigned_to__isnull=False) | Q(completed_by__isnull=False)),
+            {'approved': True, 'approved_by': user, 'approved_at': now, 'updated_at': now},
+        )
+
+        approved_by_assignee = {}
+        entries = []
+        for task in approved:
+            assignee = task.assigned_to or task.completed_by
+            approved_by_assignee.setdefault(assignee, []).append(task)
+            entries.append((assignee.id, task.points, task))
+
+        add_points_batch(entries, PointsTransaction.REASON_TASK_APPROVED, family=family, created_by=user)
+
+    return approved_by_assignee, skipped_ids
+
+
+def bulk_reject_tasks(family, task_ids, user):
+    """
+    Send many completed, not yet approved tasks back to the open list.
+    No points are involved because only unapproved tasks are rejected.
+
+    Returns:
+        tuple: (rejected_tasks: list, skipped_ids: list)
+    """
+    with transaction.atomic():
+        return _bulk_transition(
+            family,
+            task_ids,
+            PENDING_APPROVAL,
+            {
+                'completed': False,
+                'completed_by': None,
+                'completed_at': None,
+                'started_at': None,
+                'assigned_to': None,
+                'updated_at': timezone.now(),
+            },
+        )
@@ -224,3 +224,663 @@ class TaskRecurrenceModelTest(TestCase):
         self.task.delete()
         
         self.assertFalse(TaskRecurrence.objects.filter(id=recurrence_id).exists())
+
+
+class BulkCreateTasksTest(TestCase):
+    """Test bulk quick-add of tasks"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='emma',
+            email='emma@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD,
+            first_name='Emma'
+        )
+        self.family = Family.objects.create(
+            name='Test Family',
+            owner=self.parent
+        )
+        self.family.members.add(self.child)
+    
+    def test_split_pasted_lines(self):
+        """Test that empty lines and bullets are stripped"""
+        from _core.text_utils import split_pasted_lines
+        
+        lines = split_pasted_lines("- Pese nõud\n\n• Korista tuba\n  *daily Kasta lilli  \n")
+        self.assertEqual(lines, ['Pese nõud', 'Korista tuba', '*daily Kasta lilli'])
+    
+    def test_bulk_create_tasks(self):
+        """Test creating several tasks, recurrences and usage in one call"""
+        from a_subscription.utils import get_current_month_usage
+        from .bulk_utils import bulk_create_tasks
+        
+        result = bulk_create_tasks(self.family, self.parent, [
+            'Pese nõud @emma +10',
+            'Korista tuba *weekly',
+            '@parent Vii prügi välja',
+        ])
+        
+        self.assertIsNone(result['limit_error'])
+        self.assertEqual(len(result['created']), 2)
+        self.assertEqual(len(result['skipped']), 1)
+        
+        dishes = Task.objects.get(family=self.family, name='Pese nõud')
+        self.assertEqual(dishes.assigned_to, self.child)
+        self.assertEqual(dishes.points, 10)
+        self.assertTrue(TaskRecurrence.objects.filter(task__name='Korista tuba').exists())
+        self.assertEqual(get_current_month_usage(self.family).tasks_created, 2)
+    
+    def test_bulk_create_tasks_respects_limit(self):
+        """Test that the whole batch is rejected when it exceeds the monthly limit"""
+        from a_subscription.utils import get_current_month_usage
+        from .bulk_utils import bulk_create_tasks
+        
+        usage = get_current_month_usage(self.family)
+        usage.tasks_created = 29
+        usage.save()
+        
+        result = bulk_create_tasks(self.family, self.parent, ['Üks', 'Kaks'])
+        
+        self.assertEqual(result['limit_error']['resource'], 'tasks')
+        self.assertEqual(result['created'], [])
+        self.assertFalse(Task.objects.filter(family=self.family).exists())
+    
+    def test_invalid_assignee_releases_quota(self):
+        """Test that a task refused for its assignee does not use up quota"""
+        from django.urls import reverse
+        from a_subscription.models import SubscriptionUsage
+        
+        self.client.force_login(self.parent)
+        self.client.post(reverse('a_tasks:index'), {
+            'action': 'create',
+            'name': 'Vii prügi välja',
+            'assigned_to': str(self.parent.id),
+        })
+        
+        self.assertFalse(Task.objects.filter(family=self.family).exists())
+        usage = SubscriptionUsage.objects.filter(family=self.family).first()
+        self.assertEqual(usage.tasks_created if usage else 0, 0)
+
+
+
+class TaskImportTest(TestCase):
+    """Test importing tasks and rewards from a file"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='emma',
+            email='emma@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD,
+            first_name='Emma'
+        )
+        self.family = Family.objects.create(
+            name='Test Family',
+            owner=self.parent
+        )
+        self.family.members.add(self.child)
+    
+    def _import(self, name, content, batch_size=500):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .import_utils import import_family_data, iter_import_rows
+        
+        uploaded = SimpleUploadedFile(name, content.encode('utf-8'))
+        return import_family_data(self.family, self.parent, iter_import_rows(uploaded), batch_size=batch_size)
+    
+    def test_csv_import_with_error_report(self):
+        """Test valid rows are imported and invalid rows reported by line"""
+        from a_rewards.models import Reward
+        
+        result = self._import('kodutööd.csv', (
+            'tüüp;nimi;punktid;prioriteet;tähtaeg;määratud;kordus\n'
+            ';Pese nõud;10;kõrge;24.12.2030;Emma;\n'
+            'task;Korista tuba;;;;;nädalaselt\n'
+            'task;Vii prügi välja;;;;Mari;\n'
+            'reward;Kino;100;;;;\n'
+            'reward;Jäätis;;;;;\n'
+        ), batch_size=2)
+        
+        self.assertEqual(result['rows'], 5)
+        self.assertEqual(result['tasks_created'], 2)
+        self.assertEqual(result['recurrences_created'], 1)
+        self.assertEqual(result['rewards_created'], 1)
+        self.assertEqual([row for row, _ in result['errors']], [4, 6])
+        
+        dishes = Task.objects.get(family=self.family, name='Pese nõud')
+        self.assertEqual(dishes.assigned_to, self.child)
+        self.assertEqual(dishes.priority, Task.PRIORITY_HIGH)
+        self.assertEqual(dishes.due_date, date(2030, 12, 24))
+        self.assertTrue(Reward.objects.filter(family=self.family, name='Kino', points=100).exists())
+        self.family.refresh_from_db()
+        self.assertEqual(self.family.active_recurrences, 1)
+    
+    def test_import_respects_quota(self):
+        """Test rows beyond the monthly limit are reported, the rest imported"""
+        from a_subscription.utils import get_current_month_usage
+        
+        usage = get_current_month_usage(self.family)
+        usage.tasks_created = 29
+        usage.save()
+        
+        result = self._import('tasks.json', '[{"name": "Üks"}, {"name": "Kaks"}]')
+        
+        self.assertEqual(result['tasks_created'], 1)
+        self.assertEqual(result['errors'], [(2, 'Kuu ülesannete limiit on täis.')])
+    
+    def test_import_api(self):
+        """Test the JSON API upload endpoint"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.urls import reverse
+        
+        self.client.force_login(self.parent)
+        upload = SimpleUploadedFile('tasks.ndjson', b'{"name": "Kasta lilli"}\nnot json\n')
+        response = self.client.post(reverse('a_api:import_data'), {'file': upload})
+        
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['tasks_created'], 1)
+        self.assertEqual(data['errors'][0]['row'], 2)
+        
+        response = self.client.post(reverse('a_api:import_data'), {'file': SimpleUploadedFile('tasks.xlsx', b'x')})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_unreadable_file_keeps_imported_batches(self):
+        """Test an encoding error mid-file is reported with the rows imported before it"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .import_utils import import_family_data, iter_import_rows
+        
+        content = 'tüüp;nimi\n' + ''.join(f'task;Ülesanne number {i:04d}\n' for i in range(400))
+        uploaded = SimpleUploadedFile('tasks.csv', content.encode('utf-8') + b'task;\xff\xfe\n')
+        result = import_family_data(self.family, self.parent, iter_import_rows(uploaded), batch_size=100)
+        
+        # FREE tier allows 30 tasks a month
+        self.assertEqual(result['tasks_created'], 30)
+        self.assertGreater(result['rows'], 0)
+        row, message = result['errors'][0]
+        self.assertIsNone(row)
+        self.assertIn('UTF-8', message)
+        self.assertIn(f"pärast {result['rows']} rida", message)
+    
+    def test_oversized_csv_cell_and_points(self):
+        """Test an unreadable CSV cell is a file-level error and huge points a row error"""
+        result = self._import('tasks.csv', (
+            'nimi;punktid\n'
+            'Pese nõud;5000000000\n'
+            'Korista tuba;10\n'
+            f'{"x" * 200000};1\n'
+        ))
+        
+        self.assertEqual(result['tasks_created'], 1)
+        self.assertEqual(result['errors'][0][0], None)
+        self.assertIn('CSV-faili rida', result['errors'][0][1])
+        self.assertEqual(result['errors'][1][0], 2)
+
+
+class TaskStateMachineTest(TestCase):
+    """Test optimistic task state transitions"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.other_child = User.objects.create_user(
+            username='other',
+            email='other@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.child, self.other_child)
+        self.task = Task.objects.create(
+            name='Nõud',
+            family=self.family,
+            created_by=self.parent,
+            points=20
+        )
+
+    def test_full_lifecycle(self):
+        """Test start -> complete -> approve -> unapprove -> reopen"""
+        from . import state_utils
+
+        result, task = state_utils.start_task(self.family, self.task.id, self.child)
+        self.assertEqual(result, state_utils.RESULT_OK)
+        result, task = state_utils.complete_task(self.family, self.task.id, self.child)
+        self.assertEqual(result, state_utils.RESULT_OK)
+        result, task = state_utils.approve_task(self.family, self.task.id, self.parent)
+        self.assertEqual(result, state_utils.RESULT_OK)
+        self.assertEqual(task.version, 3)
+
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 20)
+
+        result, _ = state_utils.unapprove_task(self.family, self.task.id, self.parent)
+        self.assertEqual(result, state_utils.RESULT_OK)
+        result, task = state_utils.reopen_task(self.family, self.task.id, self.parent)
+        self.assertEqual(result, state_utils.RESULT_OK)
+
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.completed)
+        self.assertIsNone(self.task.assigned_to)
+        self.assertEqual(self.task.version, 5)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 0)
+
+    def test_invalid_transitions_return_precise_result(self):
+        """Test invalid transitions report why they were rejected"""
+        from . import state_utils
+
+        state_utils.start_task(self.family, self.task.id, self.child)
+        result, _ = state_utils.start_task(self.family, self.task.id, self.other_child)
+        self.assertEqual(result, state_utils.RESULT_ALREADY_STARTED)
+        result, _ = state_utils.complete_task(self.family, self.task.id, self.other_child)
+        self.assertEqual(result, state_utils.RESULT_NOT_STARTED_BY_USER)
+        result, _ = state_utils.approve_task(self.family, self.task.id, self.parent)
+        self.assertEqual(result, state_utils.RESULT_NOT_COMPLETED)
+        result, task = state_utils.approve_task(self.family, 999999, self.parent)
+        self.assertEqual(result, state_utils.RESULT_NOT_FOUND)
+        self.assertIsNone(task)
+
+    def test_stale_version_is_rejected(self):
+        """Test approval with a stale version is a conflict and awards no points"""
+        from . import state_utils
+
+        state_utils.start_task(self.family, self.task.id, self.child)
+        result, task = state_utils.complete_task(self.family, self.task.id, self.child)
+        seen_version = task.version
+
+        # Parent edits points after the approval page was rendered
+        Task.objects.filter(id=self.task.id).update(points=500, version=seen_version + 1)
+
+        result, task = state_utils.approve_task(self.family, self.task.id, self.parent,
+                                                expected_version=seen_version)
+        self.assertEqual(result, state_utils.RESULT_CONFLICT)
+        self.assertEqual(task.version, seen_version + 1)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 0)
+
+        # Retrying with the latest version succeeds exactly once
+        result, _ = state_utils.approve_task(self.family, self.task.id, self.parent,
+                                             expected_version=task.version)
+        self.assertEqual(result, state_utils.RESULT_OK)
+        result, _ = state_utils.approve_task(self.family, self.task.id, self.parent)
+        self.assertEqual(result, state_utils.RESULT_ALREADY_APPROVED)
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.points, 500)
+
+    def test_edit_with_stale_version_is_rejected(self):
+        """Test an edit of a task started since the form was opened reports a conflict"""
+        from django.urls import reverse
+        from . import state_utils
+
+        seen_version = self.task.version
+        state_utils.start_task(self.family, self.task.id, self.child)
+
+        self.client.force_login(self.parent)
+        response = self.client.post(reverse('a_tasks:index'), {
+            'action': 'update',
+            'task_id': self.task.id,
+            'version': seen_version,
+            'name': 'Nõud ja pott',
+            'assigned_to': self.child.id,
+        }, follow=True)
+
+        self.assertIn(state_utils.RESULT_MESSAGES[state_utils.RESULT_CONFLICT],
+                      [str(message) for message in response.context['messages']])
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.name, 'Nõud')
+        self.assertIsNotNone(self.task.started_at)
+
+        response = self.client.post(reverse('a_tasks:index'), {
+            'action': 'update',
+            'task_id': self.task.id,
+            'version': self.task.version,
+            'name': 'Nõud ja pott',
+            'assigned_to': self.child.id,
+        })
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.name, 'Nõud ja pott')
+        self.assertEqual(self.task.version, seen_version + 2)
+
+    def test_api_edit_keeps_concurrent_transition(self):
+        """Test an API edit of a task read before an approval does not revert it"""
+        import json
+        from unittest import mock
+        from django.urls import reverse
+        from . import state_utils
+
+        state_utils.start_task(self.family, self.task.id, self.child)
+        state_utils.complete_task(self.family, self.task.id, self.child)
+        stale = Task.objects.get(pk=self.task.pk)
+        state_utils.approve_task(self.family, self.task.id, self.parent)
+
+        self.client.force_login(self.parent)
+        with mock.patch('a_api.views.Task.objects.filter') as task_filter:
+            task_filter.return_value.first.return_value = stale
+            response = self.client.put(
+                reverse('a_api:update_task', args=[self.task.id]),
+                json.dumps({'name': 'Nõud ja pott'}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 4)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.name, 'Nõud ja pott')
+        self.assertTrue(self.task.approved)
+        self.assertTrue(self.task.completed)
+
+class BulkApprovalTest(TestCase):
+    """Test bulk approve and reject of pending tasks"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.emma = User.objects.create_user(
+            username='emma',
+            email='emma@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.tom = User.objects.create_user(
+            username='tom',
+            email='tom@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.emma, self.tom)
+
+    def _completed_task(self, name, child, points):
+        return Task.objects.create(
+            name=name,
+            family=self.family,
+            created_by=self.parent,
+            assigned_to=child,
+            completed=True,
+            completed_by=child,
+            completed_at=timezone.now(),
+            points=points
+        )
+
+    def test_bulk_approve_groups_points_per_child(self):
+        """Test approving many tasks adds points once per child and skips ineligible tasks"""
+        from a_family.models import PointsTransaction
+        from .state_utils import bulk_approve_tasks
+
+        tasks = [
+            self._completed_task('Nõud', self.emma, 10),
+            self._completed_task('Prügi', self.emma, 15),
+            self._completed_task('Tolm', self.tom, 5),
+        ]
+        open_task = Task.objects.create(name='Avatud', family=self.family, created_by=self.parent, points=50)
+
+        approved_by_assignee, skipped_ids = bulk_approve_tasks(
+            self.family, [task.id for task in tasks] + [open_task.id], self.parent
+        )
+
+        self.assertEqual(skipped_ids, [open_task.id])
+        self.assertEqual(len(approved_by_assignee[self.emma]), 2)
+        self.assertEqual(len(approved_by_assignee[self.tom]), 1)
+        self.emma.refresh_from_db()
+        self.tom.refresh_from_db()
+        self.assertEqual(self.emma.points, 25)
+        self.assertEqual(self.tom.points, 5)
+        self.assertEqual(Task.objects.filter(approved=True).count(), 3)
+        # Ledger keeps one row per task
+        self.assertEqual(PointsTransaction.objects.filter(reason=PointsTransaction.REASON_TASK_APPROVED).count(), 3)
+
+        # Approving again changes nothing
+        approved_by_assignee, skipped_ids = bulk_approve_tasks(self.family, [task.id for task in tasks], self.parent)
+        self.assertEqual(approved_by_assignee, {})
+        self.assertEqual(len(skipped_ids), 3)
+        self.emma.refresh_from_db()
+        self.assertEqual(self.emma.points, 25)
+
+    def test_bulk_reject_reopens_pending_tasks(self):
+        """Test rejecting sends pending tasks back to the open list"""
+        from .state_utils import bulk_reject_tasks
+
+        pending = self._completed_task('Nõud', self.emma, 10)
+        rejected, skipped_ids = bulk_reject_tasks(self.family, [pending.id], self.parent)
+
+        self.assertEqual([task.id for task in rejected], [pending.id])
+        self.assertEqual(skipped_ids, [])
+        pending.refresh_from_db()
+        self.assertFalse(pending.completed)
+        self.assertIsNone(pending.assigned_to)
+        self.assertEqual(pending.version, 1)
+
+
+class TaskHistoryArchiveTest(TestCase):
+    """Test moving finished tasks to TaskHistory"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.family.members.add(self.child)
+
+    def test_delete_completed_tasks_archives_in_chunks(self):
+        """Test approved tasks are moved to history and open tasks stay"""
+        from .history_utils import archive_tasks, get_completed_task_count
+        from .models import TaskHistory
+
+        completed_at = timezone.now() - timedelta(hours=1)
+        for i in range(5):
+            Task.objects.create(
+                name=f'Tehtud {i}',
+                family=self.family,
+                created_by=self.parent,
+                completed=True,
+                completed_by=self.child,
+                completed_at=completed_at,
+                approved=True,
+                approved_at=completed_at,
+                points=10
+            )
+        open_task = Task.objects.create(name='Avatud', family=self.family, created_by=self.parent)
+
+        archived = archive_tasks(Task.objects.filter(approved=True), chunk_size=2)
+
+        self.assertEqual(archived, 5)
+        self.assertEqual(list(Task.objects.values_list('id', flat=True)), [open_task.id])
+        self.assertEqual(TaskHistory.objects.filter(family=self.family, completed_by=self.child).count(), 5)
+        history = TaskHistory.objects.first()
+        self.assertEqual(history.month, timezone.localtime(completed_at).date().replace(day=1))
+        self.assertEqual(history.points, 10)
+        self.assertEqual(get_completed_task_count(timezone.now() - timedelta(days=1), family=self.family), 5)
+
+    def test_maintenance_uses_archive(self):
+        """Test daily maintenance archives instead of deleting"""
+        from .maintenance import delete_completed_tasks
+        from .models import TaskHistory
+
+        Task.objects.create(
+            name='Tehtud',
+            family=self.family,
+            created_by=self.parent,
+            completed=True,
+            completed_by=self.child,
+            completed_at=timezone.now(),
+            approved=True
+        )
+
+        self.assertEqual(delete_completed_tasks(), 1)
+        self.assertEqual(Task.objects.count(), 0)
+        self.assertEqual(TaskHistory.objects.count(), 1)
+
+
+class MaintenanceBatchTest(TestCase):
+    """Test chunked maintenance batch executor"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.child = User.objects.create_user(
+            username='child',
+            email='child@test.com',
+            password='testpass123',
+            role=User.ROLE_CHILD
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+
+    def test_batch_update_and_progress(self):
+        """Test updates run in batches and report progress after each one"""
+        from .batch_utils import batch_update
+
+        for i in range(5):
+            Task.objects.create(name=f'T{i}', family=self.family, created_by=self.parent, assigned_to=self.child)
+        Task.objects.create(name='Tehtud', family=self.family, created_by=self.parent,
+                            assigned_to=self.child, completed=True)
+
+        reports = []
+        updated = batch_update(
+            Task.objects.filter(completed=False, assigned_to__isnull=False),
+            {'assigned_to': None},
+            batch_size=2,
+            sleep_seconds=0,
+            progress=lambda label, done: reports.append(done),
+        )
+
+        self.assertEqual(updated, 5)
+        self.assertEqual(reports, [2, 4, 5])
+        self.assertEqual(Task.objects.filter(assigned_to__isnull=False).count(), 1)
+
+    def test_clear_shopping_cart_raw_batches(self):
+        """Test shopping cart is cleared with batched raw deletes"""
+        from a_shopping.models import ShoppingListItem
+        from .batch_utils import batch_delete
+
+        for i in range(5):
+            ShoppingListItem.objects.create(name=f'Ese {i}', family=self.family, added_by=self.parent, in_cart=True)
+        ShoppingListItem.objects.create(name='Piim', family=self.family, added_by=self.parent)
+
+        deleted = batch_delete(ShoppingListItem.objects.filter(in_cart=True), batch_size=2, sleep_seconds=0, raw=True)
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(list(ShoppingListItem.objects.values_list('name', flat=True)), ['Piim'])
+
+    def test_batch_delete_rechecks_filter(self):
+        """Test rows that stop matching after the pk scan are not deleted"""
+        from unittest import mock
+        from a_shopping.models import ShoppingListItem
+        from . import batch_utils
+
+        items = [
+            ShoppingListItem.objects.create(name=f'Ese {i}', family=self.family, added_by=self.parent, in_cart=True)
+            for i in range(3)
+        ]
+        scan = batch_utils.iter_pk_batches
+
+        def scan_then_uncart(*args):
+            # An item is taken out of the cart between the pk scan and the delete
+            for pks in scan(*args):
+                ShoppingListItem.objects.filter(pk=items[1].pk).update(in_cart=False)
+                yield pks
+
+        with mock.patch.object(batch_utils, 'iter_pk_batches', scan_then_uncart):
+            deleted = batch_utils.batch_delete(ShoppingListItem.objects.filter(in_cart=True), sleep_seconds=0, raw=True)
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(list(ShoppingListItem.objects.values_list('name', flat=True)), ['Ese 1'])
+
+
+class CleanupDuplicatesTest(TestCase):
+    """Test the set-based duplicate recurring task cleanup"""
+
+    def setUp(self):
+        """Set up a recurring series with duplicate tasks"""
+        self.parent = User.objects.create_user(
+            username='parent',
+            email='parent@test.com',
+            password='testpass123',
+            role=User.ROLE_PARENT
+        )
+        self.family = Family.objects.create(name='Test Family', owner=self.parent)
+        self.today = timezone.now().date()
+        self.task = Task.objects.create(name='Prügi', family=self.family, created_by=self.parent, due_date=self.today)
+        self.recurrence = TaskRecurrence.objects.create(
+            task=self.task,
+            frequency=TaskRecurrence.FREQUENCY_DAILY,
+            next_occurrence=timezone.now(),
+        )
+
+    def test_duplicates_deleted_and_recurrence_task_kept(self):
+        """Duplicates on the same date are removed, keeping the recurrence's task"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        Task.objects.create(name='Prügi', family=self.family, created_by=self.parent, due_date=self.today)
+        Task.objects.create(name='Prügi', family=self.family, created_by=self.parent, due_date=self.today, completed=True)
+        other = Task.objects.create(name='Nõud', family=self.family, created_by=self.parent, due_date=self.today)
+        Task.objects.create(name='Nõud', family=self.family, created_by=self.parent, due_date=self.today)
+
+        call_command('cleanup_duplicates', '--chunk-size', '1', stdout=StringIO())
+
+        self.assertEqual(list(Task.objects.filter(name='Prügi').values_list('id', flat=True)), [self.task.id])
+        # Not a recurring series, left alone
+        self.assertEqual(Task.objects.filter(name='Nõud').count(), 2)
+        self.assertTrue(Task.objects.filter(pk=other.pk).exists())
+        self.family.refresh_from_db()
+        self.assertEqual(self.family.active_recurrences, 1)
+
+    def test_recurrence_repointed_to_task_on_next_date(self):
+        """A recurrence moves to the series task due on its next occurrence date"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        tomorrow = self.today + timedelta(days=1)
+        next_task = Task.objects.create(name='Prügi', family=self.family, created_by=self.parent, due_date=tomorrow)
+        self.recurrence.next_occurrence = timezone.now() + timedelta(days=1)
+        self.recurrence.save()
+
+        call_command('cleanup_duplicates', stdout=StringIO())
+
+        self.recurrence.refresh_from_db()
+        self.assertEqual(self.recurrence.task_id, next_task.id)
@@ -1,15 +1,16 @@
 # Standard library imports
 import itertools
 import json
+import logging
 import os
-import re
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # Django imports
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
+from django.db.models import F
 from django.http import JsonResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
@@ -19,13 +20,48 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
 # Local application imports
-from a_family.models import Family, User
-from a_family.emails import send_task_completed_notification, send_task_approved_notification
-from a_family.utils import get_family_for_user as _get_family_for_user
-from a_subscription.utils import check_subscription_limit, increment_usage, check_recurring_task_limit
-
+from a_family.models import Family, PointsTransaction, User
+from a_family.emails import (
+    send_task_completed_notification,
+    send_task_approved_notification,
+    send_tasks_approved_notification,
+)
+from a_family.points_utils import add_points, deduct_points
+from a_family.utils import get_request_family
+from a_subscription.utils import check_subscription_limit, check_recurring_task_limit, reserve_quota
+
+from . import state_utils
+from .parsing_utils import parse_task_text
 from .models import Task
 
+logger = logging.getLogger(__name__)
+
+# POST action -> state machine transition (see state_utils)
+TRANSITION_ACTIONS = {
+    "start": state_utils.start_task,
+    "cancel": state_utils.cancel_task,
+    "complete": state_utils.complete_task,
+    "reopen": state_utils.reopen_task,
+    "approve": state_utils.approve_task,
+    "unapprove": state_utils.unapprove_task,
+}
+PARENT_TRANSITIONS = {"reopen", "approve", "unapprove"}
+
+# Action-specific wording for transition results
+TRANSITION_MESSAGE_OVERRIDES = {
+    "cancel": {state_utils.RESULT_NOT_STARTED_BY_USER: "Sa saad tühistada ainult enda alustatud ülesandeid."},
+    "complete": {state_utils.RESULT_NOT_STARTED_BY_USER: "Sa saad täita ainult enda alustatud ülesandeid."},
+    "reopen": {state_utils.RESULT_NOT_COMPLETED: "See ülesanne pole täidetud."},
+}
+
+
+def _parse_version(raw_version):
+    """Parse the task version submitted with a form, None if missing or invalid"""
+    try:
+        return int(raw_version)
+    except (TypeError, ValueError):
+        return None
+
 
 def _ensure_user_role(user, default_role=User.ROLE_CHILD):
     """Ensure user has a role set, defaulting to the provided role if not set"""
@@ -35,173 +71,10 @@ def _ensure_user_role(user, default_role=User.ROLE_CHILD):
     return user
 
 
-def _parse_task_text(text, family):
-    """
-    Parse natural language task text to extract task details.
-    
-    Patterns:
-    - @name or @username - Assign to family member
-    - !low, !medium, !high - Set priority
-    - +50 or +points - Set points value
-    - *daily, *weekly, *monthly - Set recurring frequency
-    - Date keywords: today, tomorrow, next week, Monday, etc.
-    - Date format: ^25.12.2024 (pp.kk.aaaa) for specific dates
-    
-    Returns dict with: name, assigned_to_id, priority, points, due_date, recurring
-    """
-    if not text or not text.strip():
-        return None
-    
-    text = text.strip()
-    parsed = {
-        'name': '',
-        'assigned_to_id': None,
-        'assign_to_all_children': False,  # Flag for creating tasks for all children
-        'priority': Task.PRIORITY_MEDIUM,  # Default to medium
-        'points': 25,  # Default points
-        'due_date': None,
-        'recurring': None,
-    }
-    
-    # Extract @mentions (assignment)
-    mention_pattern = r'@(\w+)'
-    mentions = re.findall(mention_pattern, text, re.IGNORECASE)
-    if mentions:
-        mention_name = mentions[0].lower()
-        # Try to find family member by display name or username
-        # Note: members is a reverse FK, so select_related doesn't apply here
-        # We're just iterating, so this is already efficient
-        family_members = list(family.members.all())
-        if family.owner_id:
-            family_members.append(family.owner)
-        
-        # Handle "kõigile" or "everyone" special case - create task for each child
-        if mention_name in ['kõigile', 'everyone', 'kõik', 'all']:
-            parsed['assign_to_all_children'] = True
-            parsed['assigned_to_id'] = None
-        else:
-            # Try to find family member by display name or username
-            for member in family_members:
-                display_name = member.get_display_name().lower()
-                username = (member.username or '').lower()
-                first_name = (member.first_name or '').lower()
-                
-                if (mention_name in display_name or 
-                    mention_name == username or 
-                    mention_name == first_name):
-                    parsed['assigned_to_id'] = member.id
-                    break
-        
-        # Remove @mentions from text
-        text = re.sub(mention_pattern, '', text, flags=re.IGNORECASE).strip()
-    
-    # Extract priority (!low, !medium, !high)
-    priority_pattern = r'!(low|medium|high|madal|keskmine|kõrge)'
-    priority_match = re.search(priority_pattern, text, re.IGNORECASE)
-    if priority_match:
-        priority_str = priority_match.group(1).lower()
-        if priority_str in ['high', 'kõrge']:
-            parsed['priority'] = Task.PRIORITY_HIGH
-        elif priority_str in ['low', 'madal']:
-            parsed['priority'] = Task.PRIORITY_LOW
-        else:
-            parsed['priority'] = Task.PRIORITY_MEDIUM
-        
-        text = re.sub(priority_pattern, '', text, flags=re.IGNORECASE).strip()
-    
-    # Extract points (+50, +points)
-    points_pattern = r'\+(\d+)'
-    points_match = re.search(points_pattern, text)
-    if points_match:
-        parsed['points'] = int(points_match.group(1))
-        text = re.sub(points_pattern, '', text).strip()
-    
-    # Extract recurring (*daily, *business_daily, *every_other_day, *weekly, *monthly)
-    recurring_pattern = r'\*(daily|business_daily|every_other_day|weekly|monthly|päevaselt|tööpäevaselt|iga_teine_päev|nädalaselt|kuus)'
-    recurring_match = re.search(recurring_pattern, text, re.IGNORECASE)
-    if recurring_match:
-        recurring_str = recurring_match.group(1).lower()
-        if recurring_str in ['daily', 'päevaselt']:
-            parsed['recurring'] = 'daily'
-        elif recurring_str in ['business_daily', 'tööpäevaselt']:
-            parsed['recurring'] = 'business_daily'
-        elif recurring_str in ['every_other_day', 'iga_teine_päev']:
-            parsed['recurring'] = 'every_other_day'
-        elif recurring_str in ['weekly', 'nädalaselt']:
-            parsed['recurring'] = 'weekly'
-        elif recurring_str in ['monthly', 'kuus']:
-            parsed['recurring'] = 'monthly'
-        
-        text = re.sub(recurring_pattern, '', text, flags=re.IGNORECASE).strip()
-    
-    # Extract dates
-    today = timezone.localdate()
-    now = timezone.now()
-    
-    # Specific date format: ^25.12.2024 (Estonian format pp.kk.aaaa)
-    date_format_pattern = r'\^(\d{1,2}\.\d{1,2}\.\d{4})'
-    date_format_match = re.search(date_format_pattern, text)
-    if date_format_match:
-        try:
-            date_str = date_format_match.group(1)
-            # Parse Estonian format (dd.mm.yyyy) to date object
-            from datetime import datetime
-            date_obj = datetime.strptime(date_str, '%d.%m.%Y').date()
-            parsed['due_date'] = date_obj
-            text = re.sub(date_format_pattern, '', text).strip()
-        except (ValueError, TypeError):
-            pass
-    
-    # Date keywords (case-insensitive)
-    date_keywords = {
-        'today': today,
-        'täna': today,
-        'tomorrow': today + timedelta(days=1),
-        'homme': today + timedelta(days=1),
-        'next week': today + timedelta(days=7),
-        'järgmine nädal': today + timedelta(days=7),
-        'next month': today + timedelta(days=30),
-        'järgmine kuu': today + timedelta(days=30),
-    }
-    
-    # Weekday names (Estonian and English)
-    # Monday=0, Tuesday=1, ..., Sunday=6
-    weekdays_est = ['esmaspäev', 'teisipäev', 'kolmapäev', 'neljapäev', 'reede', 'laupäev', 'pühapäev']
-    weekdays_en = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-    weekdays_est_short = ['esmasp', 'teisip', 'kolmap', 'neljap', 'reede', 'laup', 'pühap']
-    
-    for keyword, date_value in date_keywords.items():
-        if keyword.lower() in text.lower():
-            parsed['due_date'] = date_value
-            # Remove keyword from text (case-insensitive)
-            text = re.sub(re.escape(keyword), '', text, flags=re.IGNORECASE).strip()
-            break
-    
-    # Check for weekday names
-    text_lower = text.lower()
-    all_weekdays = weekdays_est + weekdays_en + weekdays_est_short
-    for i, weekday in enumerate(all_weekdays):
-        if weekday in text_lower:
-            # Find next occurrence of this weekday
-            # Map to 0-6 (Monday-Sunday)
-            weekday_index = i % 7
-            days_ahead = weekday_index - today.weekday()
-            if days_ahead <= 0:  # Target day already happened this week
-                days_ahead += 7
-            parsed['due_date'] = today + timedelta(days=days_ahead)
-            text = re.sub(weekday, '', text, flags=re.IGNORECASE).strip()
-            break
-    
-    # Clean up text: remove extra spaces, trim
-    parsed['name'] = ' '.join(text.split())
-    
-    return parsed
-
-
 @login_required
 def index(request):
     user = request.user
-    family = _get_family_for_user(user)
+    family = get_request_family(request)
 
     # Redirect to onboarding if user doesn't have a family
     if not family:
@@ -237,7 +110,7 @@ def index(request):
             # Quick add form uses task_text, modal form uses name
             if task_text:
                 # Parse natural language
-                parsed = _parse_task_text(task_text, family)
+                parsed = parse_task_text(task_text, family)
                 if not parsed or not parsed['name']:
                     messages.error(request, "Palun sisesta ülesande nimi.")
                     return redirect("a_tasks:index")
@@ -287,18 +160,6 @@ def index(request):
                 assign_to_all = assign_to_all_children
                 num_tasks_to_create = len(family_children) if assign_to_all and family_children else 1
                 
-                # Check subscription limit before creating
-                can_create, current_count, limit, tier = check_subscription_limit(family, 'tasks', num_tasks_to_create)
-                if not can_create:
-                    tier_name = "Tasuta" if tier == "FREE" else "Alustaja" if tier == "STARTER" else "Pro"
-                    messages.error(
-                        request,
-                        f"Oled jõudnud oma kuise ülesandepiirini ({limit} ülesannet {tier_name} paketis). "
-                        f"Oled sel kuul loonud {current_count} ülesannet. "
-                        f"Palun uuenda tellimust, et luua rohkem ülesandeid."
-                    )
-                    return redirect("a_tasks:index")
-
                 if not task_text:  # Only parse if from modal form
                     try:
                         priority_value = int(priority)
@@ -313,8 +174,20 @@ def index(request):
                     priority_value = priority
                     # points_value already set from parsed dict
 
-                # Use transaction to ensure task creation and usage increment are atomic
+                # Use transaction to ensure the quota reservation and task creation are atomic
                 with transaction.atomic():
+                    # Reserve quota for every task up front (one conditional UPDATE, no check-then-act race)
+                    granted, current_count, limit, tier = reserve_quota(family, 'tasks', num_tasks_to_create)
+                    if not granted:
+                        tier_name = "Tasuta" if tier == "FREE" else "Alustaja" if tier == "STARTER" else "Pro"
+                        messages.error(
+                            request,
+                            f"Oled jõudnud oma kuise ülesandepiirini ({limit} ülesannet {tier_name} paketis). "
+                            f"Oled sel kuul loonud {current_count} ülesannet. "
+                            f"Palun uuenda tellimust, et luua rohkem ülesandeid."
+                        )
+                        return redirect("a_tasks:index")
+
                     tasks_created = []
                     
                     if assign_to_all and family_children:
@@ -346,7 +219,8 @@ def index(request):
                                             f"Olete jõudnud oma aktiivsete korduvate ülesannete limiidini ({recurring_limit} {tier_name} paketis). "
                                             f"Kõrgendage paketti, et luua rohkem aktiivseid korduvaid ülesandeid."
                                         )
-                                        # Transaction will rollback task creation automatically
+                                        # Roll back the tasks and the quota reservation
+                                        transaction.set_rollback(True)
                                         return redirect("a_tasks:index")
                                 
                                 from .models import TaskRecurrence
@@ -393,6 +267,8 @@ def index(request):
                                 assigned_user = family.owner
                             if not assigned_user and assigned_id:
                                 messages.error(request, "Ülesandeid saab määrata ainult lastele.")
+                                # Release the quota reservation
+                                transaction.set_rollback(True)
                                 return redirect("a_tasks:index")
                         
                         task = Task.objects.create(
@@ -419,7 +295,8 @@ def index(request):
                                     f"Olete jõudnud oma aktiivsete korduvate ülesannete limiidini ({recurring_limit} {tier_name} paketis). "
                                     f"Kõrgendage paketti, et luua rohkem aktiivseid korduvaid ülesandeid."
                                 )
-                                # Transaction will rollback task creation automatically
+                                # Roll back the task and the quota reservation
+                                transaction.set_rollback(True)
                                 return redirect("a_tasks:index")
                             
                             from .models import TaskRecurrence
@@ -457,13 +334,75 @@ def index(request):
                                 next_occurrence=next_occurrence,
                             )
                     
-                    # Increment usage counter for all tasks created (within same transaction)
-                    increment_usage(family, 'tasks', len(tasks_created))
-                    
                     # Show success message
                     if len(tasks_created) > 1:
                         messages.success(request, f"Loodud {len(tasks_created)} ülesannet: '{name}'")
 
+        elif action == "bulk_create" and is_parent:
+            # Bulk quick add: one task per pasted line, created in a single request
+            from _core.text_utils import split_pasted_lines
+            from .bulk_utils import MAX_BULK_LINES, bulk_create_tasks
+
+            lines = split_pasted_lines(request.POST.get("task_lines", ""))
+            if not lines:
+                messages.error(request, "Palun sisesta vähemalt üks ülesanne.")
+                return redirect("a_tasks:index")
+            if len(lines) > MAX_BULK_LINES:
+                messages.error(request, f"Korraga saab lisada kuni {MAX_BULK_LINES} ülesannet.")
+                return redirect("a_tasks:index")
+
+            result = bulk_create_tasks(family, user, lines)
+            limit_error = result['limit_error']
+            if limit_error:
+                tier = limit_error['tier']
+                tier_name = "Tasuta" if tier == "FREE" else "Alustaja" if tier == "STARTER" else "Pro"
+                if limit_error['resource'] == 'tasks':
+                    messages.error(
+                        request,
+                        f"Oled jõudnud oma kuise ülesandepiirini ({limit_error['limit']} ülesannet {tier_name} paketis). "
+                        f"Oled sel kuul loonud {limit_error['current']} ülesannet. "
+                        f"Palun uuenda tellimust, et luua rohkem ülesandeid."
+                    )
+                else:
+                    messages.error(
+                        request,
+                        f"Olete jõudnud oma aktiivsete korduvate ülesannete limiidini ({limit_error['limit']} {tier_name} paketis). "
+                        f"Kõrgendage paketti, et luua rohkem aktiivseid korduvaid ülesandeid."
+                    )
+                return redirect("a_tasks:index")
+
+            if result['created']:
+                messages.success(request, f"Loodud {len(result['created'])} ülesannet.")
+            if result['skipped']:
+                skipped_lines = ", ".join(f"'{line}'" for line, _ in result['skipped'][:5])
+                messages.warning(request, f"{len(result['skipped'])} rida jäeti vahele: {skipped_lines}")
+
+        elif action == "import" and is_parent:
+            # File import (CSV/JSON/NDJSON) of tasks, recurring tasks and rewards
+            from .import_utils import import_family_data, iter_import_rows
+
+            uploaded_file = request.FILES.get("import_file")
+            if not uploaded_file:
+                messages.error(request, "Palun vali imporditav fail.")
+                return redirect("a_tasks:index")
+
+            result = import_family_data(family, user, iter_import_rows(uploaded_file))
+
+            if result['tasks_created'] or result['rewards_created']:
+                messages.success(
+                    request,
+                    f"Imporditud {result['tasks_created']} ülesannet ja {result['rewards_created']} preemiat."
+                )
+            # File-level problems (unreadable file, row limit) have no row number
+            for row, message in result['errors']:
+                if row is None:
+                    messages.error(request, message)
+            row_errors = [(row, message) for row, message in result['errors'] if row is not None]
+            if row_errors:
+                shown = "; ".join(f"rida {row}: {message}" for row, message in row_errors[:5])
+                more = f" (ja veel {len(row_errors) - 5})" if len(row_errors) > 5 else ""
+                messages.warning(request, f"{len(row_errors)} rida jäi importimata: {shown}{more}")
+
         elif action == "update" and is_parent:
             task = _get_task()
             if task:
@@ -531,10 +470,30 @@ def index(request):
                 except (TypeError, ValueError):
                     pass
 
-                update_fields = ["name", "description", "assigned_to", "due_date", "priority", "points"]
+                # Apply the edit only to the version the parent edited (like state_utils
+                # transitions); the bump invalidates in-flight transitions on the old values
+                expected_version = _parse_version(request.POST.get("version"))
+                if expected_version is None:
+                    expected_version = task.version
+                changes = {
+                    "name": task.name,
+                    "description": task.description,
+                    "assigned_to": task.assigned_to,
+                    "due_date": task.due_date,
+                    "priority": task.priority,
+                    "points": task.points,
+                    "updated_at": timezone.now(),
+                }
                 if assignment_changed:
-                    update_fields.append("started_at")
-                task.save(update_fields=update_fields)
+                    changes["started_at"] = None
+                updated = Task.objects.filter(pk=task.pk, version=expected_version).update(
+                    version=F("version") + 1,
+                    **changes
+                )
+                if not updated:
+                    messages.warning(request, state_utils.RESULT_MESSAGES[state_utils.RESULT_CONFLICT])
+                    return redirect("a_tasks:index")
+                task.version = expected_version + 1
                 
                 # Handle recurring tasks
                 from .models import TaskRecurrence
@@ -590,234 +549,177 @@ def index(request):
                         existing_recurrence.next_occurrence = next_occurrence
                         existing_recurrence.save()
                     else:
-                        TaskRecurrence.objects.create(
-                            task=task,
-                            frequency=recurring_frequency,
-                            day_of_week=recurring_day_of_week,
-                            day_of_month=recurring_day_of_month,
-                            end_date=recurring_end_date,
-                            next_occurrence=next_occurrence,
-                        )
+                        # Same transaction as the active recurrence counter update (a_tasks.signals)
+                        with transaction.atomic():
+                            TaskRecurrence.objects.create(
+                                task=task,
+                                frequency=recurring_frequency,
+                                day_of_week=recurring_day_of_week,
+                                day_of_month=recurring_day_of_month,
+                                end_date=recurring_end_date,
+                                next_occurrence=next_occurrence,
+                            )
                 else:
                     # Remove recurrence if it exists
                     if existing_recurrence:
-                        existing_recurrence.delete()
+                        with transaction.atomic():
+                            existing_recurrence.delete()
 
                 if task.approved:
-                    if previous_assigned:
-                        previous_assigned.points = max(0, previous_assigned.points - previous_points)
-                        previous_assigned.save(update_fields=["points"])
                     current_assignee = task.assigned_to or task.completed_by
-                    if current_assignee:
-                        diff = task.points
-                        if previous_assigned and previous_assigned.id == current_assignee.id:
-                            diff = task.points - previous_points
-                        if diff != 0:
-                            current_assignee.points = max(0, current_assignee.points + diff)
-                            current_assignee.save(update_fields=["points"])
+                    adjustments = []  # (user, diff)
+                    if previous_assigned and current_assignee and previous_assigned.id == current_assignee.id:
+                        adjustments.append((current_assignee, task.points - previous_points))
+                    else:
+                        if previous_assigned:
+                            adjustments.append((previous_assigned, -previous_points))
+                        if current_assignee:
+                            adjustments.append((current_assignee, task.points))
+                    for adjusted_user, diff in adjustments:
+                        if diff > 0:
+                            add_points(adjusted_user, diff, PointsTransaction.REASON_ADJUSTMENT,
+                                       family=family, task=task, created_by=user)
+                        elif diff < 0:
+                            deduct_points(adjusted_user, -diff, PointsTransaction.REASON_ADJUSTMENT,
+                                          family=family, task=task, created_by=user)
 
         elif action == "delete" and is_parent:
             task = _get_task()
             if task:
-                # Check if task has recurrence
-                from .models import TaskRecurrence
-                recurrence = TaskRecurrence.objects.filter(task=task).first()
+                # Moving the recurrence and deleting the task (and the counter updates) commit together
+                with transaction.atomic():
+                    # Check if task has recurrence
+                    from .models import TaskRecurrence
+                    recurrence = TaskRecurrence.objects.filter(task=task).first()
                 
-                if recurrence:
-                    # For recurring tasks, preserve the recurrence by creating the next occurrence
-                    # This allows the recurrence to continue creating new tasks
-                    from .recurrence_utils import calculate_next_occurrence
-                    
-                    # Calculate next occurrence
-                    base_due_date = task.due_date if task.due_date else timezone.now().date()
-                    next_due_date, next_occurrence = calculate_next_occurrence(
-                        base_due_date, recurrence.frequency, recurrence.interval,
-                        day_of_week=recurrence.day_of_week,
-                        day_of_month=recurrence.day_of_month
-                    )
+                    if recurrence:
+                        # For recurring tasks, preserve the recurrence by creating the next occurrence
+                        # This allows the recurrence to continue creating new tasks
+                        from .recurrence_utils import calculate_next_occurrence
                     
-                    # Check if recurrence has ended
-                    if recurrence.end_date and next_due_date > recurrence.end_date:
-                        # Recurrence has ended, delete it
-                        recurrence.delete()
-                    else:
-                        # Create the next occurrence task to preserve the recurrence
-                        template_task = Task.objects.create(
-                            name=task.name,
-                            description=task.description,
-                            family=task.family,
-                            assigned_to=task.assigned_to,
-                            created_by=task.created_by,
-                            due_date=next_due_date,
-                            priority=task.priority,
-                            points=task.points,
-                            completed=False,
-                            approved=False,
+                        # Calculate next occurrence
+                        base_due_date = task.due_date if task.due_date else timezone.now().date()
+                        next_due_date, next_occurrence = calculate_next_occurrence(
+                            base_due_date, recurrence.frequency, recurrence.interval,
+                            day_of_week=recurrence.day_of_week,
+                            day_of_month=recurrence.day_of_month
                         )
+                    
+                        # Check if recurrence has ended
+                        if recurrence.end_date and next_due_date > recurrence.end_date:
+                            # Recurrence has ended, delete it
+                            recurrence.delete()
+                        else:
+                            # Create the next occurrence task to preserve the recurrence
+                            template_task = Task.objects.create(
+                                name=task.name,
+                                description=task.description,
+                                family=task.family,
+                                assigned_to=task.assigned_to,
+                                created_by=task.created_by,
+                                due_date=next_due_date,
+                                priority=task.priority,
+                                points=task.points,
+                                completed=False,
+                                approved=False,
+                            )
                         
-                        # Update recurrence to point to the new task
-                        recurrence.task = template_task
-                        recurrence.next_occurrence = next_occurrence
-                        recurrence.save()
+                            # Update recurrence to point to the new task
+                            recurrence.task = template_task
+                            recurrence.next_occurrence = next_occurrence
+                            recurrence.save()
                 
-                # Now delete the original task (recurrence is already moved if it existed)
-                task.delete()
+                    # Now delete the original task (recurrence is already moved if it existed)
+                    task.delete()
 
-        elif action == "start" and is_child:
-            # Use select_for_update to prevent race conditions
-            with transaction.atomic():
-                if not task_id:
-                    messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-                else:
-                    # Lock the task row to prevent race conditions
-                    task = Task.objects.select_for_update().filter(family=family, id=task_id).first()
-                    if not task:
-                        messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-                    elif task.completed:
-                        messages.warning(request, "See ülesanne on juba täidetud.")
-                    elif task.approved:
-                        messages.warning(request, "See ülesanne on juba kinnitatud.")
-                    elif task.is_in_progress:
-                        messages.warning(request, "See ülesanne on juba teise lapse poolt alustatud.")
-                    elif task.assigned_to and task.assigned_to_id != user.id:
-                        messages.warning(request, "See ülesanne on määratud teisele lapsele.")
-                    else:
-                        task.assigned_to = user
-                        task.started_at = timezone.now()
-                        task.save(update_fields=["assigned_to", "started_at"])
-                        messages.success(request, f"Ülesanne '{task.name}' alustatud!")
-
-        elif action == "cancel" and is_child:
-            task = _get_task()
-            if not task:
-                messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-            elif task.completed:
-                messages.warning(request, "See ülesanne on juba täidetud.")
-            elif not task.is_in_progress or task.assigned_to_id != user.id:
-                messages.warning(request, "Sa saad tühistada ainult enda alustatud ülesandeid.")
-            else:
-                task.assigned_to = None
-                task.started_at = None
-                task.save(update_fields=["assigned_to", "started_at"])
-                messages.success(request, f"Ülesanne '{task.name}' tühistatud.")
+        elif action in ("bulk_approve", "bulk_reject") and is_parent:
+            selected_ids = []
+            for raw_id in request.POST.getlist("task_ids"):
+                try:
+                    selected_ids.append(int(raw_id))
+                except (TypeError, ValueError):
+                    continue
 
-        elif action == "complete" and is_child:
-            task = _get_task()
-            if not task:
-                messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-            elif task.completed:
-                messages.warning(request, "See ülesanne on juba täidetud.")
-            elif not task.is_in_progress or task.assigned_to_id != user.id:
-                messages.warning(request, "Sa saad täita ainult enda alustatud ülesandeid.")
-            else:
-                task.completed = True
-                task.completed_by = user
-                task.completed_at = timezone.now()
-                task.approved = False
-                task.approved_by = None
-                task.approved_at = None
-                # Keep started_at for history, but task is no longer in progress
-                task.save(update_fields=["completed", "completed_by", "completed_at", "approved", "approved_by", "approved_at"])
-                # Send notification email
+            if not selected_ids:
+                messages.warning(request, "Vali vähemalt üks ülesanne.")
+            elif action == "bulk_approve":
                 try:
-                    send_task_completed_notification(request, task)
+                    approved_by_assignee, skipped_ids = state_utils.bulk_approve_tasks(family, selected_ids, user)
                 except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Failed to send task completed notification: {e}", exc_info=True)
+                    logger.error(f"Bulk approve failed for family {family.id}: {e}", exc_info=True)
+                    approved_by_assignee, skipped_ids = None, []
 
-        elif action == "reopen" and is_parent:
-            task = _get_task()
-            if not task:
-                messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-            elif not task.completed:
-                messages.warning(request, "See ülesanne pole täidetud.")
+                if approved_by_assignee is None:
+                    messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
+                else:
+                    approved_count = sum(len(tasks) for tasks in approved_by_assignee.values())
+                    total_points = sum(task.points for tasks in approved_by_assignee.values() for task in tasks)
+                    if approved_count:
+                        messages.success(request, f"Kinnitatud {approved_count} ülesannet. {total_points} punkti lisatud.")
+                    if skipped_ids:
+                        messages.warning(request, f"{len(skipped_ids)} ülesannet jäeti vahele, sest neid muudeti vahepeal või need pole kinnitamiseks valmis.")
+
+                    # One summary notification per child
+                    for assignee, tasks in approved_by_assignee.items():
+                        try:
+                            send_tasks_approved_notification(request, assignee, tasks)
+                        except Exception as e:
+                            logger.warning(f"Failed to send tasks approved notification: {e}", exc_info=True)
             else:
-                # Use transaction to ensure atomicity
                 try:
-                    with transaction.atomic():
-                        if task.approved:
-                            assignee = task.assigned_to or task.completed_by
-                            if assignee:
-                                # Refresh assignee from DB to avoid race conditions
-                                assignee = User.objects.select_for_update().get(id=assignee.id)
-                                assignee.points = max(0, assignee.points - task.points)
-                                assignee.save(update_fields=["points"])
-                        
-                        task.completed = False
-                        task.completed_by = None
-                        task.completed_at = None
-                        task.approved = False
-                        task.approved_by = None
-                        task.approved_at = None
-                        task.started_at = None
-                        task.assigned_to = None
-                        task.save(update_fields=["completed", "completed_by", "completed_at", "approved", "approved_by", "approved_at", "started_at", "assigned_to"])
-                        messages.success(request, f"Ülesanne '{task.name}' avatud uuesti.")
+                    rejected_tasks, skipped_ids = state_utils.bulk_reject_tasks(family, selected_ids, user)
                 except Exception as e:
-                    messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
+                    logger.error(f"Bulk reject failed for family {family.id}: {e}", exc_info=True)
+                    rejected_tasks, skipped_ids = None, []
 
-        elif action == "approve" and is_parent:
-            task = _get_task()
-            if not task:
+                if rejected_tasks is None:
+                    messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
+                else:
+                    if rejected_tasks:
+                        messages.success(request, f"{len(rejected_tasks)} ülesannet saadeti tagasi.")
+                    if skipped_ids:
+                        messages.warning(request, f"{len(skipped_ids)} ülesannet jäeti vahele, sest neid muudeti vahepeal või need pole ülevaatamiseks valmis.")
+
+        elif action in TRANSITION_ACTIONS and (is_parent if action in PARENT_TRANSITIONS else is_child):
+            # State changes go through the optimistic state machine (state_utils)
+            transition = TRANSITION_ACTIONS[action]
+            if not task_id:
                 messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-            elif not task.completed:
-                messages.error(request, "Saab kinnitada ainult täidetud ülesandeid.")
-            elif task.approved:
-                messages.warning(request, "See ülesanne on juba kinnitatud.")
             else:
-                # Use transaction to ensure atomicity
                 try:
-                    with transaction.atomic():
-                        assignee = task.assigned_to or task.completed_by
-                        if not assignee:
-                            messages.error(request, "Ülesandel pole määratud täitjat.")
-                        else:
-                            # Refresh assignee from DB to avoid race conditions
-                            assignee = User.objects.select_for_update().get(id=assignee.id)
-                            
-                            task.approved = True
-                            task.approved_by = user
-                            task.approved_at = timezone.now()
-                            task.save(update_fields=["approved", "approved_by", "approved_at"])
-
-                            assignee.points += task.points
-                            assignee.save(update_fields=["points"])
-                            messages.success(request, f"Ülesanne '{task.name}' kinnitatud. {task.points} punkti lisatud.")
-                            
-                            # Send notification email
-                            try:
-                                send_task_approved_notification(request, task)
-                            except Exception as e:
-                                import logging
-                                logger = logging.getLogger(__name__)
-                                logger.warning(f"Failed to send task approved notification: {e}", exc_info=True)
+                    result, task = transition(
+                        family, task_id, user,
+                        expected_version=_parse_version(request.POST.get("version")),
+                    )
                 except Exception as e:
-                    messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
+                    logger.error(f"Task transition '{action}' failed for task {task_id}: {e}", exc_info=True)
+                    result, task = None, None
 
-        elif action == "unapprove" and is_parent:
-            task = _get_task()
-            if not task:
-                messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
-            elif not task.approved:
-                messages.warning(request, "See ülesanne pole kinnitatud.")
-            else:
-                # Use transaction to ensure atomicity
-                try:
-                    with transaction.atomic():
-                        assignee = task.assigned_to or task.completed_by
-                        if assignee:
-                            # Refresh assignee from DB to avoid race conditions
-                            assignee = User.objects.select_for_update().get(id=assignee.id)
-                            assignee.points = max(0, assignee.points - task.points)
-                            assignee.save(update_fields=["points"])
-
-                        task.approved = False
-                        task.approved_by = None
-                        task.approved_at = None
-                        task.save(update_fields=["approved", "approved_by", "approved_at"])
+                if result == state_utils.RESULT_OK:
+                    if action == "start":
+                        messages.success(request, f"Ülesanne '{task.name}' alustatud!")
+                    elif action == "cancel":
+                        messages.success(request, f"Ülesanne '{task.name}' tühistatud.")
+                    elif action == "reopen":
+                        messages.success(request, f"Ülesanne '{task.name}' avatud uuesti.")
+                    elif action == "approve":
+                        messages.success(request, f"Ülesanne '{task.name}' kinnitatud. {task.points} punkti lisatud.")
+                    elif action == "unapprove":
                         messages.success(request, f"Ülesande '{task.name}' kinnitamine tühistatud.")
-                except Exception as e:
+
+                    # Send notification email
+                    try:
+                        if action == "complete":
+                            send_task_completed_notification(request, task)
+                        elif action == "approve":
+                            send_task_approved_notification(request, task)
+                    except Exception as e:
+                        logger.warning(f"Failed to send task {action} notification: {e}", exc_info=True)
+                elif result in TRANSITION_MESSAGE_OVERRIDES.get(action, {}):
+                    messages.warning(request, TRANSITION_MESSAGE_OVERRIDES[action][result])
+                elif result in state_utils.RESULT_MESSAGES:
+                    messages.warning(request, state_utils.RESULT_MESSAGES[result])
+                else:
                     messages.error(request, f"Midagi läks valesti. Kui probleem püsib, palun võta ühendust tugiteenusega: {settings.SUPPORT_EMAIL}")
 
         return redirect("a_tasks:index")